@@ -0,0 +1,138 @@
+"""
+КЭШ ОТВЕТОВ AI — локальная SQLite-таблица с TTL и вытеснением LRU
+
+Ключ — нормализованный вопрос + числовые значения из user_data
+(«Что означает число 7?» и «что означает число 7» — один ключ).
+Хранится в отдельном файле (по умолчанию data/ai_cache.db), чтобы
+база знаний оставалась только для чтения.
+
+Пример:
+  cache = AnswerCache()
+  key = cache.key("Что означает число 7?", {"life_path": {"value": 7}})
+  cache.get(key) or cache.put(key, question, answer)
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DATA_DIR = Path(__file__).parent / "data"
+
+AI_CACHE_PATH = Path(os.getenv("AI_CACHE_PATH", str(DATA_DIR / "ai_cache.db")))
+AI_CACHE_TTL  = int(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+AI_CACHE_MAX  = int(os.getenv("AI_CACHE_MAX", "5000"))
+
+_PUNCT = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    q = question.lower().replace("ё", "е")
+    q = _PUNCT.sub(" ", q)
+    return _SPACE.sub(" ", q).strip()
+
+
+def profile_numbers(user_data: Optional[dict]) -> Dict[str, int]:
+    """Числа из user_data: {"life_path": {"value": 7}} → {"life_path": 7}"""
+    out = {}
+    for key, val in (user_data or {}).items():
+        if isinstance(val, dict):
+            val = val.get("value")
+        if isinstance(val, bool):
+            continue
+        if isinstance(val, (int, float)):
+            out[str(key)] = val
+    return out
+
+
+class AnswerCache:
+    """Кэш ответов AI в SQLite (TTL + LRU), потокобезопасный"""
+
+    def __init__(self, path: Path = AI_CACHE_PATH, ttl: int = AI_CACHE_TTL,
+                 max_entries: int = AI_CACHE_MAX):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS ai_answers (
+                key        TEXT PRIMARY KEY,
+                question   TEXT NOT NULL,
+                answer     TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used  REAL NOT NULL,
+                hits       INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ai_answers_last_used ON ai_answers(last_used);
+        """)
+
+    @staticmethod
+    def key(question: str, user_data: Optional[dict] = None) -> str:
+        raw = json.dumps([normalize_question(question), sorted(profile_numbers(user_data).items())],
+                         ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT answer, created_at FROM ai_answers WHERE key=?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM ai_answers WHERE key=?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute(
+                "UPDATE ai_answers SET last_used=?, hits=hits+1 WHERE key=?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, question: str, answer: Dict):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ai_answers (key, question, answer, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, question, json.dumps(answer, ensure_ascii=False), now, now))
+            # LRU: оставляем max_entries самых свежих по last_used
+            self.conn.execute("""
+                DELETE FROM ai_answers WHERE key IN (
+                    SELECT key FROM ai_answers ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM ai_answers")
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM ai_answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
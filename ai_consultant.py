@@ -1,6 +1,7 @@
 """
 AI КОНСУЛЬТАНТ — бесплатный AI через Gemini Flash (primary) и Groq (fallback)
-RAG: контекст из базы знаний SQLite + JSON
+RAG: контекст из базы знаний SQLite + JSON — лучшие фрагменты документов
+(индекс passages.py) в пределах бюджета RAG_CONTEXT_TOKENS
 
 Бесплатные API:
   - Google Gemini Flash: 15 RPM, 1M токенов/день (бесплатно)
@@ -9,14 +10,36 @@ RAG: контекст из базы знаний SQLite + JSON
     Получить ключ: https://console.groq.com/
 
 Установка:
-  pip install google-generativeai groq
+  pip install google-generativeai groq httpx
+
+Асинхронный режим (ask_async) ходит в REST API провайдеров через
+долгоживущие httpx.AsyncClient (пул соединений на провайдера), с таймаутом
+на вызов и семафором, ограничивающим число одновременных запросов к LLM.
+Лимиты бесплатных тарифов соблюдает AIScheduler (ai_scheduler.py): запрос
+ждёт в очереди и уходит тому провайдеру, у которого есть запас.
+ask_stream отдаёт ответ по частям по мере генерации (SSE провайдеров).
 """
 
+import asyncio
 import json
-import sqlite3
 import os
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
+
+from ai_cache import AnswerCache
+from ai_scheduler import AIScheduler, PRIORITIES, PRIORITY_INTERACTIVE, RateLimited
+from data_registry import DataRegistry, get_registry
+from db_pool import ReadOnlyPool
+from fuzzy import fuzzy_match_query, has_index as has_fuzzy
+from passages import (CHARS_PER_TOKEN, RAG_CONTEXT_TOKENS, get_passages, has_index,
+                      search_passages, select_passages)
+from text_search import match_query
+from vectors import rrf
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 try:
     from dotenv import load_dotenv
@@ -26,6 +49,22 @@ except ImportError:
 
 DATA_DIR = Path(__file__).parent / "data"
 
+AI_TIMEOUT         = float(os.getenv("AI_TIMEOUT", "30"))
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_CACHE           = os.getenv("AI_CACHE", "1").lower() in ("1", "true", "yes", "on")
+
+GEMINI_MODEL = "gemini-2.0-flash"
+GROQ_MODEL   = "llama-3.1-8b-instant"
+MAX_TOKENS   = 1500
+
+# Подпись провайдера в ответе
+PROVIDER_LABELS = {"gemini": GEMINI_MODEL, "groq": "groq-llama-3.1-8b"}
+
+SYSTEM_PROMPT = """Ты — AI-консультант по нумерологии и ансестологии (работа с родом).
+Отвечай на русском языке. Используй предоставленный контекст из базы знаний.
+Давай глубокие, содержательные ответы с практическими рекомендациями.
+Если информации недостаточно — скажи об этом честно."""
+
 # ── Проверка доступных AI провайдеров ──────────────────────────────
 def get_ai_provider():
     """Определить доступный AI провайдер (приоритет: Gemini → Groq → Local)"""
@@ -56,77 +95,122 @@ def get_ai_provider():
 class AIConsultant:
     """AI Консультант на основе базы знаний — без платных API"""
     
-    def __init__(self, data_dir: str = None):
+    def __init__(self, data_dir: str = None, pool: ReadOnlyPool = None,
+                 timeout: float = AI_TIMEOUT, max_concurrency: int = AI_MAX_CONCURRENCY,
+                 cache: Optional[AnswerCache] = None,
+                 scheduler: Optional[AIScheduler] = None,
+                 context_tokens: int = RAG_CONTEXT_TOKENS,
+                 vectors=None, registry: Optional[DataRegistry] = None):
         if data_dir is None:
             self.data_dir = DATA_DIR
         else:
             self.data_dir = Path(data_dir)
         
-        # SQLite для полнотекстового поиска
+        # SQLite для полнотекстового поиска (общий read-only пул, если передан)
         db_path = self.data_dir / "knowledge_base.db"
-        self.conn = None
-        if db_path.exists():
-            self.conn = sqlite3.connect(str(db_path))
-            self.conn.row_factory = sqlite3.Row
+        self.pool = pool
+        if self.pool is None and db_path.exists():
+            self.pool = ReadOnlyPool(db_path)
         
-        # JSON данные
-        self._load_knowledge()
+        self.context_tokens = context_tokens
+        # Векторы фрагментов (vectors.VectorIndex) — сливаются с bm25 через RRF
+        self.vectors = vectors
+
+        # Формулы и значения чисел — общий реестр справочных данных
+        self.registry = registry or get_registry(self.data_dir)
         
         # AI провайдер
         self.provider_name, self.provider = get_ai_provider()
 
-    def _load_knowledge(self):
-        """Загрузить знания из JSON"""
-        def load(name):
-            p = self.data_dir / name
-            if not p.exists():
-                return {}
-            with open(p, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        
-        self.formulas = load("formulas.json")
-        self.practices = load("practices.json")
-        self.number_meanings = load("number_meanings.json")
-        # Если number_meanings — список, конвертируем в dict
-        if isinstance(self.number_meanings, list):
-            self.number_meanings = {str(item.get('value','')): item for item in self.number_meanings}
+        # Асинхронный режим: HTTP-клиенты создаются при первом запросе
+        self.timeout = timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._clients: Dict[str, "httpx.AsyncClient"] = {}
+        self.scheduler = scheduler or AIScheduler.from_env()
+
+        # Кэш ответов (отдельный SQLite-файл); AI_CACHE=0 — выключить
+        self.cache = cache
+        if self.cache is None and AI_CACHE:
+            try:
+                self.cache = AnswerCache()
+            except Exception as e:
+                print(f"⚠ Кэш ответов AI недоступен: {e}")
+
+    @property
+    def formulas(self) -> List[Dict]:
+        return self.registry.current.formulas
+
+    @property
+    def practices(self) -> List[Dict]:
+        return self.registry.current.practices
+
+    @property
+    def number_meanings(self) -> Dict[str, Dict]:
+        return self.registry.current.number_meanings
 
     # ── Поиск в базе ────────────────────────────────────────────────
     def search_docs(self, query: str, limit: int = 5) -> List[Dict]:
-        """Поиск по SQLite (FTS5 если есть, иначе LIKE)"""
-        if not self.conn:
+        """Поиск документов по SQLite FTS5 (любое из слов вопроса, со стеммингом)"""
+        match = match_query(query, mode="any")
+        if not self.pool or not match:
             return []
         try:
-            cur = self.conn.cursor()
-            # Попытка FTS5
-            try:
-                cur.execute("""
+            with self.pool.connection() as conn:
+                rows = conn.execute("""
                     SELECT d.title, d.content
                     FROM documents_fts f
                     JOIN documents d ON f.rowid = d.id
                     WHERE f MATCH ? ORDER BY rank LIMIT ?
-                """, (query, limit))
-            except Exception:
-                # Fallback LIKE
-                cur.execute("""
-                    SELECT title, content FROM documents
-                    WHERE content LIKE ? OR title LIKE ? LIMIT ?
-                """, (f"%{query}%", f"%{query}%", limit))
-            rows = cur.fetchall()
+                """, (match, limit)).fetchall()
             return [{"title": r[0], "content": r[1] or ""} for r in rows]
-        except Exception as e:
+        except Exception:
+            return []
+
+    def search_excerpts(self, query: str) -> List[Dict]:
+        """Лучшие отрывки документов в пределах бюджета context_tokens:
+        [{"doc_id", "title", "excerpts": [текст, ...]}]
+
+        Фрагменты из FTS (bm25) и, если есть self.vectors, из векторного
+        поиска сливаются через RRF — в контекст попадают и куски без
+        точного совпадения слов."""
+        if not self.pool:
             return []
+        try:
+            with self.pool.connection() as conn:
+                indexed = has_index(conn)
+                hits = search_passages(conn, query) if indexed else []
+                if indexed and not hits and has_fuzzy(conn):
+                    # Ничего точного — пробуем слова с опечатками
+                    hits = search_passages(conn, query, match=fuzzy_match_query(conn, query))
+                if indexed and self.vectors is not None:
+                    vec_ids = [pid for pid, _, _ in self.vectors.search(query)]
+                    fused = rrf([p["id"] for p in hits], vec_ids)
+                    known = {p["id"]: p for p in hits}
+                    known.update((p["id"], p) for p in get_passages(
+                        conn, [pid for pid in vec_ids if pid not in known]))
+                    hits = [known[pid] for pid in sorted(fused, key=fused.get, reverse=True)
+                            if pid in known]
+        except Exception:
+            return []
+        if indexed:
+            return select_passages(hits, self.context_tokens)
+        # База без индекса фрагментов — начала документов, поровну на каждый
+        docs = self.search_docs(query)
+        share = self.context_tokens * CHARS_PER_TOKEN // max(1, len(docs))
+        return [{"doc_id": None, "title": d["title"], "excerpts": [d["content"][:share]]}
+                for d in docs]
 
     def build_context(self, query: str, user_data: dict = None) -> str:
         """Собрать контекст из базы знаний для ответа AI"""
         parts = []
         
-        # 1. Релевантные документы
-        docs = self.search_docs(query)
+        # 1. Релевантные фрагменты документов
+        docs = self.search_excerpts(query)
         if docs:
             parts.append("📚 МАТЕРИАЛЫ ИЗ БАЗЫ ЗНАНИЙ:")
             for i, doc in enumerate(docs, 1):
-                parts.append(f"{i}. {doc['title']}: {doc['content']}...")
+                parts.append(f"{i}. {doc['title']}:\n" + "\n[…]\n".join(doc["excerpts"]))
         
         # 2. Данные пользователя (числа расчётов)
         if user_data:
@@ -151,19 +235,30 @@ class AIConsultant:
         return "\n".join(parts) if parts else "База знаний по запросу не вернула результатов."
 
     # ── Вызов AI ────────────────────────────────────────────────────
+    def _cache_get(self, question: str, user_data: dict = None) -> Optional[dict]:
+        if not self.cache:
+            return None
+        hit = self.cache.get(self.cache.key(question, user_data))
+        return {**hit, "cached": True} if hit else None
+
+    def _cache_put(self, question: str, user_data: dict, result: dict):
+        # Кэшируем только удачные ответы LLM (локальный ответ и так дешёвый)
+        if self.cache and result.get("status") == "ok" and result.get("provider") != "local-kb":
+            self.cache.put(self.cache.key(question, user_data), question, result)
+
     def ask(self, question: str, user_data: dict = None) -> dict:
-        """Получить ответ AI на основе базы знаний"""
-        context = self.build_context(question, user_data)
-        
-        system = """Ты — AI-консультант по нумерологии и ансестологии (работа с родом).
-Отвечай на русском языке. Используй предоставленный контекст из базы знаний.
-Давай глубокие, содержательные ответы с практическими рекомендациями.
-Если информации недостаточно — скажи об этом честно."""
-        
-        user_msg = f"""Контекст из базы знаний:
-{context}
+        """Получить ответ AI на основе базы знаний (с кэшем ответов)"""
+        cached = self._cache_get(question, user_data)
+        if cached:
+            return cached
+        result = self._ask_uncached(question, user_data)
+        self._cache_put(question, user_data, result)
+        return result
 
-Вопрос: {question}"""
+    def _ask_uncached(self, question: str, user_data: dict = None) -> dict:
+        context = self.build_context(question, user_data)
+        system = SYSTEM_PROMPT
+        user_msg = self._user_message(question, context)
 
         # Gemini
         if self.provider_name == "gemini":
@@ -176,11 +271,18 @@ class AIConsultant:
         # Local fallback
         return self._local_answer(question, context)
 
+    @staticmethod
+    def _user_message(question: str, context: str) -> str:
+        return f"""Контекст из базы знаний:
+{context}
+
+Вопрос: {question}"""
+
     def _ask_gemini(self, system: str, user_msg: str) -> dict:
         try:
             import google.generativeai as genai
             model = genai.GenerativeModel(
-                "gemini-2.0-flash",
+                GEMINI_MODEL,
                 system_instruction=system
             )
             resp = model.generate_content(user_msg)
@@ -190,27 +292,25 @@ class AIConsultant:
                 "status": "ok"
             }
         except Exception as e:
-            # Автоматический fallback на Groq если Gemini недоступен
+            # Fallback на Groq только для этого вызова — следующий снова идёт в Gemini
             groq_key = os.getenv("GROQ_API_KEY")
             if groq_key:
                 try:
                     from groq import Groq
-                    self.provider = Groq(api_key=groq_key)
-                    self.provider_name = "groq"
-                    return self._ask_groq(system, user_msg)
+                    return self._ask_groq(system, user_msg, Groq(api_key=groq_key))
                 except Exception:
                     pass
             return {"answer": f"Ошибка Gemini: {e}", "provider": "gemini", "status": "error"}
 
-    def _ask_groq(self, system: str, user_msg: str) -> dict:
+    def _ask_groq(self, system: str, user_msg: str, client=None) -> dict:
         try:
-            resp = self.provider.chat.completions.create(
-                model="llama-3.1-8b-instant",
+            resp = (client or self.provider).chat.completions.create(
+                model=GROQ_MODEL,
                 messages=[
                     {"role": "system", "content": system},
                     {"role": "user", "content": user_msg}
                 ],
-                max_tokens=1500,
+                max_tokens=MAX_TOKENS,
                 temperature=0.7
             )
             return {
@@ -236,3 +336,274 @@ class AIConsultant:
                 "и добавьте GEMINI_API_KEY в .env"
             )
         return {"answer": answer, "provider": "local-kb", "status": "ok"}
+
+    # ── Асинхронный вызов AI ────────────────────────────────────────
+    def available_providers(self) -> List[str]:
+        """Провайдеры с заданным ключом в порядке приоритета"""
+        out = []
+        if os.getenv("GEMINI_API_KEY"):
+            out.append("gemini")
+        if os.getenv("GROQ_API_KEY"):
+            out.append("groq")
+        return out
+
+    def active_provider(self) -> str:
+        """Провайдер, которым ответит ask_async"""
+        if httpx is None:
+            return self.provider_name
+        providers = self.available_providers()
+        return providers[0] if providers else "local"
+
+    def _client(self, provider: str) -> "httpx.AsyncClient":
+        """Долгоживущий HTTP-клиент провайдера (keep-alive пул соединений)"""
+        client = self._clients.get(provider)
+        if client is None:
+            base = {"gemini": "https://generativelanguage.googleapis.com",
+                    "groq":   "https://api.groq.com"}[provider]
+            client = httpx.AsyncClient(
+                base_url=base,
+                timeout=httpx.Timeout(self.timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+            self._clients[provider] = client
+        return client
+
+    async def _gemini_async(self, system: str, user_msg: str):
+        resp = await self._client("gemini").post(
+            f"/v1beta/models/{GEMINI_MODEL}:generateContent",
+            params={"key": os.getenv("GEMINI_API_KEY")},
+            json={
+                "system_instruction": {"parts": [{"text": system}]},
+                "contents": [{"role": "user", "parts": [{"text": user_msg}]}],
+            },
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        parts = data["candidates"][0]["content"]["parts"]
+        used = data.get("usageMetadata", {}).get("totalTokenCount")
+        return {"answer": "".join(p.get("text", "") for p in parts),
+                "provider": PROVIDER_LABELS["gemini"], "status": "ok"}, used
+
+    async def _groq_async(self, system: str, user_msg: str):
+        resp = await self._client("groq").post(
+            "/openai/v1/chat/completions",
+            headers={"Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}"},
+            json={
+                "model": GROQ_MODEL,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user_msg},
+                ],
+                "max_tokens": MAX_TOKENS,
+                "temperature": 0.7,
+            },
+        )
+        resp.raise_for_status()
+        data = resp.json()
+        used = data.get("usage", {}).get("total_tokens")
+        return {"answer": data["choices"][0]["message"]["content"],
+                "provider": PROVIDER_LABELS["groq"], "status": "ok"}, used
+
+    @staticmethod
+    async def _sse_data(resp) -> AsyncIterator[dict]:
+        """JSON из строк «data: ...» потока Server-Sent Events"""
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                return
+            if payload:
+                yield json.loads(payload)
+
+    async def _gemini_stream(self, system: str, user_msg: str, usage: dict) -> AsyncIterator[str]:
+        async with self._client("gemini").stream(
+            "POST", f"/v1beta/models/{GEMINI_MODEL}:streamGenerateContent",
+            params={"key": os.getenv("GEMINI_API_KEY"), "alt": "sse"},
+            json={
+                "system_instruction": {"parts": [{"text": system}]},
+                "contents": [{"role": "user", "parts": [{"text": user_msg}]}],
+            },
+        ) as resp:
+            resp.raise_for_status()
+            async for data in self._sse_data(resp):
+                if "usageMetadata" in data:
+                    usage["tokens"] = data["usageMetadata"].get("totalTokenCount")
+                for cand in data.get("candidates", [])[:1]:
+                    for part in cand.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+
+    async def _groq_stream(self, system: str, user_msg: str, usage: dict) -> AsyncIterator[str]:
+        async with self._client("groq").stream(
+            "POST", "/openai/v1/chat/completions",
+            headers={"Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}"},
+            json={
+                "model": GROQ_MODEL,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user_msg},
+                ],
+                "max_tokens": MAX_TOKENS,
+                "temperature": 0.7,
+                "stream": True,
+            },
+        ) as resp:
+            resp.raise_for_status()
+            async for data in self._sse_data(resp):
+                stats = data.get("x_groq", {}).get("usage") or data.get("usage")
+                if stats:
+                    usage["tokens"] = stats.get("total_tokens")
+                for choice in data.get("choices", [])[:1]:
+                    text = choice.get("delta", {}).get("content")
+                    if text:
+                        yield text
+
+    @staticmethod
+    def estimate_tokens(system: str, user_msg: str) -> int:
+        """Грубая оценка токенов запроса (≈4 символа на токен) + запас на ответ"""
+        return (len(system) + len(user_msg)) // 4 + MAX_TOKENS
+
+    @staticmethod
+    def _retry_after(exc: Exception) -> Optional[float]:
+        """Секунды паузы, если провайдер ответил 429 (None — другая ошибка)"""
+        resp = getattr(exc, "response", None)
+        if resp is None or resp.status_code != 429:
+            return None
+        try:
+            return float(resp.headers.get("retry-after", 60))
+        except ValueError:
+            return 60.0
+
+    async def ask_async(self, question: str, user_data: dict = None,
+                        priority: str = "interactive") -> dict:
+        """Асинхронный ask: не блокирует event loop.
+
+        Контекст собирается в потоке (SQLite), запрос к LLM идёт через общий
+        httpx-клиент с таймаутом; одновременно — не больше max_concurrency
+        вызовов. Провайдера выбирает планировщик по лимитам (priority:
+        "interactive" обслуживается раньше "batch"); при ошибке пробуется
+        следующий, без переключения всего экземпляра."""
+        cached = await asyncio.to_thread(self._cache_get, question, user_data)
+        if cached:
+            return cached
+        result = await self._ask_async_uncached(
+            question, user_data, PRIORITIES.get(priority, PRIORITY_INTERACTIVE))
+        await asyncio.to_thread(self._cache_put, question, user_data, result)
+        return result
+
+    async def _ask_async_uncached(self, question: str, user_data: dict = None,
+                                  priority: int = PRIORITY_INTERACTIVE) -> dict:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        context = await asyncio.to_thread(self.build_context, question, user_data)
+
+        if httpx is None:
+            # Нет httpx — синхронные SDK в отдельном потоке
+            async with self._semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        asyncio.to_thread(self._ask_uncached, question, user_data), self.timeout)
+                except asyncio.TimeoutError:
+                    return {"answer": f"AI не ответил за {self.timeout:.0f} с",
+                            "provider": self.provider_name, "status": "error"}
+
+        providers = self.available_providers()
+        if not providers:
+            return self._local_answer(question, context)
+
+        user_msg = self._user_message(question, context)
+        est = self.estimate_tokens(SYSTEM_PROMPT, user_msg)
+        calls = {"gemini": self._gemini_async, "groq": self._groq_async}
+        errors = []
+        while providers:
+            try:
+                name = await self.scheduler.acquire(providers, est, priority)
+            except RateLimited as e:
+                errors.append(str(e))
+                break
+            providers = [p for p in providers if p != name]
+            async with self._semaphore:
+                try:
+                    result, used = await asyncio.wait_for(
+                        calls[name](SYSTEM_PROMPT, user_msg), self.timeout)
+                    self.scheduler.record(name, est, used)
+                    return result
+                except asyncio.TimeoutError:
+                    errors.append(f"{name}: таймаут {self.timeout:.0f} с")
+                except Exception as e:
+                    retry = self._retry_after(e)
+                    if retry is not None:
+                        self.scheduler.penalize(name, retry)
+                    errors.append(f"{name}: {e}")
+        return {"answer": "Ошибка AI: " + "; ".join(errors),
+                "provider": self.available_providers()[0], "status": "error"}
+
+    async def ask_stream(self, question: str, user_data: dict = None,
+                         priority: str = "interactive") -> AsyncIterator[dict]:
+        """Ответ по частям: {"delta": текст}, …, в конце {"done": True, "provider", "status"}.
+
+        Провайдер выбирается так же, как в ask_async; следующий пробуется,
+        только пока клиенту ещё ничего не отдано. Без httpx, без ключей
+        и при попадании в кэш ответ приходит одним куском."""
+        prio = PRIORITIES.get(priority, PRIORITY_INTERACTIVE)
+        result = await asyncio.to_thread(self._cache_get, question, user_data)
+        if result is None and (httpx is None or not self.available_providers()):
+            result = await self._ask_async_uncached(question, user_data, prio)
+            await asyncio.to_thread(self._cache_put, question, user_data, result)
+        if result is not None:
+            yield {"delta": result["answer"]}
+            yield {"done": True, "provider": result.get("provider"),
+                   "status": result.get("status"), "cached": result.get("cached", False)}
+            return
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        context = await asyncio.to_thread(self.build_context, question, user_data)
+        user_msg = self._user_message(question, context)
+        est = self.estimate_tokens(SYSTEM_PROMPT, user_msg)
+        streams = {"gemini": self._gemini_stream, "groq": self._groq_stream}
+        providers = self.available_providers()
+        errors = []
+        while providers:
+            try:
+                name = await self.scheduler.acquire(providers, est, prio)
+            except RateLimited as e:
+                errors.append(str(e))
+                break
+            providers = [p for p in providers if p != name]
+            parts, usage = [], {}
+            async with self._semaphore:
+                try:
+                    async for text in streams[name](SYSTEM_PROMPT, user_msg, usage):
+                        parts.append(text)
+                        yield {"delta": text}
+                except Exception as e:
+                    retry = self._retry_after(e)
+                    if retry is not None:
+                        self.scheduler.penalize(name, retry)
+                    if parts:
+                        # Начало ответа уже у клиента — подменить провайдера нельзя
+                        yield {"done": True, "provider": PROVIDER_LABELS[name],
+                               "status": "error", "error": str(e)}
+                        return
+                    errors.append(f"{name}: {e}")
+                    continue
+            self.scheduler.record(name, est, usage.get("tokens"))
+            result = {"answer": "".join(parts), "provider": PROVIDER_LABELS[name], "status": "ok"}
+            await asyncio.to_thread(self._cache_put, question, user_data, result)
+            yield {"done": True, "provider": result["provider"], "status": "ok", "cached": False}
+            return
+
+        yield {"delta": "Ошибка AI: " + "; ".join(errors)}
+        yield {"done": True, "provider": self.available_providers()[0], "status": "error"}
+
+    async def aclose(self):
+        """Закрыть HTTP-клиенты и кэш (при остановке приложения)"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
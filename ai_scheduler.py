@@ -0,0 +1,228 @@
+"""
+ПЛАНИРОВЩИК ЗАПРОСОВ К AI — лимиты бесплатных тарифов Gemini / Groq
+
+Для каждого провайдера:
+  - token bucket по запросам в минуту (RPM)
+  - дневной бюджет запросов и/или токенов (сброс в полночь UTC)
+  - пауза после 429 от провайдера (Retry-After)
+
+Запросы ждут в очереди с приоритетом (interactive раньше batch) и
+отдаются первому провайдеру из списка, у которого есть запас.
+Глубина очереди и время ожидания видны в stats().
+
+Пример:
+  sched = AIScheduler.from_env()
+  provider = await sched.acquire(["gemini", "groq"], est_tokens=2500)
+  ...
+  sched.record(provider, est_tokens=2500, used_tokens=1800)
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITIES = {"interactive": PRIORITY_INTERACTIVE, "batch": PRIORITY_BATCH}
+
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "60"))
+
+
+class RateLimited(RuntimeError):
+    """Ни у одного провайдера нет запаса за отведённое время ожидания"""
+
+
+def _utc_day() -> int:
+    return int(time.time() // 86400)
+
+
+class ProviderBucket:
+    """Лимиты одного провайдера"""
+
+    def __init__(self, name: str, rpm: float, daily_requests: int = None,
+                 daily_tokens: int = None):
+        self.name = name
+        self.rpm = max(1.0, float(rpm))
+        self.daily_requests = daily_requests
+        self.daily_tokens = daily_tokens
+        self.tokens = self.rpm              # запас запросов в ведре
+        self.updated = time.monotonic()
+        self.day = _utc_day()
+        self.requests_today = 0
+        self.tokens_today = 0
+        self.cooldown_until = 0.0
+        self.rejected = 0                   # 429 от провайдера
+
+    def _refill(self, now: float):
+        self.tokens = min(self.rpm, self.tokens + (now - self.updated) * self.rpm / 60.0)
+        self.updated = now
+        day = _utc_day()
+        if day != self.day:
+            self.day, self.requests_today, self.tokens_today = day, 0, 0
+
+    def wait_time(self, now: float, est_tokens: int) -> Optional[float]:
+        """0 — можно сейчас; секунды до появления запаса; None — бюджет дня исчерпан"""
+        self._refill(now)
+        if self.daily_requests is not None and self.requests_today >= self.daily_requests:
+            return None
+        if self.daily_tokens is not None and self.tokens_today + est_tokens > self.daily_tokens:
+            return None
+        wait = max(0.0, self.cooldown_until - now)
+        if self.tokens < 1.0:
+            wait = max(wait, (1.0 - self.tokens) * 60.0 / self.rpm)
+        return wait
+
+    def consume(self, est_tokens: int):
+        self.tokens -= 1.0
+        self.requests_today += 1
+        self.tokens_today += est_tokens
+
+    def stats(self) -> Dict:
+        self._refill(time.monotonic())
+        return {
+            "rpm": self.rpm,
+            "available_now": int(self.tokens),
+            "requests_today": self.requests_today,
+            "daily_requests": self.daily_requests,
+            "tokens_today": self.tokens_today,
+            "daily_tokens": self.daily_tokens,
+            "cooldown": round(max(0.0, self.cooldown_until - time.monotonic()), 1),
+            "rejected_429": self.rejected,
+        }
+
+
+class AIScheduler:
+    """Очередь с приоритетами поверх ProviderBucket"""
+
+    def __init__(self, buckets: List[ProviderBucket], share: int = 1):
+        self.buckets: Dict[str, ProviderBucket] = {b.name: b for b in buckets}
+        self.share = share                  # на сколько процессов поделены лимиты
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits = deque(maxlen=200)     # последние времена ожидания, сек
+        self.served = 0
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls, share: int = 1) -> "AIScheduler":
+        """Лимиты из окружения; share > 1 — процессов с общим ключом API
+        (воркеры serve.py), каждому достаётся 1/share лимитов"""
+        share = max(1, share)
+
+        def opt(name, default=None):
+            v = os.getenv(name, "")
+            v = int(v) if v.strip() else default
+            return max(1, v // share) if v else v
+        return cls([
+            ProviderBucket("gemini", float(os.getenv("GEMINI_RPM", "15")) / share,
+                           daily_requests=opt("GEMINI_DAILY_REQUESTS"),
+                           daily_tokens=opt("GEMINI_DAILY_TOKENS", 1_000_000)),
+            ProviderBucket("groq", float(os.getenv("GROQ_RPM", "30")) / share,
+                           daily_requests=opt("GROQ_DAILY_REQUESTS", 14_400),
+                           daily_tokens=opt("GROQ_DAILY_TOKENS")),
+        ], share=share)
+
+    # ── Очередь ──────────────────────────────────────────────────
+    async def acquire(self, providers: List[str], est_tokens: int = 0,
+                      priority: int = PRIORITY_INTERACTIVE,
+                      timeout: float = AI_QUEUE_TIMEOUT) -> str:
+        """Дождаться свободного провайдера из списка (в порядке предпочтения)"""
+        providers = [p for p in providers if p in self.buckets]
+        if not providers:
+            raise RateLimited("нет провайдеров с лимитами")
+        fut = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), fut, providers, est_tokens, time.monotonic()]
+        heapq.heappush(self._heap, entry)
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                return fut.result()
+            fut.cancel()
+            self.timeouts += 1
+            raise RateLimited(f"лимиты AI исчерпаны, ожидание > {timeout:.0f} с")
+        except asyncio.CancelledError:
+            # Уже выданный слот не возвращаем: запрос к провайдеру засчитан
+            fut.cancel()
+            raise
+
+    def _dispatch(self):
+        now = time.monotonic()
+        next_wake = None
+        blocked = set()     # провайдеры, которых ждут запросы с более высоким приоритетом
+        for entry in sorted(self._heap):
+            _, _, fut, providers, est, enqueued = entry
+            if fut.done():
+                continue
+            chosen, soonest, exhausted = None, None, True
+            for name in providers:
+                if name in blocked:
+                    exhausted = False
+                    continue
+                wait = self.buckets[name].wait_time(now, est)
+                if wait is None:
+                    continue
+                exhausted = False
+                if wait == 0:
+                    chosen = name
+                    break
+                soonest = wait if soonest is None else min(soonest, wait)
+            if chosen:
+                self.buckets[chosen].consume(est)
+                self._waits.append(now - enqueued)
+                self.served += 1
+                fut.set_result(chosen)
+            elif exhausted:
+                fut.set_exception(RateLimited("дневные лимиты AI исчерпаны"))
+            else:
+                # Ждёт — младшие в очереди не обгоняют его на тех же провайдерах
+                blocked.update(providers)
+                if soonest is not None:
+                    next_wake = soonest if next_wake is None else min(next_wake, soonest)
+
+        self._heap = [e for e in self._heap if not e[2].done()]
+        heapq.heapify(self._heap)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if next_wake is not None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(next_wake + 0.01, self._dispatch)
+
+    # ── Обратная связь от провайдера ─────────────────────────────
+    def record(self, provider: str, est_tokens: int, used_tokens: Optional[int]):
+        """Поправить дневной счётчик токенов по фактическому расходу"""
+        b = self.buckets.get(provider)
+        if b is not None and used_tokens is not None:
+            b.tokens_today = max(0, b.tokens_today - est_tokens + used_tokens)
+
+    def penalize(self, provider: str, retry_after: float = 60.0):
+        """Провайдер ответил 429 — не отдаём ему запросы retry_after секунд"""
+        b = self.buckets.get(provider)
+        if b is not None:
+            b.cooldown_until = max(b.cooldown_until, time.monotonic() + retry_after)
+            b.tokens = min(b.tokens, 0.0)
+            b.rejected += 1
+
+    def stats(self) -> Dict:
+        waits = list(self._waits)
+        depth = {name: 0 for name in PRIORITIES}
+        for entry in self._heap:
+            if not entry[2].done():
+                label = "interactive" if entry[0] == PRIORITY_INTERACTIVE else "batch"
+                depth[label] += 1
+        return {
+            "limits_share": self.share,
+            "queue_depth": depth,
+            "served": self.served,
+            "queue_timeouts": self.timeouts,
+            "wait_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_max": round(max(waits), 3) if waits else 0.0,
+            "providers": {name: b.stats() for name, b in self.buckets.items()},
+        }
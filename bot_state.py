@@ -0,0 +1,289 @@
+"""
+СОСТОЯНИЕ БОТА — диалоги и данные пользователей в SQLite (WAL)
+
+ConversationHandler держит состояние диалога в памяти процесса: при
+нескольких воркерах uvicorn или репликах ответ на /calc мог попасть в
+процесс, который /calc не видел. Здесь состояние общее для всех процессов:
+  - conversations: (чат, пользователь, диалог) → состояние и данные шага;
+  - user_data: пользователь → JSON (например, последний расчёт для /ask);
+  - состояние диалога пишется в базу сразу (одна строка): следующее
+    сообщение пользователя может обработать другой процесс;
+  - user_data — пачками: изменения копятся в памяти и пишутся одной
+    транзакцией раз в BOT_STATE_FLUSH секунд; до записи их видит только свой
+    процесс (другой воркер получит прежние данные не дольше этого окна);
+  - диалог, брошенный на BOT_STATE_TTL секунд, считается завершённым;
+  - seen_updates: принятые update_id — повтор webhook, пришедший в другой
+    процесс, отбрасывается (claim_update, используется tg_queue).
+
+Файл отдельный (по умолчанию data/bot_state.db), база знаний не меняется.
+
+Пример:
+  store = BotStateStore()
+  await store.start()
+  await store.set_state(chat_id, user_id, "calc", WAITING_DATE)
+  state = await store.get_state(chat_id, user_id, "calc")
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+DATA_DIR = Path(__file__).parent / "data"
+
+BOT_STATE_PATH  = Path(os.getenv("BOT_STATE_PATH", str(DATA_DIR / "bot_state.db")))
+BOT_STATE_FLUSH = float(os.getenv("BOT_STATE_FLUSH", "0.1"))          # сек между записями
+BOT_STATE_TTL   = int(os.getenv("BOT_STATE_TTL", str(24 * 3600)))      # сек жизни диалога
+BOT_STATE_BATCH = 500                                                  # изменений — писать сразу
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversations (
+        chat_id    INTEGER NOT NULL,
+        user_id    INTEGER NOT NULL,
+        name       TEXT NOT NULL,
+        state      INTEGER NOT NULL,
+        data       TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (chat_id, user_id, name)
+    );
+    CREATE INDEX IF NOT EXISTS conversations_updated ON conversations(updated_at);
+    CREATE TABLE IF NOT EXISTS user_data (
+        user_id    INTEGER PRIMARY KEY,
+        data       TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS seen_updates (
+        update_id  INTEGER PRIMARY KEY,
+        seen_at    REAL NOT NULL
+    );
+"""
+
+# Несохранённое удаление в _pending
+_DELETED = object()
+
+
+class BotStateStore:
+    """Состояние диалогов и данные пользователей, общие для всех процессов"""
+
+    def __init__(self, path: Path = BOT_STATE_PATH, flush_interval: float = BOT_STATE_FLUSH,
+                 ttl: int = BOT_STATE_TTL):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._lock = threading.Lock()         # соединение SQLite
+        self._mem = threading.Lock()          # _pending/_flushing; не держится во время записи
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA busy_timeout = 5000")
+        self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+        """ + SCHEMA)
+        # ("conv", chat, user, name) | ("user", user) → строка для записи или _DELETED
+        self._pending: Dict[tuple, Any] = {}
+        self._flushing: Dict[tuple, Any] = {}     # пишутся сейчас
+        self._dirty: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self._seen_cleanup = 0.0
+
+    # ── Жизненный цикл ───────────────────────────────────────────
+    async def start(self):
+        if self._task is not None:
+            return
+        self._dirty = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Записать накопленное и закрыть базу"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.flush)
+        with self._lock:
+            self.conn.close()
+
+    # ── Диалоги ──────────────────────────────────────────────────
+    async def get_state(self, chat_id: int, user_id: int, name: str) -> Optional[int]:
+        """Текущее состояние диалога (None — диалога нет или он истёк)"""
+        entry = await self.get_conversation(chat_id, user_id, name)
+        return entry[0] if entry else None
+
+    async def get_conversation(self, chat_id: int, user_id: int, name: str):
+        """(состояние, данные шага) или None"""
+        row = self._unsaved(("conv", chat_id, user_id, name))
+        if row is None:
+            row = await asyncio.to_thread(
+                self._select,
+                "SELECT chat_id, user_id, name, state, data, updated_at FROM conversations "
+                "WHERE chat_id=? AND user_id=? AND name=?", (chat_id, user_id, name))
+        if row is None or row is _DELETED or time.time() - row[5] > self.ttl:
+            return None
+        return row[3], json.loads(row[4]) if row[4] else None
+
+    async def set_state(self, chat_id: int, user_id: int, name: str, state: int, data: Any = None):
+        await self._write_now(("conv", chat_id, user_id, name),
+                              (chat_id, user_id, name, state,
+                               json.dumps(data, ensure_ascii=False) if data is not None else None,
+                               time.time()))
+
+    async def end(self, chat_id: int, user_id: int, name: str):
+        """Завершить диалог"""
+        await self._write_now(("conv", chat_id, user_id, name), _DELETED)
+
+    # ── Данные пользователей ─────────────────────────────────────
+    async def get_user_data(self, user_id: int) -> Dict:
+        row = self._unsaved(("user", user_id))
+        if row is None:
+            row = await asyncio.to_thread(
+                self._select, "SELECT user_id, data, updated_at FROM user_data WHERE user_id=?",
+                (user_id,))
+        if row is None or row is _DELETED:
+            return {}
+        return json.loads(row[1])
+
+    async def set_user_data(self, user_id: int, data: Dict):
+        self._put(("user", user_id),
+                  (user_id, json.dumps(data, ensure_ascii=False), time.time()))
+
+    async def drop_user_data(self, user_id: int):
+        self._put(("user", user_id), _DELETED)
+
+    # ── Принятые обновления Telegram ─────────────────────────────
+    async def claim_update(self, update_id: int) -> bool:
+        """Отметить update_id принятым; False — его уже принял какой-то процесс"""
+        return await asyncio.to_thread(self._claim, update_id)
+
+    async def release_update(self, update_id: int):
+        """Снять отметку (обновление отклонено — Telegram пришлёт его снова)"""
+        def release():
+            with self._lock, self.conn:
+                self.conn.execute("DELETE FROM seen_updates WHERE update_id=?", (update_id,))
+        await asyncio.to_thread(release)
+
+    def _select(self, sql: str, args: tuple):
+        """Одна строка из базы — в потоке: запись другого процесса может держать блокировку"""
+        with self._lock:
+            return self.conn.execute(sql, args).fetchone()
+
+    def _claim(self, update_id: int) -> bool:
+        now = time.time()
+        with self._lock, self.conn:
+            claimed = self.conn.execute("INSERT OR IGNORE INTO seen_updates VALUES (?, ?)",
+                                        (update_id, now)).rowcount == 1
+            # Отметки старше BOT_STATE_TTL не нужны — столько Telegram не повторяет
+            if now - self._seen_cleanup > 60:
+                self._seen_cleanup = now
+                self.conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+        return claimed
+
+    # ── Запись пачками ───────────────────────────────────────────
+    def _unsaved(self, key: tuple):
+        with self._mem:
+            row = self._pending.get(key)
+            return row if row is not None else self._flushing.get(key)
+
+    async def _write_now(self, key: tuple, row):
+        """Записать сразу, минуя пачку"""
+        await asyncio.to_thread(self._write, {key: row}, False)
+
+    def _put(self, key: tuple, row):
+        with self._mem:
+            self._pending[key] = row
+        if self._dirty is not None:
+            self._dirty.set()
+        else:
+            self.flush()        # без фоновой задачи — сразу
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            # Копим изменения flush_interval секунд (или до BOT_STATE_BATCH)
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._pending) < BOT_STATE_BATCH and time.monotonic() < deadline:
+                await asyncio.sleep(min(0.01, self.flush_interval))
+            self._dirty.clear()
+            pending = self._take()
+            try:
+                await asyncio.to_thread(self._write, pending)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠ Состояние бота не сохранено: {e}")
+                # Вернуть изменения, которые не перезаписаны новыми, — запишутся следующей пачкой
+                with self._mem:
+                    for key, row in pending.items():
+                        self._pending.setdefault(key, row)
+                self._dirty.set()
+                await asyncio.sleep(1.0)
+            finally:
+                self._done()
+
+    def _take(self) -> Dict[tuple, Any]:
+        with self._mem:
+            pending, self._pending = self._pending, {}
+            self._flushing = pending
+        return pending
+
+    def _done(self):
+        with self._mem:
+            self._flushing = {}
+
+    def flush(self):
+        """Записать накопленные изменения сейчас"""
+        try:
+            self._write(self._take())
+        finally:
+            self._done()
+
+    def _write(self, pending: Dict[tuple, Any], cleanup: bool = True):
+        """Изменения — одной транзакцией (cleanup — заодно убрать брошенные диалоги)"""
+        if not pending:
+            return
+        conv_rows, conv_deleted, user_rows, user_deleted = [], [], [], []
+        for key, row in pending.items():
+            if key[0] == "conv":
+                (conv_deleted if row is _DELETED else conv_rows).append(
+                    key[1:] if row is _DELETED else row)
+            else:
+                (user_deleted if row is _DELETED else user_rows).append(
+                    key[1:] if row is _DELETED else row)
+        t0 = time.perf_counter()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?, ?)", conv_rows)
+            self.conn.executemany(
+                "DELETE FROM conversations WHERE chat_id=? AND user_id=? AND name=?", conv_deleted)
+            self.conn.executemany("INSERT OR REPLACE INTO user_data VALUES (?, ?, ?)", user_rows)
+            self.conn.executemany("DELETE FROM user_data WHERE user_id=?", user_deleted)
+            if cleanup:
+                self.conn.execute("DELETE FROM conversations WHERE updated_at < ?",
+                                  (time.time() - self.ttl,))
+        self.written += len(pending)
+        if cleanup:
+            self.last_flush_ms = round((time.perf_counter() - t0) * 1000, 1)
+            self.flushes += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            conversations = self.conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            users = self.conn.execute("SELECT COUNT(*) FROM user_data").fetchone()[0]
+        return {
+            "conversations": conversations,
+            "users": users,
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
@@ -0,0 +1,318 @@
+"""
+ПАКЕТНЫЙ РАСЧЁТ — calculate_all для тысяч клиентов за один проход
+
+Работает по столбцам (дни, месяцы, годы, имена), а не построчно:
+  - суммы цифр считаются арифметически (без str → int)
+  - сведение к однозначному — через таблицу reduce_to_single (LUT)
+  - NumPy используется, если установлен; иначе — чистый Python
+
+Результат каждой строки совпадает с HybridKnowledgeBase.calculate_all.
+Строки вне «быстрого» диапазона (отрицательные числа, год > 9999 и т.п.)
+считаются скалярным путём, поэтому и ошибки совпадают.
+
+Потоковый режим: ClientReader разбирает входные строки CSV/JSONL,
+BulkCalculator.iter_records считает их пачками, а format_row / CSV_FIELDS
+превращают результат в строку NDJSON или CSV.
+
+Пример:
+  from bulk_engine import BulkCalculator
+  calc = BulkCalculator(kb)
+  rows = calc.calculate_rows([15, 1], [6, 2], [1990, 2001], ["Мария", None])
+"""
+
+import csv
+import io
+import json
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from knowledge_base import CHAKRA_NAMES, compact_result, reduce_to_single
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Быстрый путь: f"{day:02d}{month:02d}{year:04d}" ровно 8 цифр
+MAX_DAY, MAX_MONTH, MAX_YEAR = 99, 99, 9999
+
+# Клиент: (день, месяц, год, имя); ошибка разбора хранится на его месте
+Client = Tuple[int, int, int, Optional[str]]
+Record = Union[Client, ValueError]
+
+# Плоские столбцы для CSV-вывода
+CSV_FIELDS = [
+    "index", "name", "success", "error", "day", "month", "year",
+    "birth_number", "life_path", "financial_channel", "personal_year", "destiny",
+    *[f"chakra_{i}" for i in range(1, 8)],
+]
+
+
+@lru_cache(maxsize=None)
+def _reduce_lut(size: int):
+    """Таблица reduce_to_single(n) для n < size"""
+    lut = [reduce_to_single(n) for n in range(size)]
+    return np.asarray(lut, dtype=np.int64) if np is not None else lut
+
+
+def _year_digit_sum(y):
+    """Сумма цифр года 0..9999 (работает и для массивов NumPy)"""
+    return y // 1000 + y // 100 % 10 + y // 10 % 10 + y % 10
+
+
+class BulkCalculator:
+    """Векторизованный calculate_all поверх HybridKnowledgeBase"""
+
+    def __init__(self, kb):
+        self.kb = kb
+
+    # ── Числовое ядро ─────────────────────────────────────────────
+    def compute_columns(self, days: Sequence[int], months: Sequence[int],
+                        years: Sequence[int], current_year: int) -> Dict[str, Any]:
+        """Все числовые показатели по столбцам (только быстрый диапазон)"""
+        if np is not None:
+            d = np.asarray(days, dtype=np.int64)
+            m = np.asarray(months, dtype=np.int64)
+            y = np.asarray(years, dtype=np.int64)
+            lut = _reduce_lut(MAX_DAY + MAX_MONTH + max(MAX_YEAR, current_year) + 1)
+            life_total = d + m + y
+            year_sum = _year_digit_sum(y)
+            fin_total = d + m + year_sum
+            return {
+                "birth": lut[d],
+                "life_total": life_total,
+                "life": lut[life_total],
+                "year_sum": year_sum,
+                "fin_total": fin_total,
+                "fin": lut[fin_total],
+                "personal": lut[d + m + current_year],
+                "digits": np.stack([d // 10, d % 10, m // 10, m % 10,
+                                    y // 1000, y // 100 % 10, y // 10 % 10, y % 10], axis=1),
+            }
+
+        lut = _reduce_lut(MAX_DAY + MAX_MONTH + max(MAX_YEAR, current_year) + 1)
+        life_total = [a + b + c for a, b, c in zip(days, months, years)]
+        year_sum = [_year_digit_sum(c) for c in years]
+        fin_total = [a + b + c for a, b, c in zip(days, months, year_sum)]
+        return {
+            "birth": [lut[a] for a in days],
+            "life_total": life_total,
+            "life": [lut[t] for t in life_total],
+            "year_sum": year_sum,
+            "fin_total": fin_total,
+            "fin": [lut[t] for t in fin_total],
+            "personal": [lut[a + b + current_year] for a, b in zip(days, months)],
+            "digits": [[a // 10, a % 10, b // 10, b % 10,
+                        c // 1000, c // 100 % 10, c // 10 % 10, c % 10]
+                       for a, b, c in zip(days, months, years)],
+        }
+
+    def _columns(self, days, months, years, current_year: int) -> Dict[str, Any]:
+        """Столбцы из таблицы дат kb.date_table, если все даты в ней есть"""
+        table = getattr(self.kb, "date_table", None)
+        if table is not None and days:
+            cols = table.lookup_columns(days, months, years)
+            if cols is not None:
+                lut = _reduce_lut(MAX_DAY + MAX_MONTH + max(MAX_YEAR, current_year) + 1)
+                cols["personal"] = lut[np.asarray(days, dtype=np.int64)
+                                       + np.asarray(months, dtype=np.int64) + current_year]
+                return cols
+        return self.compute_columns(days, months, years, current_year)
+
+    # ── Сборка строк ──────────────────────────────────────────────
+    def iter_results(self, days: Sequence[int], months: Sequence[int],
+                     years: Sequence[int], names: Optional[Sequence[Optional[str]]] = None,
+                     current_year: int = None, start_index: int = 0) -> Iterator[Dict]:
+        """Строки ответа /api/bulk-calculate в порядке входа"""
+        n = len(days)
+        if len(months) != n or len(years) != n or (names is not None and len(names) != n):
+            raise ValueError("Столбцы day/month/year/name должны быть одной длины")
+        if names is None:
+            names = [None] * n
+        if current_year is None:
+            current_year = date.today().year
+
+        fast = [0 <= a <= MAX_DAY and 0 <= b <= MAX_MONTH and 0 <= c <= MAX_YEAR
+                for a, b, c in zip(days, months, years)]
+        fast_idx = [i for i, ok in enumerate(fast) if ok]
+        cols = self._columns([days[i] for i in fast_idx],
+                             [months[i] for i in fast_idx],
+                             [years[i] for i in fast_idx], current_year)
+        if np is not None:
+            cols = {k: v.tolist() for k, v in cols.items()}
+
+        kb = self.kb
+        meanings: Dict[int, Dict] = {}
+        births: Dict[int, Dict] = {}
+        destinies: Dict[str, Dict] = {}
+        f_life = kb.get_formula("life_path")
+        f_fin = kb.get_formula("financial_channel")
+        f_chakra = kb.get_formula("chakra_balance")
+
+        def meaning(v):
+            if v not in meanings:
+                meanings[v] = kb.get_meaning(v)
+            return meanings[v]
+
+        j = 0
+        for i in range(n):
+            day, month, year, name = days[i], months[i], years[i], names[i]
+            idx = start_index + i
+            if not fast[i]:
+                try:
+                    r = kb.calculate_all(day, month, year, name, current_year=current_year)
+                    yield {"index": idx, "name": name, "success": True, **r}
+                except Exception as e:
+                    yield {"index": idx, "name": name, "success": False, "error": str(e)}
+                continue
+
+            if day not in births:
+                births[day] = kb.calculate_birth_number(day)
+            life, life_total = cols["life"][j], cols["life_total"][j]
+            fin, fin_total, C = cols["fin"][j], cols["fin_total"][j], cols["year_sum"][j]
+            personal, digits = cols["personal"][j], cols["digits"][j]
+            j += 1
+
+            chakras = {}
+            for k in range(1, 8):
+                a, b = digits[k - 1], digits[k]
+                chakras[k] = {"value": a + b, "name": CHAKRA_NAMES.get(k, f"Чакра {k}"),
+                              "digits_used": f"{a}+{b}"}
+
+            destiny = None
+            if name and name.strip():
+                key = name.strip()
+                if key not in destinies:
+                    destinies[key] = kb.calculate_destiny_number(key)
+                destiny = destinies[key]
+
+            yield {
+                "index": idx, "name": name, "success": True,
+                "input": {"day": day, "month": month, "year": year, "name": name},
+                "birth_number": births[day],
+                "life_path": {
+                    "value": life,
+                    "details": {"day": day, "month": month, "year": year, "total": life_total},
+                    "formula_text": f"{day} + {month} + {year} = {life_total} → {life}",
+                    "meaning": meaning(life),
+                    "formula": f_life,
+                },
+                "financial_channel": {
+                    "value": fin,
+                    "A": day, "B": month, "C": C,
+                    "total": fin_total,
+                    "formula_text": f"A({day}) + B({month}) + C({C}) = {fin_total} → D={fin}",
+                    "meaning": meaning(fin),
+                    "formula": f_fin,
+                },
+                "chakras": {
+                    "chakras": chakras,
+                    "date_str": f"{day:02d}{month:02d}{year:04d}",
+                    "formula": f_chakra,
+                },
+                "personal_year": {
+                    "value": personal,
+                    "year": current_year,
+                    "formula_text": f"{day} + {month} + {current_year} → {personal}",
+                    "meaning": meaning(personal),
+                },
+                "destiny": destiny,
+            }
+
+    def calculate_rows(self, days, months, years, names=None,
+                       current_year: int = None, compact: bool = False) -> List[Dict]:
+        rows = self.iter_results(days, months, years, names, current_year)
+        if compact:
+            return [compact_result(r) for r in rows]
+        return list(rows)
+
+    def iter_records(self, records: Sequence[Record], start_index: int = 0,
+                     current_year: int = None) -> Iterator[Dict]:
+        """Посчитать пачку записей ClientReader, сохраняя ошибки разбора на своих местах"""
+        clients = [r for r in records if not isinstance(r, ValueError)]
+        rows = self.iter_results([c[0] for c in clients], [c[1] for c in clients],
+                                 [c[2] for c in clients], [c[3] for c in clients],
+                                 current_year=current_year)
+        for k, r in enumerate(records):
+            if isinstance(r, ValueError):
+                yield {"index": start_index + k, "name": None, "success": False, "error": str(r)}
+            else:
+                row = next(rows)
+                row["index"] = start_index + k
+                yield row
+
+
+# ── Ввод / вывод построчно ───────────────────────────────────────
+class ClientReader:
+    """Разбор строк CSV (с заголовком или day,month,year,name) или JSONL"""
+
+    def __init__(self, fmt: str = "jsonl"):
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+
+    def feed(self, line: str) -> Optional[Record]:
+        """Одна строка → запись; None для пустых строк и заголовка CSV"""
+        line = line.strip().lstrip("\ufeff")
+        if not line:
+            return None
+        if self.fmt == "jsonl":
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                return ValueError(f"Некорректный JSON: {line[:80]}")
+            if not isinstance(obj, dict):
+                return ValueError(f"Ожидался объект: {line[:80]}")
+            return self._client(obj)
+
+        fields = next(csv.reader([line]))
+        if self.header is None:
+            self.header = ["day", "month", "year", "name"]
+            if not fields[0].strip().lstrip("-").isdigit():
+                self.header = [f.strip().lower() for f in fields]
+                return None
+        return self._client(dict(zip(self.header, fields)))
+
+    @staticmethod
+    def _client(obj: Dict) -> Record:
+        try:
+            name = obj.get("name")
+            name = str(name) if name not in (None, "") else None
+            return int(obj["day"]), int(obj["month"]), int(obj["year"]), name
+        except KeyError as e:
+            return ValueError(f"Нет поля {e}")
+        except (TypeError, ValueError):
+            return ValueError(f"Некорректная дата: {obj.get('day')}.{obj.get('month')}.{obj.get('year')}")
+
+
+def flatten_row(row: Dict) -> Dict:
+    """Строка результата → плоский dict по CSV_FIELDS"""
+    inp = row.get("input") or {}
+    flat = {"index": row.get("index"), "name": row.get("name"),
+            "success": row.get("success"), "error": row.get("error", ""),
+            "day": inp.get("day"), "month": inp.get("month"), "year": inp.get("year")}
+    for key in ("birth_number", "life_path", "financial_channel", "personal_year", "destiny"):
+        flat[key] = (row.get(key) or {}).get("value")
+    chakras = (row.get("chakras") or {}).get("chakras", {})
+    for i in range(1, 8):
+        flat[f"chakra_{i}"] = (chakras.get(i) or {}).get("value")
+    return flat
+
+
+def csv_header() -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(CSV_FIELDS)
+    return buf.getvalue()
+
+
+def format_row(row: Dict, fmt: str = "ndjson", compact: bool = False) -> str:
+    """Одна строка результата в NDJSON или CSV (с переводом строки)"""
+    if fmt == "csv":
+        buf = io.StringIO()
+        csv.DictWriter(buf, CSV_FIELDS).writerow(flatten_row(row))
+        return buf.getvalue()
+    if compact:
+        row = compact_result(row)
+    return json.dumps(row, ensure_ascii=False) + "\n"
@@ -0,0 +1,183 @@
+"""
+СПРАВОЧНЫЕ ДАННЫЕ — formulas.json, number_meanings.json, practices.json …
+
+Один общий на процесс реестр вместо отдельной загрузки в HybridKnowledgeBase,
+AIConsultant и main.py:
+  - файлы читаются и нормализуются один раз, в неизменяемый снимок
+    (DataSnapshot) с готовыми индексами: формула по id, скомпилированные
+    формулы (FormulaEngine);
+  - reload() собирает новый снимок рядом и подменяет ссылку на него —
+    запросы, начатые со старым снимком, дорабатывают с ним;
+  - watch() раз в interval секунд сверяет mtime и размер файлов и
+    перезагружает реестр, если они изменились.
+
+Пример:
+  data = get_registry().current
+  data.formula('life_path'), data.number_meanings['7']
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+DATA_DIR = Path(__file__).parent / "data"
+
+# Поле снимка → файл в data/
+DATA_FILES = {
+    "formulas":        "formulas.json",
+    "practices":       "practices.json",
+    "algorithms":      "algorithms.json",
+    "number_meanings": "number_meanings.json",
+    "master_index":    "master_index.json",
+}
+
+_versions = itertools.count(1)
+
+
+def _stamp(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class DataSnapshot:
+    """Справочные данные на момент загрузки. Не изменяется: вместо правки —
+    новый снимок через DataRegistry.reload()"""
+
+    __slots__ = ("version", "stamps", "files", "formulas", "practices", "algorithms",
+                 "number_meanings", "master_index", "formulas_by_id", "formula_engine")
+
+    def __init__(self, data_dir: Path):
+        from formula_engine import FormulaEngine
+        stamps, files = {}, {}
+        for name in DATA_FILES.values():
+            path = data_dir / name
+            stamps[name] = _stamp(path)
+            if stamps[name] is not None:
+                files[name] = json.loads(path.read_text(encoding="utf-8"))
+        self.stamps: Mapping[str, Optional[Tuple[int, int]]] = MappingProxyType(stamps)
+        # Данные файлов как есть (для ответов API); None — файла нет
+        self.files: Mapping[str, Any] = MappingProxyType(files)
+
+        data = {key: files.get(name, {}) for key, name in DATA_FILES.items()}
+        self.formulas: List[Dict] = data["formulas"] if isinstance(data["formulas"], list) else []
+        self.practices: List[Dict] = data["practices"] if isinstance(data["practices"], list) else []
+        self.algorithms = data["algorithms"]
+        self.master_index = data["master_index"]
+        meanings = data["number_meanings"]
+        if isinstance(meanings, list):
+            meanings = {str(item.get('value', '')): item for item in meanings}
+        self.number_meanings: Dict[str, Dict] = meanings
+
+        # Производные индексы
+        self.formulas_by_id: Dict[str, Dict] = {f["id"]: f for f in self.formulas if f.get("id")}
+        self.formula_engine = FormulaEngine(self.formulas)
+        self.version = next(_versions)      # последним: после него снимок не изменяется
+
+    def __setattr__(self, name, value):
+        if hasattr(self, "version"):
+            raise AttributeError("DataSnapshot не изменяется — используйте DataRegistry.reload()")
+        object.__setattr__(self, name, value)
+
+    def formula(self, formula_id: str) -> Optional[Dict]:
+        return self.formulas_by_id.get(formula_id)
+
+    def file(self, name: str) -> Any:
+        """Данные data/<name> (общий объект — не изменять); None — файла нет"""
+        return self.files.get(name)
+
+
+class DataRegistry:
+    """Текущий снимок справочных данных с атомарной перезагрузкой"""
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self._lock = threading.RLock()
+        self._current: Optional[DataSnapshot] = None
+        self.reloads = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self._failed = None     # отметки файлов, которые не удалось загрузить
+
+    @property
+    def current(self) -> DataSnapshot:
+        snap = self._current
+        if snap is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = DataSnapshot(self.data_dir)
+                snap = self._current
+        return snap
+
+    def _stamps(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {name: _stamp(self.data_dir / name) for name in DATA_FILES.values()}
+
+    def changed(self) -> bool:
+        """Изменились ли файлы с момента загрузки текущего снимка"""
+        return self._stamps() != dict(self.current.stamps)
+
+    def reload(self, force: bool = True) -> bool:
+        """Собрать новый снимок и подменить текущий; True — подменён.
+        Если файл не разбирается, остаётся старый снимок, ошибка — в last_error."""
+        with self._lock:
+            if not force and self._current is not None and not self.changed():
+                return False
+            stamps = self._stamps()
+            try:
+                snap = DataSnapshot(self.data_dir)
+            except Exception as e:
+                self._failed = stamps
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            self._current = snap
+            self.reloads += 1
+            self.last_error = None
+            return True
+
+    async def watch(self, interval: float):
+        """Перезагружать при изменении файлов (задача на всё время работы)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stamps = self._stamps()
+                if stamps != dict(self.current.stamps) and stamps != self._failed:
+                    await asyncio.to_thread(self.reload, False)
+            except Exception as e:
+                print(f"⚠ Справочные данные не перезагружены: {e}")
+
+    def stats(self) -> Dict:
+        snap = self.current
+        return {
+            "version": snap.version,
+            "formulas": len(snap.formulas),
+            "practices": len(snap.practices),
+            "number_meanings": len(snap.number_meanings),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+_registry: Optional[DataRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(data_dir: Path = DATA_DIR) -> DataRegistry:
+    """Общий на процесс реестр для data_dir (по умолчанию data/)"""
+    global _registry
+    data_dir = Path(data_dir)
+    if _registry is not None and _registry.data_dir == data_dir:
+        return _registry
+    if data_dir != DATA_DIR:
+        return DataRegistry(data_dir)
+    with _registry_lock:
+        if _registry is None:
+            _registry = DataRegistry(DATA_DIR)
+    return _registry
@@ -0,0 +1,134 @@
+"""
+ТАБЛИЦА ДАТ — все показатели, зависящие только от даты рождения
+
+Для каждой даты 1900–2100 (день 1–31, месяц 1–12 — как принимает API)
+хранится строка чисел: путь жизни, финансовый канал, цифры даты для чакр.
+Таблица строится один раз (при сборке или старте) и открывается через
+np.load(mmap_mode="r") — расчёт сводится к чтению строки по индексу,
+а процессы-воркеры делят одни и те же страницы файла.
+
+Требует NumPy; без него HybridKnowledgeBase считает всё как раньше.
+
+Сборка:
+  python date_table.py [путь.npy]
+"""
+
+import sys
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_PATH = DATA_DIR / "date_table_v1.npy"
+
+YEAR_MIN, YEAR_MAX = 1900, 2100
+DAYS, MONTHS = 31, 12
+SIZE = (YEAR_MAX - YEAR_MIN + 1) * MONTHS * DAYS
+
+# Столбцы таблицы (порядок = порядок в файле)
+COLUMNS = ["birth", "life_total", "life", "year_sum", "fin_total", "fin",
+           *[f"d{i}" for i in range(8)]]
+_COL = {name: i for i, name in enumerate(COLUMNS)}
+_DIGITS = slice(_COL["d0"], _COL["d7"] + 1)
+
+
+def row_index(day: int, month: int, year: int) -> int:
+    return ((year - YEAR_MIN) * MONTHS + (month - 1)) * DAYS + (day - 1)
+
+
+def in_range(day: int, month: int, year: int) -> bool:
+    return 1 <= day <= DAYS and 1 <= month <= MONTHS and YEAR_MIN <= year <= YEAR_MAX
+
+
+class DateTable:
+    """Предрасчитанные показатели по дате (только чтение)"""
+
+    def __init__(self, data):
+        if data.shape != (SIZE, len(COLUMNS)):
+            raise ValueError(f"Неверная форма таблицы дат: {data.shape}")
+        self.data = data
+
+    # ── Сборка / загрузка ────────────────────────────────────────
+    @staticmethod
+    def compute():
+        """Посчитать таблицу целиком (векторно, через BulkCalculator)"""
+        from bulk_engine import BulkCalculator
+        grid = np.indices((YEAR_MAX - YEAR_MIN + 1, MONTHS, DAYS)).reshape(3, -1)
+        years, months, days = grid[0] + YEAR_MIN, grid[1] + 1, grid[2] + 1
+        cols = BulkCalculator(None).compute_columns(days, months, years, current_year=YEAR_MIN)
+        data = np.empty((SIZE, len(COLUMNS)), dtype=np.int16)
+        for name in COLUMNS[:_DIGITS.start]:
+            data[:, _COL[name]] = cols[name]
+        data[:, _DIGITS] = cols["digits"]
+        return data
+
+    @classmethod
+    def build(cls, path: Path = DEFAULT_PATH) -> "DateTable":
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, cls.compute())
+        tmp.replace(path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: Path = DEFAULT_PATH) -> "DateTable":
+        return cls(np.load(str(path), mmap_mode="r"))
+
+    @classmethod
+    def open(cls, path: Path = DEFAULT_PATH) -> Optional["DateTable"]:
+        """Открыть таблицу, при отсутствии или порче — собрать заново"""
+        if np is None:
+            print("⚠ NumPy не установлен — таблица дат отключена")
+            return None
+        path = Path(path)
+        if path.exists():
+            try:
+                return cls.load(path)
+            except Exception as e:
+                print(f"⚠ Таблица дат повреждена ({e}), пересобираю")
+        try:
+            return cls.build(path)
+        except OSError:
+            # Нет прав на запись — держим таблицу в памяти
+            return cls(cls.compute())
+
+    # ── Чтение ───────────────────────────────────────────────────
+    def lookup(self, day: int, month: int, year: int) -> Optional[Dict]:
+        """Показатели одной даты или None, если дата вне таблицы"""
+        if not in_range(day, month, year):
+            return None
+        row = self.data[row_index(day, month, year)].tolist()
+        vals = {name: row[i] for i, name in enumerate(COLUMNS[:_DIGITS.start])}
+        vals["digits"] = row[_DIGITS]
+        return vals
+
+    def lookup_columns(self, days: Sequence[int], months: Sequence[int],
+                       years: Sequence[int]) -> Optional[Dict]:
+        """Столбцы как у BulkCalculator.compute_columns (без личного года);
+        None, если хотя бы одна дата вне таблицы"""
+        d = np.asarray(days, dtype=np.int64)
+        m = np.asarray(months, dtype=np.int64)
+        y = np.asarray(years, dtype=np.int64)
+        ok = ((d >= 1) & (d <= DAYS) & (m >= 1) & (m <= MONTHS)
+              & (y >= YEAR_MIN) & (y <= YEAR_MAX))
+        if not ok.all():
+            return None
+        rows = self.data[row_index(d, m, y)].astype(np.int64)
+        cols = {name: rows[:, _COL[name]] for name in COLUMNS[:_DIGITS.start]}
+        cols["digits"] = rows[:, _DIGITS]
+        return cols
+
+
+if __name__ == "__main__":
+    if np is None:
+        print("❌ Для таблицы дат нужен NumPy: pip install numpy")
+        sys.exit(1)
+    out = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATH
+    table = DateTable.build(out)
+    print(f"✅ Таблица дат: {out} ({SIZE} дат, {out.stat().st_size // 1024} КБ)")
@@ -0,0 +1,132 @@
+"""
+ПУЛ SQLite-СОЕДИНЕНИЙ ТОЛЬКО ДЛЯ ЧТЕНИЯ
+
+Ограниченный пул read-only соединений к knowledge_base.db.
+Каждый поток держит не больше одного соединения: повторный вход
+в connection() из того же потока возвращает уже выданное соединение,
+поэтому синхронные эндпоинты FastAPI безопасно работают параллельно
+в threadpool Starlette.
+
+Пример:
+  from db_pool import ReadOnlyPool
+  pool = ReadOnlyPool("data/knowledge_base.db", size=8)
+  with pool.connection() as conn:
+      conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+DEFAULT_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+ACQUIRE_TIMEOUT   = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+class PoolClosed(RuntimeError):
+    """Пул закрыт — новые соединения не выдаются"""
+
+
+class ReadOnlyPool:
+    """Ограниченный пул read-only соединений (одно соединение на поток)"""
+
+    def __init__(self, db_path, size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = ACQUIRE_TIMEOUT):
+        self.db_path = Path(db_path)
+        self.size    = max(1, int(size))
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock    = threading.Lock()
+        self._local   = threading.local()
+        self._closed  = False
+
+    # ── Соединения ───────────────────────────────────────────────
+    def _open(self) -> sqlite3.Connection:
+        uri = f"file:{self.db_path.resolve().as_posix()}?mode=ro"
+        # check_same_thread=False: соединение переходит между потоками
+        # через пул, но в каждый момент принадлежит только одному из них
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolClosed("пул соединений закрыт")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"нет свободных соединений к БД за {self.timeout} с (size={self.size})")
+
+    def _release(self, conn: sqlite3.Connection):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Выдать соединение текущему потоку (с поддержкой вложенности)"""
+        held: Optional[sqlite3.Connection] = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            try:
+                yield held
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn, self._local.depth = conn, 1
+        try:
+            yield conn
+        finally:
+            self._local.conn, self._local.depth = None, 0
+            self._release(conn)
+
+    def close(self):
+        """Закрыть простаивающие соединения; занятые закроются при возврате"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def reopen(self):
+        """Снова выдавать соединения после close(). Для воркера после fork:
+        соединения SQLite нельзя переносить в дочерний процесс, поэтому
+        родитель закрывает пул до fork, а воркер открывает свои."""
+        self.close()
+        self._local = threading.local()
+        self._closed = False
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "open": self._created,
+            "idle": self._idle.qsize(),
+            "closed": self._closed,
+        }
@@ -0,0 +1,361 @@
+"""
+ДВИЖОК ФОРМУЛ — formula_code из formulas.json → готовые функции
+
+Каждая формула с полем formula_code компилируется один раз при загрузке:
+  - код разбирается через ast и проверяется по белому списку
+    (арифметика, имена, вызовы разрешённых функций, индексы)
+  - из него собирается обычная Python-функция (def), без eval на вызов
+  - та же функция компилируется второй раз с векторными помощниками
+    NumPy — это пакетный вариант для столбцов дат
+
+Синтаксис formula_code (как в formulas.json):
+  reduce_to_single(day + month + year)             — одно выражение
+  A=day, B=month, C=sum(year_digits), D=reduce(A+B+C)  — присваивания через запятую
+  chakras[i] = digits[i] + digits[i+1]             — массив из output.count элементов
+
+Производные имена: digits / all_date_digits (цифры ДДММГГГГ), year_digits,
+letter_values[name], vowels_in_name, consonants_in_name, name (= fullname).
+
+Пример:
+  engine = FormulaEngine(kb.formulas)
+  engine.run("generational_program", day=15, month=6, year=1990)   # → 4
+  engine.get("life_path").batch(day=[15, 1], month=[6, 1], year=[1990, 2000])
+"""
+
+import ast
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from knowledge_base import LETTER_TABLE, VOWELS, reduce_to_22, reduce_to_single
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class FormulaError(ValueError):
+    """Формула не компилируется или входные данные неверны"""
+
+
+# ── Производные величины (скалярно) ───────────────────────────────
+def _date_digits(day: int, month: int, year: int) -> List[int]:
+    return [int(d) for d in f"{day:02d}{month:02d}{year:04d}"]
+
+
+def _year_digits(year: int) -> List[int]:
+    return [int(d) for d in str(year)]
+
+
+def _letters(text: str, keep=None) -> List[int]:
+    out = []
+    for ch in str(text).lower():
+        v = LETTER_TABLE.get(ch, 0)
+        if v and (keep is None or keep(ch)):
+            out.append(v)
+    return out
+
+
+class _LetterValues:
+    """letter_values[text] → числовые значения букв"""
+    def __getitem__(self, text):
+        return _letters(text)
+
+
+# имя → (нужные входы, функция)
+DERIVED: Dict[str, tuple] = {
+    "digits":             (("day", "month", "year"), _date_digits),
+    "all_date_digits":    (("day", "month", "year"), _date_digits),
+    "year_digits":        (("year",), _year_digits),
+    "name":               (("fullname",), lambda s: s),
+    "vowels_in_name":     (("fullname",), lambda s: _letters(s, lambda ch: ch in VOWELS)),
+    "consonants_in_name": (("fullname",), lambda s: _letters(s, lambda ch: ch not in VOWELS)),
+    "letter_values":      ((), _LetterValues),
+}
+
+FUNCTIONS = {
+    "reduce_to_single": reduce_to_single,
+    "reduce":           reduce_to_single,
+    "reduce_to_22":     reduce_to_22,
+    "sum":              sum,
+    "range":            range,
+}
+
+_ALLOWED_NODES = (
+    ast.Module, ast.Expr, ast.Assign, ast.Name, ast.Load, ast.Store,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.FloorDiv, ast.Mod,
+    ast.UnaryOp, ast.USub, ast.Call, ast.Subscript, ast.Constant,
+)
+
+
+# ── Векторные помощники (NumPy) ───────────────────────────────────
+@lru_cache(maxsize=None)
+def _lut(fn: Callable, size: int):
+    return np.asarray([fn(n) for n in range(size)], dtype=np.int64)
+
+
+def _vreduce(fn: Callable):
+    def reduce_array(x):
+        x = np.asarray(x, dtype=np.int64)
+        size = 1 << max(6, int(x.max(initial=0)).bit_length())
+        if size > 1 << 20:
+            return np.asarray([fn(int(v)) for v in x.ravel()], dtype=np.int64).reshape(x.shape)
+        return _lut(fn, size)[x]
+    return reduce_array
+
+
+def _vsum(x):
+    # Наборы цифр хранятся как (k, n): x[i] — i-я цифра у всех строк
+    if isinstance(x, list):
+        x = np.stack(x) if x else np.zeros((0, 0), dtype=np.int64)
+    return np.asarray(x).sum(axis=0)
+
+
+def _vdate_digits(day, month, year):
+    return np.stack([day // 10, day % 10, month // 10, month % 10,
+                     year // 1000, year // 100 % 10, year // 10 % 10, year % 10])
+
+
+def _vyear_digits(year):
+    return np.stack([year // 1000, year // 100 % 10, year // 10 % 10, year % 10])
+
+
+VECTOR_DERIVED = {"digits": _vdate_digits, "all_date_digits": _vdate_digits,
+                  "year_digits": _vyear_digits}
+VECTOR_FUNCTIONS = {
+    "reduce_to_single": _vreduce(reduce_to_single),
+    "reduce":           _vreduce(reduce_to_single),
+    "reduce_to_22":     _vreduce(reduce_to_22),
+    "sum":              _vsum,
+    "range":            range,
+}
+
+
+def _vector_ok(name: str, col) -> Any:
+    """Маска строк, для которых векторные цифры совпадают со скалярными"""
+    if name in ("day", "month"):
+        return (col >= 0) & (col <= 99)
+    if name == "year":
+        return (col >= 1000) & (col <= 9999)
+    return col >= 0
+
+
+# ── Компиляция ────────────────────────────────────────────────────
+def _split_statements(code: str) -> List[str]:
+    """Разделить formula_code по запятым верхнего уровня"""
+    parts, depth, cur = [], 0, []
+    for ch in code:
+        if ch in "([":
+            depth += 1
+        elif ch in ")]":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(cur).strip())
+            cur = []
+        else:
+            cur.append(ch)
+    parts.append("".join(cur).strip())
+    return [p for p in parts if p]
+
+
+class CompiledFormula:
+    """Одна скомпилированная формула: скалярный вызов и пакетный batch()"""
+
+    def __init__(self, spec: Dict):
+        self.spec = spec
+        self.id = spec.get("id")
+        self.code = spec["formula_code"]
+        self.inputs = [i["name"] for i in spec.get("inputs", [])]
+        self.output = spec.get("output") or {}
+        self.numeric = all(i.get("type") == "number" for i in spec.get("inputs", []))
+        source, self.derived = self._translate()
+        self.source = source
+        self._scalar = self._build(source, FUNCTIONS, {k: v[1] for k, v in DERIVED.items()})
+        self._vector = None
+        if np is not None and self.numeric and all(d in VECTOR_DERIVED for d in self.derived):
+            self._vector = self._build(source, VECTOR_FUNCTIONS, VECTOR_DERIVED)
+
+    # Разбор formula_code → исходник функции
+    def _translate(self):
+        body, assigned, arrays, last = [], [], set(), None
+        used = set()
+        for stmt in _split_statements(self.code):
+            try:
+                tree = ast.parse(stmt)
+            except SyntaxError as e:
+                raise FormulaError(f"{self.id}: синтаксис formula_code: {e.msg}")
+            for node in ast.walk(tree):
+                if not isinstance(node, _ALLOWED_NODES):
+                    raise FormulaError(f"{self.id}: недопустимо в formula_code: {type(node).__name__}")
+                if isinstance(node, ast.Call) and not (
+                        isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+                    raise FormulaError(f"{self.id}: неизвестная функция в formula_code")
+                if isinstance(node, ast.Constant) and not isinstance(node.value, int):
+                    raise FormulaError(f"{self.id}: допустимы только целые константы")
+            node = tree.body[0]
+            if isinstance(node, ast.Expr):
+                target, value, index = "_result", node.value, None
+            elif isinstance(node, ast.Assign) and len(node.targets) == 1:
+                t = node.targets[0]
+                value = node.value
+                if isinstance(t, ast.Name):
+                    target, index = t.id, None
+                elif (isinstance(t, ast.Subscript) and isinstance(t.value, ast.Name)
+                      and isinstance(t.slice, ast.Name)):
+                    target, index = t.value.id, t.slice.id
+                else:
+                    raise FormulaError(f"{self.id}: неподдерживаемое присваивание")
+            else:
+                raise FormulaError(f"{self.id}: неподдерживаемая конструкция")
+
+            local = set(assigned) | ({index} if index else set())
+            for n in ast.walk(value):
+                if isinstance(n, ast.Name) and n.id not in FUNCTIONS and n.id not in local:
+                    used.add(n.id)
+
+            expr = ast.unparse(value)
+            if index:
+                count = self.output.get("count")
+                if not isinstance(count, int):
+                    raise FormulaError(f"{self.id}: для {target}[{index}] нужен output.count")
+                body.append(f"{target} = [{expr} for {index} in range({count})]")
+                arrays.add(target)
+            else:
+                body.append(f"{target} = {expr}")
+            if target not in assigned:
+                assigned.append(target)
+            last = target
+
+        derived = []
+        for n in sorted(used):
+            if n in self.inputs:
+                continue
+            if n not in DERIVED:
+                raise FormulaError(f"{self.id}: неизвестное имя {n!r}")
+            missing = [a for a in DERIVED[n][0] if a not in self.inputs]
+            if missing:
+                raise FormulaError(f"{self.id}: для {n} нужны входы {missing}")
+            derived.append(n)
+        prologue = [f"{n} = _d_{n}({', '.join(DERIVED[n][0])})" for n in derived]
+
+        if self.output.get("type") == "object":
+            fields = self.output.get("fields") or [a for a in assigned if a not in arrays]
+            missing = [f for f in fields if f not in assigned]
+            if missing:
+                raise FormulaError(f"{self.id}: поля {missing} не вычисляются")
+            ret = "{" + ", ".join(f"{f!r}: {f}" for f in fields) + "}"
+        else:
+            ret = last
+        lines = [f"def _formula({', '.join(self.inputs)}):"]
+        lines += [f"    {l}" for l in prologue + body]
+        lines.append(f"    return {ret}")
+        return "\n".join(lines), derived
+
+    @staticmethod
+    def _build(source: str, functions: Dict, derived: Dict) -> Callable:
+        env = {"__builtins__": {}, **functions, **{f"_d_{k}": v for k, v in derived.items()}}
+        exec(compile(source, "<formula>", "exec"), env)
+        return env["_formula"]
+
+    # ── Вызов ────────────────────────────────────────────────────
+    def _coerce(self, values: Dict) -> List:
+        args = []
+        for spec in self.spec.get("inputs", []):
+            name = spec["name"]
+            if name not in values or values[name] is None:
+                raise FormulaError(f"{self.id}: не задан вход {name}")
+            v = values[name]
+            if spec.get("type") == "number":
+                try:
+                    v = int(v)
+                except (TypeError, ValueError):
+                    raise FormulaError(f"{self.id}: {name} должно быть числом")
+                if ("min" in spec and v < spec["min"]) or ("max" in spec and v > spec["max"]):
+                    raise FormulaError(f"{self.id}: {name} вне диапазона "
+                                       f"{spec.get('min', '…')}–{spec.get('max', '…')}")
+            else:
+                v = str(v)
+            args.append(v)
+        return args
+
+    def __call__(self, **values) -> Any:
+        return self._scalar(*self._coerce(values))
+
+    def batch(self, **columns: Sequence) -> List[Any]:
+        """Пакетный расчёт по столбцам. Строки с ошибкой входа
+        содержат экземпляр FormulaError на своём месте."""
+        cols = [list(columns.get(name) or []) for name in self.inputs]
+        n = len(cols[0]) if cols else 0
+        if any(len(c) != n for c in cols):
+            raise FormulaError(f"{self.id}: столбцы разной длины")
+
+        out: List[Any] = [None] * n
+        fast = np.zeros(n, dtype=bool) if np is not None else None
+        if self._vector is not None and n:
+            arrs = [np.asarray(c) for c in cols]
+            # Быстрая проверка входов — только для целочисленных столбцов
+            if all(a.dtype.kind in "iu" for a in arrs):
+                arrs = [a.astype(np.int64) for a in arrs]
+                fast[:] = True
+                for spec, a in zip(self.spec.get("inputs", []), arrs):
+                    if "min" in spec:
+                        fast &= a >= spec["min"]
+                    if "max" in spec:
+                        fast &= a <= spec["max"]
+                    fast &= _vector_ok(spec["name"], a)
+                sel = np.flatnonzero(fast)
+                if len(sel):
+                    values = self._to_rows(self._vector(*[a[sel] for a in arrs]), len(sel))
+                    for k, v in zip(sel.tolist(), values):
+                        out[k] = v
+
+        for k in range(n):
+            if fast is not None and fast[k]:
+                continue
+            try:
+                out[k] = self._scalar(*self._coerce({name: c[k] for name, c in zip(self.inputs, cols)}))
+            except FormulaError as e:
+                out[k] = e
+        return out
+
+    def _to_rows(self, res, n: int) -> List[Any]:
+        def col(x):
+            return np.broadcast_to(np.asarray(x), (n,)).tolist()
+        if isinstance(res, dict):
+            cols = {k: col(v) for k, v in res.items()}
+            return [{k: cols[k][i] for k in res} for i in range(n)]
+        if isinstance(res, list):
+            return np.stack([np.broadcast_to(np.asarray(x), (n,)) for x in res], axis=1).tolist()
+        return col(res)
+
+    def describe(self) -> Dict:
+        return {"id": self.id, "name": self.spec.get("name"), "inputs": self.spec.get("inputs", []),
+                "output": self.output, "formula_code": self.code, "vectorized": self._vector is not None}
+
+
+class FormulaEngine:
+    """Все формулы из formulas.json, скомпилированные при загрузке"""
+
+    def __init__(self, formulas: Optional[List[Dict]]):
+        self.formulas: Dict[str, CompiledFormula] = {}
+        self.errors: Dict[str, str] = {}
+        for spec in formulas if isinstance(formulas, list) else []:
+            if not spec.get("id") or not spec.get("formula_code"):
+                continue
+            try:
+                self.formulas[spec["id"]] = CompiledFormula(spec)
+            except FormulaError as e:
+                self.errors[spec["id"]] = str(e)
+                print(f"⚠ Формула не скомпилирована: {e}")
+
+    def get(self, formula_id: str) -> Optional[CompiledFormula]:
+        return self.formulas.get(formula_id)
+
+    def run(self, formula_id: str, **values) -> Any:
+        f = self.formulas.get(formula_id)
+        if f is None:
+            raise KeyError(formula_id)
+        return f(**values)
+
+    def ids(self) -> List[str]:
+        return list(self.formulas)
@@ -0,0 +1,137 @@
+"""
+НЕЧЁТКИЙ ПОИСК — опечатки и ошибки OCR через триграммный индекс
+
+Тексты базы получены OCR, в них много искажённых слов. Рядом с основным
+FTS строится триграммный индекс словаря: все слова documents_fts
+(через fts5vocab) попадают в таблицу terms, а terms_trgm — FTS5 с
+токенайзером trigram над ними. Слово запроса раскладывается на триграммы,
+индекс отдаёт кандидатов, они ранжируются по сходству строк (difflib),
+и похожие слова подставляются в обычный ранжированный запрос FTS5:
+
+  «кармичиский» → ("кармическ"* OR "кармический" OR "кармическим" …)
+
+Строится при сборке базы; для готовой базы:
+  python fuzzy.py [путь к knowledge_base.db]
+"""
+
+import os
+import sqlite3
+import sys
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import List, Tuple
+
+from text_search import exclude, keywords, quote, term_query
+
+DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.75"))
+FUZZY_TERMS = int(os.getenv("FUZZY_TERMS", "5"))   # похожих слов на слово запроса
+FUZZY_CANDIDATES = 200                              # кандидатов из триграммного индекса
+FUZZY_WORD_MIN = 4                                  # короче — только точное совпадение
+
+# Новый словарь собирается рядом (terms_new, terms_trgm_new) и подменяет
+# рабочий одной транзакцией: запросы сервера не застают таблицы удалёнными
+SCHEMA = """
+    DROP TABLE IF EXISTS terms_trgm_new;
+    DROP TABLE IF EXISTS terms_new;
+    CREATE TABLE terms_new (
+        id   INTEGER PRIMARY KEY,
+        term TEXT NOT NULL UNIQUE,
+        docs INTEGER NOT NULL,
+        cnt  INTEGER NOT NULL
+    );
+    CREATE VIRTUAL TABLE terms_trgm_new USING fts5(
+        term,
+        content='',
+        tokenize='trigram'
+    );
+"""
+
+SWAP = """
+    BEGIN IMMEDIATE;
+    DROP TABLE IF EXISTS terms_trgm;
+    DROP TABLE IF EXISTS terms;
+    ALTER TABLE terms_new RENAME TO terms;
+    ALTER TABLE terms_trgm_new RENAME TO terms_trgm;
+    COMMIT;
+"""
+
+
+def build_fuzzy_index(conn: sqlite3.Connection) -> int:
+    """(Пере)собрать словарь и триграммный индекс; вернуть число слов"""
+    conn.executescript(SCHEMA)
+    conn.execute("CREATE VIRTUAL TABLE temp.documents_vocab "
+                 "USING fts5vocab(main, documents_fts, row)")
+    conn.execute("""
+        INSERT INTO terms_new (term, docs, cnt)
+        SELECT term, doc, cnt FROM temp.documents_vocab
+        WHERE length(term) >= ? AND term NOT GLOB '*[0-9]*'
+    """, (FUZZY_WORD_MIN,))
+    conn.execute("DROP TABLE temp.documents_vocab")
+    # Без своей копии слов (content=''): слово берётся из terms по rowid
+    conn.execute("INSERT INTO terms_trgm_new (rowid, term) SELECT id, term FROM terms_new")
+    conn.commit()
+    conn.executescript(SWAP)
+    return conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+
+
+def has_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='terms_trgm'").fetchone() is not None
+
+
+def trigrams(word: str) -> set:
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def similar_terms(conn: sqlite3.Connection, word: str, limit: int = FUZZY_TERMS,
+                  min_similarity: float = FUZZY_MIN_SIMILARITY) -> List[Tuple[str, float]]:
+    """Слова базы, похожие на word: [(слово, сходство 0..1)] по убыванию"""
+    word = word.lower()
+    grams = trigrams(word)
+    if len(word) < FUZZY_WORD_MIN or not grams:
+        return []
+    rows = conn.execute("""
+        SELECT t.term, t.docs FROM terms_trgm
+        JOIN terms t ON t.id = terms_trgm.rowid
+        WHERE terms_trgm MATCH ? ORDER BY terms_trgm.rank LIMIT ?
+    """, (" OR ".join(quote(g) for g in sorted(grams)), FUZZY_CANDIDATES)).fetchall()
+    scored = []
+    matcher = SequenceMatcher(b=word, autojunk=False)
+    for term, docs in rows:
+        matcher.set_seq1(term)
+        sim = matcher.ratio()
+        if sim >= min_similarity:
+            scored.append((sim, docs, term))
+    scored.sort(reverse=True)
+    return [(term, round(sim, 3)) for sim, _, term in scored[:limit]]
+
+
+def fuzzy_terms(conn: sqlite3.Connection, text: str) -> List[str]:
+    """Выражение FTS5 на каждое слово запроса: точные формы + похожие слова базы
+    (-слова сюда не входят — их добавляет text_search.exclude)"""
+    parts = []
+    for word in keywords(text):
+        forms = [term_query(word)] + [quote(t) for t, _ in similar_terms(conn, word)]
+        forms = list(dict.fromkeys(forms))
+        parts.append(forms[0] if len(forms) == 1 else "(" + " OR ".join(forms) + ")")
+    return parts
+
+
+def fuzzy_match_query(conn: sqlite3.Connection, text: str, mode: str = "any") -> str:
+    """Запрос FTS5, где каждое слово расширено похожими словами базы
+    ("" — если искать нечего); -слова запроса исключаются"""
+    return exclude((" AND " if mode == "all" else " OR ").join(fuzzy_terms(conn, text)), text)
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not path.exists():
+        print(f"❌ База не найдена: {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(str(path))
+    n = build_fuzzy_index(conn)
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ Триграммный индекс: {n} слов ({path})")
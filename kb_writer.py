@@ -0,0 +1,212 @@
+"""
+ЗАПИСЬ В БАЗУ ЗНАНИЙ — одна очередь и один писатель
+
+Чтение (ReadOnlyPool) и запись работают с knowledge_base.db одновременно:
+  - база в режиме WAL — запись не блокирует читателей;
+  - documents_fts и passages_fts обновляются триггерами, поэтому новый
+    документ находится поиском сразу после commit;
+  - все добавления идут через одну задачу KnowledgeWriter: запросы,
+    накопившиеся в очереди, пока писалась предыдущая пачка, пишутся
+    следующей пачкой в одной транзакции (executemany).
+
+При нескольких воркерах (serve.py) писатель у каждого свой: пачки
+собираются в воркере, а транзакции разных процессов сериализует SQLite
+(BEGIN IMMEDIATE, busy_timeout).
+
+Словарь нечёткого поиска и векторы фрагментов строятся по всей базе и
+подхватывают новые документы при пересборке (векторы — при старте).
+
+Пример:
+  writer = KnowledgeWriter(DB_PATH)
+  await writer.start()
+  ids = await writer.add([{"title": "…", "content": "…", "category": "general"}])
+
+Подготовить базу, собранную раньше (триггеры FTS, WAL):
+  python kb_writer.py [путь к knowledge_base.db]
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from passages import SCHEMA as PASSAGES_SCHEMA, build_passages, has_index as has_passages
+from text_search import DOCUMENTS_FTS_TRIGGERS
+
+DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+
+KB_WRITE_BATCH = int(os.getenv("KB_WRITE_BATCH", "500"))    # документов в транзакции
+KB_WRITE_QUEUE = int(os.getenv("KB_WRITE_QUEUE", "1000"))   # запросов в очереди
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name=?", (name,)).fetchone() is not None
+
+
+def prepare_database(conn: sqlite3.Connection):
+    """WAL, хеш текста документов и триггеры синхронизации FTS
+    (для базы, собранной раньше; повторный вызов ничего не меняет)"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(documents)")}
+    if cols and "content_hash" not in cols:
+        conn.execute("ALTER TABLE documents ADD COLUMN content_hash TEXT")
+        conn.create_function("sha1_text", 1, content_hash, deterministic=True)
+        with conn:
+            conn.execute("UPDATE documents SET content_hash = sha1_text(content)")
+    if _table_exists(conn, "documents_fts"):
+        conn.executescript(DOCUMENTS_FTS_TRIGGERS)
+    if _table_exists(conn, "passages_fts"):
+        conn.executescript(PASSAGES_SCHEMA)
+
+
+class KnowledgeWriter:
+    """Единственный писатель базы знаний: очередь + пачки в одной транзакции"""
+
+    def __init__(self, db_path: Path = DB_PATH, batch: int = KB_WRITE_BATCH,
+                 max_queue: int = KB_WRITE_QUEUE):
+        self.db_path = Path(db_path)
+        self.batch = max(1, batch)
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self.batches = 0
+        self.written = 0
+        self.errors = 0
+        self.last_batch_ms = 0.0
+
+    # ── Жизненный цикл ───────────────────────────────────────────
+    def _open(self) -> sqlite3.Connection:
+        # Соединение используется только задачей писателя (через to_thread)
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        prepare_database(conn)
+        conn.execute("PRAGMA synchronous = NORMAL")     # в WAL — без потери целостности
+        return conn
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._conn = await asyncio.to_thread(self._open)
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописать очередь и закрыть соединение"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._conn.close()
+        self._conn = None
+
+    # ── Запись ───────────────────────────────────────────────────
+    async def add(self, docs: List[Dict]) -> List[int]:
+        """Добавить документы {title, content, category?, tags?}; вернуть их id.
+        При полной очереди ждёт места (backpressure)."""
+        if self._task is None:
+            raise RuntimeError("писатель базы знаний не запущен")
+        if not docs:
+            return []
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((docs, fut))
+        return await fut
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            items, size = [item], len(item[0])
+            # Всё, что накопилось, пока писалась прошлая пачка, — в эту же транзакцию
+            while size < self.batch and not self._queue.empty():
+                nxt = self._queue.get_nowait()
+                if nxt is None:
+                    stopping = True
+                    break
+                items.append(nxt)
+                size += len(nxt[0])
+            docs = [d for batch, _ in items for d in batch]
+            t0 = time.perf_counter()
+            try:
+                ids = await asyncio.to_thread(self._write, docs)
+            except Exception as e:
+                self.errors += 1
+                for _, fut in items:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            self.last_batch_ms = round((time.perf_counter() - t0) * 1000, 1)
+            self.batches += 1
+            self.written += len(ids)
+            pos = 0
+            for batch, fut in items:
+                if not fut.done():
+                    fut.set_result(ids[pos:pos + len(batch)])
+                pos += len(batch)
+
+    def _write(self, docs: List[Dict]) -> List[int]:
+        conn = self._conn
+        now = datetime.now().isoformat()
+        rows, cats = [], []
+        for d in docs:
+            title, content = d["title"], d["content"]
+            category = d.get("category") or "general"
+            categories = list(dict.fromkeys([category, *(d.get("tags") or [])]))
+            rows.append((f"manual_{title[:30].replace(' ', '_')}.txt", title,
+                         json.dumps(categories, ensure_ascii=False), content, len(content),
+                         content_hash(content), now))
+            cats.append(category)
+        with conn:
+            # Блокировка записи сразу: другой процесс (воркер, загрузка OCR) не вставит
+            # строк между MAX(id) и INSERT — новые id идут подряд после max_id
+            conn.execute("BEGIN IMMEDIATE")
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM documents").fetchone()[0]
+            # documents_fts и passages_fts обновляют триггеры
+            conn.executemany("""
+                INSERT INTO documents (filename, title, doc_type, categories, content,
+                                       content_length, content_hash, extraction_method, extracted_at)
+                VALUES (?, ?, 'txt', ?, ?, ?, ?, 'manual', ?)
+            """, rows)
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM documents WHERE id > ? ORDER BY id", (max_id,))]
+            conn.executemany("INSERT INTO category_index (category, doc_id) VALUES (?, ?)",
+                             zip(cats, ids))
+            if has_passages(conn):
+                build_passages(conn, ids)
+        return ids
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._task is not None,
+            "queue": self._queue.qsize() if self._queue else 0,
+            "batches": self.batches,
+            "written": self.written,
+            "errors": self.errors,
+            "last_batch_ms": self.last_batch_ms,
+        }
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not path.exists():
+        print(f"❌ База не найдена: {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(str(path))
+    prepare_database(conn)
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+    print(f"✅ Триггеры FTS установлены, journal_mode={mode} ({path})")
@@ -10,12 +10,42 @@
   result = kb.calculate_all(15, 6, 1990, name="Мария Иванова")
 """
 
+import hashlib
+import html
 import json
 import sqlite3
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
+from data_registry import DataRegistry, DataSnapshot, get_registry
+from db_pool import ReadOnlyPool, DEFAULT_POOL_SIZE
+from fuzzy import fuzzy_terms, has_index as has_fuzzy
+from passages import has_index as has_passages
+from text_search import exclude, match_query
+from vectors import rrf
+
 DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+
+# Поиск: веса столбцов bm25 (filename, title, content) — совпадение
+# в заголовке весит больше, чем в тексте; длина фрагмента в словах
+BM25_WEIGHTS = (2.0, 10.0, 1.0)
+SNIPPET_TOKENS = 32
+# Гибридный поиск: кандидатов из FTS и из векторов для слияния (RRF)
+HYBRID_DEPTH = 50
+_BM25_RANK = f"bm25({', '.join(map(str, BM25_WEIGHTS))})"
+# Метки подсветки внутри SQL (экранируются отдельно от текста)
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+
+
+def _marked(text: Optional[str]) -> Dict[str, str]:
+    """Текст с метками подсветки → простой текст и безопасный HTML с <mark>"""
+    text = (text or "").replace("\n", " ")
+    plain = text.replace(_MARK_OPEN, "").replace(_MARK_CLOSE, "")
+    markup = (html.escape(text).replace(_MARK_OPEN, "<mark>")
+              .replace(_MARK_CLOSE, "</mark>"))
+    return {"plain": " ".join(plain.split()), "html": " ".join(markup.split())}
+
 
 # Таблица букв русского алфавита (нумерология)
 LETTER_TABLE_RU = {
@@ -35,6 +65,9 @@ LETTER_TABLE = {**LETTER_TABLE_RU, **LETTER_TABLE_EN}
 # Мастер-числа — не сводятся
 MASTER_NUMBERS = {11, 22, 33}
 
+# Гласные (для числа души; остальные буквы таблицы — согласные)
+VOWELS = set('аеёиоуыэюя') | set('aeiou')
+
 # Чакры
 CHAKRA_NAMES = {
     1: "Муладхара (корневая) — безопасность, выживание",
@@ -54,42 +87,101 @@ def reduce_to_single(n: int) -> int:
     return n
 
 
+def reduce_to_22(n: int) -> int:
+    """Свести число к аркану 1–22 (сумма цифр, пока больше 22)"""
+    while n > 22:
+        n = sum(int(d) for d in str(n))
+    return n
+
+
+# Показатели calculate_all, у которых есть meaning / formula
+RESULT_SECTIONS = ("birth_number", "life_path", "financial_channel",
+                   "chakras", "personal_year", "destiny")
+
+
+def compact_result(result: Dict) -> Dict:
+    """Компактный calculate_all: вместо meaning/formula — meaning_id/formula_id.
+
+    Сами тексты отдаются один раз через get_dictionary() (/api/dictionary).
+    meaning_id — ключ number_meanings (значение показателя)."""
+    out = dict(result)
+    for key in RESULT_SECTIONS:
+        sec = result.get(key)
+        if not isinstance(sec, dict):
+            continue
+        c = {k: v for k, v in sec.items() if k not in ("meaning", "formula")}
+        if "meaning" in sec:
+            c["meaning_id"] = str(sec.get("value"))
+        if "formula" in sec:
+            c["formula_id"] = (sec["formula"] or {}).get("id")
+        out[key] = c
+    return out
+
+
 class HybridKnowledgeBase:
     """Главный класс — гибридная база знаний"""
 
-    def __init__(self):
-        self.formulas       = self._load_json('formulas.json')
-        self.practices      = self._load_json('practices.json')
-        self.algorithms     = self._load_json('algorithms.json')
-        self.number_meanings = self._load_json('number_meanings.json')
-        self.master_index   = self._load_json('master_index.json')
-        
-        # Нормализация number_meanings
-        if isinstance(self.number_meanings, list):
-            self.number_meanings = {str(item.get('value','')): item 
-                                    for item in self.number_meanings}
-        
-        self.db_conn   = None
-        self.db_cursor = None
-        self._connect_db()
+    def __init__(self, db_path: Path = DB_PATH, pool_size: int = DEFAULT_POOL_SIZE,
+                 date_table=None, vectors=None, registry: Optional[DataRegistry] = None):
+        # Формулы, практики, значения чисел — общий реестр (data_registry),
+        # перезагружается без пересоздания базы знаний
+        self.registry = registry or get_registry()
 
-    # ── Загрузка ──────────────────────────────────────────────────
-    def _load_json(self, filename: str) -> Any:
-        p = DATA_DIR / filename
-        if not p.exists():
-            return {}
-        with open(p, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # Предрасчитанная таблица дат (date_table.DateTable), опционально
+        self.date_table = date_table
+
+        # Векторы фрагментов для гибридного поиска (vectors.VectorIndex), опционально
+        self.vectors = vectors
+
+        self.pool: Optional[ReadOnlyPool] = None
+        self._connect_db(Path(db_path), pool_size)
+
+    # ── Справочные данные (текущий снимок реестра) ───────────────
+    @property
+    def data(self) -> DataSnapshot:
+        return self.registry.current
+
+    @property
+    def formulas(self) -> List[Dict]:
+        return self.data.formulas
+
+    @property
+    def practices(self) -> List[Dict]:
+        return self.data.practices
 
-    def _connect_db(self):
-        db_path = DATA_DIR / "knowledge_base.db"
+    @property
+    def algorithms(self) -> Any:
+        return self.data.algorithms
+
+    @property
+    def number_meanings(self) -> Dict[str, Dict]:
+        return self.data.number_meanings
+
+    @property
+    def master_index(self) -> Any:
+        return self.data.master_index
+
+    @property
+    def formula_engine(self):
+        """Формулы из formulas.json, скомпилированные в функции (formula_engine)"""
+        return self.data.formula_engine
+
+    # ── Загрузка ──────────────────────────────────────────────────
+    def _connect_db(self, db_path: Path, pool_size: int):
         if db_path.exists():
             try:
-                self.db_conn = sqlite3.connect(str(db_path))
-                self.db_conn.row_factory = sqlite3.Row
-                self.db_cursor = self.db_conn.cursor()
+                self.pool = ReadOnlyPool(db_path, size=pool_size)
+                # Проверяем, что БД открывается
+                with self.pool.connection() as conn:
+                    conn.execute("SELECT 1")
             except Exception as e:
                 print(f"⚠ БД недоступна: {e}")
+                self.pool = None
+
+    def close(self):
+        """Закрыть пул соединений к SQLite"""
+        if self.pool:
+            self.pool.close()
 
     # ── Получение интерпретации числа ─────────────────────────────
     def get_meaning(self, n: int) -> Dict:
@@ -109,11 +201,20 @@ class HybridKnowledgeBase:
         }
 
     def get_formula(self, formula_id: str) -> Optional[Dict]:
-        if isinstance(self.formulas, list):
-            for f in self.formulas:
-                if f.get('id') == formula_id:
-                    return f
-        return None
+        return self.data.formula(formula_id)
+
+    def get_dictionary(self) -> Dict:
+        """Справочник для компактных ответов: meaning_id → meaning, formula_id → formula"""
+        data = self.data
+        return {
+            "meanings": {k: self.get_meaning(int(k)) for k in data.number_meanings
+                         if str(k).isdigit()},
+            "formulas": dict(data.formulas_by_id),
+        }
+
+    def run_formula(self, formula_id: str, **inputs) -> Any:
+        """Рассчитать любую формулу из formulas.json по id (см. formula_engine)"""
+        return self.formula_engine.run(formula_id, **inputs)
 
     # ── Расчёты ───────────────────────────────────────────────────
     def calculate_birth_number(self, day: int) -> Dict:
@@ -141,8 +242,9 @@ class HybridKnowledgeBase:
         """Путь жизни: ДД + ММ + ГГГГ → однозначное"""
         total = day + month + year
         n = reduce_to_single(total)
-        
-        year_digits = sum(int(d) for d in str(year))
+        return self._life_path_result(day, month, year, total, n)
+
+    def _life_path_result(self, day: int, month: int, year: int, total: int, n: int) -> Dict:
         steps = f"{day} + {month} + {year} = {total} → {n}"
         
         meaning = self.get_meaning(n)
@@ -178,12 +280,11 @@ class HybridKnowledgeBase:
 
     def calculate_financial_channel(self, day: int, month: int, year: int) -> Dict:
         """Финансовый канал: A=день, B=месяц, C=цифры года, D=A+B+C→однозначное"""
-        A = day
-        B = month
         C = sum(int(d) for d in str(year))
-        total = A + B + C
-        D = reduce_to_single(total)
-        
+        total = day + month + C
+        return self._financial_channel_result(day, month, C, total, reduce_to_single(total))
+
+    def _financial_channel_result(self, A: int, B: int, C: int, total: int, D: int) -> Dict:
         meaning = self.get_meaning(D)
         return {
             "value": D,
@@ -198,7 +299,9 @@ class HybridKnowledgeBase:
         """Баланс чакр по цифрам даты рождения"""
         date_str = f"{day:02d}{month:02d}{year:04d}"
         digits = [int(d) for d in date_str]
-        
+        return self._chakras_result(date_str, digits)
+
+    def _chakras_result(self, date_str: str, digits: List[int]) -> Dict:
         chakras = {}
         for i in range(1, 8):
             if i + 1 <= len(digits):
@@ -229,15 +332,27 @@ class HybridKnowledgeBase:
             "meaning": meaning,
         }
 
-    def calculate_all(self, day: int, month: int, year: int, name: str = None) -> Dict:
+    def calculate_all(self, day: int, month: int, year: int, name: str = None,
+                      current_year: int = None) -> Dict:
         """Полный расчёт всех ключевых показателей"""
+        row = self.date_table.lookup(day, month, year) if self.date_table is not None else None
+        if row is not None:
+            # Дата есть в таблице — только оформляем готовые числа
+            life_path = self._life_path_result(day, month, year, row["life_total"], row["life"])
+            financial = self._financial_channel_result(day, month, row["year_sum"],
+                                                       row["fin_total"], row["fin"])
+            chakras = self._chakras_result(f"{day:02d}{month:02d}{year:04d}", row["digits"])
+        else:
+            life_path = self.calculate_life_path(day, month, year)
+            financial = self.calculate_financial_channel(day, month, year)
+            chakras = self.calculate_chakras(day, month, year)
         result = {
             "input": {"day": day, "month": month, "year": year, "name": name},
             "birth_number":      self.calculate_birth_number(day),
-            "life_path":         self.calculate_life_path(day, month, year),
-            "financial_channel": self.calculate_financial_channel(day, month, year),
-            "chakras":           self.calculate_chakras(day, month, year),
-            "personal_year":     self.calculate_personal_year(day, month),
+            "life_path":         life_path,
+            "financial_channel": financial,
+            "chakras":           chakras,
+            "personal_year":     self.calculate_personal_year(day, month, current_year),
         }
         if name and name.strip():
             result["destiny"] = self.calculate_destiny_number(name.strip())
@@ -246,42 +361,255 @@ class HybridKnowledgeBase:
         return result
 
     # ── Поиск по базе ────────────────────────────────────────────
-    def search_documents(self, query: str, limit: int = 10) -> List[Dict]:
-        """Полнотекстовый поиск по PDF-документам"""
-        if not self.db_cursor:
+    @staticmethod
+    def _match_plans(conn, query: str, fuzzy: Optional[bool] = None):
+        """Запросы FTS5 по очереди, пока что-то не найдётся:
+        (запрос, запрос для фрагментов, нечёткий ли).
+        fuzzy=None — точный по всем словам, затем нечёткий (все слова,
+        потом любое); True — сразу нечёткий; False — только точный.
+        Нечёткий запрос включает и точные формы слов."""
+        use_fuzzy = fuzzy is not False and has_fuzzy(conn)
+        if fuzzy is not True or not use_fuzzy:
+            match = match_query(query, "all")
+            if match:
+                yield match, match_query(query, "any"), False
+        if use_fuzzy:
+            try:
+                terms = fuzzy_terms(conn, query)
+            except sqlite3.Error:
+                terms = []          # словарь пересобирается — только точный поиск
+            if terms:
+                # -слова исключаются и в нечётком поиске
+                any_match = exclude(" OR ".join(terms), query)
+                yield exclude(" AND ".join(terms), query), any_match, True
+                yield any_match, any_match, True
+        elif fuzzy is not True:
+            match = match_query(query, "any")
+            if match:
+                yield match, match, False
+
+    def search_documents(self, query: str, limit: int = 10,
+                         category: Optional[str] = None,
+                         fuzzy: Optional[bool] = None,
+                         hybrid: Optional[bool] = None) -> List[Dict]:
+        """Полнотекстовый поиск по PDF-документам.
+
+        Ранжирование — bm25 с весами столбцов (BM25_WEIGHTS), в каждом
+        результате фрагмент текста с совпадениями: snippet (простой текст),
+        snippet_html и title_html (экранированный HTML с <mark>).
+        category — фильтр через category_index прямо в запросе FTS.
+        Запрос переводится в FTS5 со стеммингом (text_search.match_query):
+        сначала все слова, если ничего нет — любое из них, затем слова с
+        опечатками через триграммный индекс (fuzzy.py; см. _match_plans).
+        Фрагмент берётся из лучшего куска документа в индексе passages —
+        snippet() по целому документу в десятки КБ заметно дороже.
+
+        Если загружены векторы (self.vectors) и hybrid не False, к bm25
+        добавляется векторный поиск по фрагментам: по HYBRID_DEPTH кандидатов
+        из обоих сливаются через RRF, score — итоговый балл слияния, bm25 и
+        vector — исходные баллы (None, если документ найден только одним)."""
+        if not self.pool:
             return self._search_json(query)
-        try:
-            self.db_cursor.execute("""
-                SELECT d.id, d.filename, d.title, d.content_length
-                FROM documents_fts f
-                JOIN documents d ON f.rowid = d.id
-                WHERE f MATCH ? ORDER BY rank LIMIT ?
-            """, (query, limit))
-            rows = self.db_cursor.fetchall()
-            return [{"id": r[0], "filename": r[1], "title": r[2], 
-                     "content_length": r[3]} for r in rows]
-        except Exception:
-            # Fallback
+        vectors = self.vectors if hybrid is not False else None
+        depth = max(limit, HYBRID_DEPTH) if vectors else limit
+        cat_join = ("JOIN category_index c ON c.doc_id = d.id AND c.category = ?"
+                    if category else "")
+        cat_args = (category,) if category else ()
+        rows, snippet_match, is_fuzzy = [], "", False
+        with self.pool.connection() as conn:
+            for match, snippet_match, is_fuzzy in self._match_plans(conn, query, fuzzy):
+                try:
+                    rows = conn.execute(f"""
+                        SELECT d.id, d.filename, d.title, d.content_length, d.categories,
+                               documents_fts.rank, highlight(documents_fts, 1, ?, ?)
+                        FROM documents_fts
+                        JOIN documents d ON documents_fts.rowid = d.id
+                        {cat_join}
+                        WHERE documents_fts MATCH ? AND documents_fts.rank MATCH ?
+                        ORDER BY documents_fts.rank LIMIT ?
+                    """, (_MARK_OPEN, _MARK_CLOSE, *cat_args, match, _BM25_RANK,
+                          depth)).fetchall()
+                except sqlite3.Error as e:
+                    # Индекс пересобирается или FTS5 не принял запрос — следующий план
+                    print(f"⚠ Поиск '{match}': {e}")
+                    rows = []
+                if rows:
+                    break
+            by_id = {r[0]: r for r in rows}
+            vec, texts = {}, {}
+            if vectors:
+                vec = {h[0]: h for h in vectors.search_docs(query, depth)}
+                if category and vec:
+                    allowed = {d for (d,) in conn.execute(
+                        f"SELECT doc_id FROM category_index WHERE category = ? "
+                        f"AND doc_id IN ({','.join('?' * len(vec))})", (category, *vec))}
+                    vec = {d: h for d, h in vec.items() if d in allowed}
+            if vec:
+                fused = rrf(list(by_id), list(vec))
+                ranked = sorted(fused, key=fused.get, reverse=True)[:limit]
+                # Найденные только по векторам — без подсветки, фрагмент из лучшего куска
+                only_vec = [d for d in ranked if d not in by_id]
+                if only_vec:
+                    marks = ",".join("?" * len(only_vec))
+                    by_id.update({r[0]: r for r in conn.execute(f"""
+                        SELECT id, filename, title, content_length, categories, NULL, title
+                        FROM documents WHERE id IN ({marks})
+                    """, only_vec)})
+                    texts = dict(conn.execute(
+                        f"SELECT id, content FROM passages WHERE id IN ({marks})",
+                        [vec[d][1] for d in only_vec]))
+            else:
+                fused, ranked, only_vec = {}, list(by_id)[:limit], []
             try:
-                self.db_cursor.execute("""
-                    SELECT id, filename, title, content_length FROM documents
-                    WHERE content LIKE ? OR title LIKE ? LIMIT ?
-                """, (f"%{query}%", f"%{query}%", limit))
-                return [dict(r) for r in self.db_cursor.fetchall()]
-            except Exception:
-                return []
+                snippets = self._snippets(conn, snippet_match,
+                                          [d for d in ranked if d not in only_vec])
+            except sqlite3.Error:
+                snippets = {}       # без фрагментов, но с результатами
+        for d in only_vec:
+            words = texts.get(vec[d][1], "").split()
+            snippets[d] = " ".join(words[:SNIPPET_TOKENS]) + ("…" if len(words) > SNIPPET_TOKENS else "")
+        results = []
+        for doc_id in ranked:
+            r = by_id[doc_id]
+            snippet, title = _marked(snippets.get(doc_id)), _marked(r[6])
+            bm25 = round(-r[5], 6) if r[5] is not None else None
+            results.append({
+                "id": r[0], "filename": r[1], "title": r[2], "content_length": r[3],
+                "categories": json.loads(r[4] or "[]"),
+                "score": round(fused[doc_id], 6) if fused else bm25,
+                "bm25": bm25,
+                "vector": vec[doc_id][2] if doc_id in vec else None,
+                "snippet": snippet["plain"],
+                "snippet_html": snippet["html"],
+                "title_html": title["html"],
+                "fuzzy": is_fuzzy and doc_id not in only_vec,
+            })
+        return results
+
+    @staticmethod
+    def _snippets(conn, match: str, doc_ids: List[int]) -> Dict[int, str]:
+        """Фрагмент с подсветкой для каждого документа — из лучшего куска
+        (индекс passages); без индекса — snippet() по документу целиком"""
+        if not doc_ids:
+            return {}
+        marks = ",".join("?" * len(doc_ids))
+        if has_passages(conn):
+            # Сначала лучший кусок каждого документа (без snippet), потом
+            # snippet() только для них
+            best = {}
+            for pid, doc_id in conn.execute(f"""
+                SELECT p.id, p.doc_id
+                FROM passages_fts JOIN passages p ON p.id = passages_fts.rowid
+                WHERE passages_fts MATCH ? AND p.doc_id IN ({marks})
+                ORDER BY passages_fts.rank
+            """, (match, *doc_ids)):
+                best.setdefault(doc_id, pid)
+            pids = {pid: doc_id for doc_id, pid in best.items()}
+            rows = [(pids[pid], text) for pid, text in conn.execute(f"""
+                SELECT rowid, snippet(passages_fts, 0, ?, ?, '…', {SNIPPET_TOKENS})
+                FROM passages_fts WHERE passages_fts MATCH ?
+                AND rowid IN ({",".join("?" * len(pids))})
+            """, (_MARK_OPEN, _MARK_CLOSE, match, *pids))]
+        else:
+            rows = conn.execute(f"""
+                SELECT rowid, snippet(documents_fts, -1, ?, ?, '…', {SNIPPET_TOKENS})
+                FROM documents_fts WHERE documents_fts MATCH ? AND rowid IN ({marks})
+            """, (_MARK_OPEN, _MARK_CLOSE, match, *doc_ids)).fetchall()
+        out = {}
+        for doc_id, text in rows:
+            out.setdefault(doc_id, text)
+        return out
+
+    def category_counts(self, query: Optional[str] = None) -> Dict[str, int]:
+        """Число документов по категориям — всех или найденных по query
+        (одним GROUP BY, для фильтров поиска)"""
+        if not self.pool:
+            return {}
+        with self.pool.connection() as conn:
+            if query:
+                rows = []
+                for match, _, _ in self._match_plans(conn, query):
+                    rows = conn.execute("""
+                        SELECT c.category, COUNT(DISTINCT c.doc_id) AS n
+                        FROM documents_fts
+                        JOIN category_index c ON c.doc_id = documents_fts.rowid
+                        WHERE documents_fts MATCH ?
+                        GROUP BY c.category ORDER BY n DESC, c.category
+                    """, (match,)).fetchall()
+                    if rows:
+                        break
+            else:
+                rows = conn.execute("""
+                    SELECT category, COUNT(DISTINCT doc_id) AS n FROM category_index
+                    GROUP BY category ORDER BY n DESC, category
+                """).fetchall()
+        return {r[0]: r[1] for r in rows}
 
     def get_document_content(self, doc_id: int) -> Optional[str]:
         """Получить полный текст документа по ID"""
-        if not self.db_cursor:
+        if not self.pool:
             return None
         try:
-            self.db_cursor.execute("SELECT content FROM documents WHERE id=?", (doc_id,))
-            row = self.db_cursor.fetchone()
+            with self.pool.connection() as conn:
+                row = conn.execute("SELECT content FROM documents WHERE id=?",
+                                   (doc_id,)).fetchone()
             return row[0] if row else None
         except Exception:
             return None
 
+    def get_document_range(self, doc_id: int, offset: int = 0, limit: Optional[int] = None,
+                           passage: Optional[int] = None, passages: int = 1) -> Optional[Dict]:
+        """Часть текста документа — символы [offset, offset + limit)
+        (offset < 0 — от конца) или фрагменты passage … passage + passages - 1 индекса passages.
+
+        Читается только нужный кусок (substr в SQLite). content_hash — хеш
+        всего текста, для ETag. None — документа нет; ValueError — нет
+        такого фрагмента."""
+        if not self.pool:
+            return None
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT title, length(content) FROM documents WHERE id=?",
+                               (doc_id,)).fetchone()
+            if row is None:
+                return None
+            title, total = row[0], row[1]
+            n_passages = (conn.execute("SELECT COUNT(*) FROM passages WHERE doc_id=?",
+                                       (doc_id,)).fetchone()[0]
+                          if has_passages(conn) else 0)
+            if passage is not None:
+                span = conn.execute("""
+                    SELECT MIN(start), MAX(end) FROM passages
+                    WHERE doc_id = ? AND seq BETWEEN ? AND ?
+                """, (doc_id, passage, passage + passages - 1)).fetchone() if n_passages else None
+                if not span or span[0] is None:
+                    raise ValueError(f"У документа {n_passages} фрагментов")
+                start, end = span
+            else:
+                start = min(offset if offset >= 0 else max(0, total + offset), total)
+                end = total if limit is None else min(total, start + limit)
+            content = conn.execute("SELECT substr(content, ?, ?) FROM documents WHERE id=?",
+                                   (start + 1, end - start, doc_id)).fetchone()[0]
+            digest = self._content_hash(conn, doc_id)
+        return {
+            "id": doc_id, "title": title, "content": content,
+            "offset": start, "end": end, "total_length": total,
+            "next_offset": end if end < total else None,
+            "passages": n_passages, "content_hash": digest,
+        }
+
+    @staticmethod
+    def _content_hash(conn, doc_id: int) -> str:
+        """Хеш текста документа (столбец content_hash; в старой базе — считается)"""
+        try:
+            row = conn.execute("SELECT content_hash FROM documents WHERE id=?",
+                               (doc_id,)).fetchone()
+            if row and row[0]:
+                return row[0]
+        except sqlite3.OperationalError:
+            pass
+        content = conn.execute("SELECT content FROM documents WHERE id=?", (doc_id,)).fetchone()[0]
+        return hashlib.sha1((content or "").encode("utf-8")).hexdigest()
+
     def _search_json(self, query: str) -> List[Dict]:
         """Поиск в JSON когда SQLite недоступен"""
         results = []
@@ -299,22 +627,21 @@ class HybridKnowledgeBase:
 
     def get_all_practices(self) -> List[Dict]:
         """Список всех практик"""
-        if isinstance(self.practices, list):
-            return self.practices
-        return []
+        return self.practices
 
     def get_db_stats(self) -> Dict:
         """Статистика базы знаний"""
         stats = {
-            "formulas": len(self.formulas) if isinstance(self.formulas, list) else 0,
-            "practices": len(self.practices) if isinstance(self.practices, list) else 0,
+            "formulas": len(self.formulas),
+            "practices": len(self.practices),
             "number_meanings": len(self.number_meanings),
-            "db_connected": self.db_conn is not None,
+            "db_connected": self.pool is not None,
         }
-        if self.db_cursor:
+        if self.pool:
             try:
-                self.db_cursor.execute("SELECT COUNT(*) FROM documents")
-                stats["documents"] = self.db_cursor.fetchone()[0]
+                with self.pool.connection() as conn:
+                    stats["documents"] = conn.execute(
+                        "SELECT COUNT(*) FROM documents").fetchone()[0]
             except Exception:
                 stats["documents"] = 0
         return stats
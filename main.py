@@ -4,19 +4,29 @@ main.py — единая точка входа
 Нумерология и Ансестология Knowledge Base v3.0
 
 На Render запускается один процесс. Telegram-бот встроен через webhook
-прямо в FastAPI — отдельный процесс не нужен.
+прямо в FastAPI — отдельный процесс не нужен. WEB_WORKERS=N — N воркеров
+с общими предзагруженными данными (serve.py).
 
 Переменные окружения (Render → Environment):
     TELEGRAM_BOT_TOKEN  — токен от @BotFather
     WEBHOOK_URL         — https://ВАШ-СЕРВИС.onrender.com  (без слэша в конце)
     GEMINI_API_KEY      — ключ Google Gemini (опционально)
     GROQ_API_KEY        — ключ Groq (опционально)
+    WEB_WORKERS         — число воркеров (по умолчанию 1)
 """
 
+import asyncio
+import gzip
+import hashlib
+import hmac
 import json
 import logging
 import os
+import re
+import signal
 import sys
+import threading
+import time
 import webbrowser
 from pathlib import Path
 from typing import List, Optional
@@ -27,11 +37,17 @@ try:
 except ImportError:
     pass
 
+# Читают настройки (WEB_WORKERS, TG_WORKERS …) при импорте — только после load_dotenv()
+import serve
+from data_registry import get_registry
+from tg_queue import REJECTED, UpdateQueue
+
 try:
     from fastapi import FastAPI, HTTPException, Query, Request
     from fastapi.middleware.cors import CORSMiddleware
     from fastapi.staticfiles import StaticFiles
-    from fastapi.responses import JSONResponse, PlainTextResponse
+    from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+    from starlette.concurrency import run_in_threadpool
     from starlette.middleware.base import BaseHTTPMiddleware
     from starlette.requests import Request as StarletteRequest
     from pydantic import BaseModel
@@ -48,9 +64,21 @@ DB_PATH  = DATA_DIR / "knowledge_base.db"
 
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+BULK_MAX_CLIENTS = int(os.getenv("BULK_MAX_CLIENTS", "50000"))
+BULK_STREAM_CHUNK = int(os.getenv("BULK_STREAM_CHUNK", "2000"))
+KB_BULK_MAX = int(os.getenv("KB_BULK_MAX", "1000"))
+DATE_TABLE      = os.getenv("DATE_TABLE", "0").lower() in ("1", "true", "yes", "on")
+DATE_TABLE_PATH = Path(os.getenv("DATE_TABLE_PATH", str(DATA_DIR / "date_table_v1.npy")))
+VECTOR_SEARCH      = os.getenv("VECTOR_SEARCH", "1").lower() in ("1", "true", "yes", "on")
+VECTOR_INDEX_PATH  = Path(os.getenv("VECTOR_INDEX_PATH", str(DATA_DIR / "vectors_v1")))
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "5"))   # сек; 0 — не следить
+ADMIN_TOKEN         = os.getenv("ADMIN_TOKEN", "")                  # для /api/admin/*
 
 WEBHOOK_URL    = os.getenv("WEBHOOK_URL", "").rstrip("/")
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+TG_EDIT_INTERVAL = float(os.getenv("TG_EDIT_INTERVAL", "1.0"))  # сек между правками ответа
+TG_MESSAGE_LIMIT = 4000                                          # лимит Telegram — 4096
 WEBHOOK_PATH   = f"/webhook/{TELEGRAM_TOKEN}" if TELEGRAM_TOKEN else "/webhook/disabled"
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
@@ -80,26 +108,46 @@ class PWAHeaders(BaseHTTPMiddleware):
 
 app.add_middleware(PWAHeaders)
 
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse, который читает тело запроса во время ответа.
+
+    Обычный StreamingResponse параллельно слушает receive() ради
+    http.disconnect и «съедает» куски тела запроса. Здесь тело читает
+    сам генератор через request.stream(), а обрыв соединения приходит
+    оттуда же как ClientDisconnect."""
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
 # ── Telegram Bot (webhook) ────────────────────────────────────────
 _tg_app = None
+_bot_state = None   # bot_state.BotStateStore — диалоги и данные пользователей бота
+_tg_updates = None  # tg_queue.UpdateQueue — очередь обновлений webhook
+_worker_slot = None # номер воркера в режиме WEB_WORKERS > 1 (serve.py)
+_writer = None      # kb_writer.KnowledgeWriter — писатель базы знаний (свой в каждом воркере)
+_data_watch = None  # задача перезагрузки справочных данных при изменении файлов
 
 def _build_telegram_app():
-    global _tg_app
+    global _tg_app, _bot_state
     if not TELEGRAM_TOKEN or TELEGRAM_TOKEN == "YOUR_BOT_TOKEN_HERE":
         log.warning("TELEGRAM_BOT_TOKEN не задан — бот отключён")
         return None
     try:
         from telegram import Update
+        from telegram.error import BadRequest
         from telegram.ext import (
             Application, CommandHandler, MessageHandler,
-            ContextTypes, filters, ConversationHandler
+            ContextTypes, filters
         )
-        from knowledge_base import HybridKnowledgeBase
-        from ai_consultant import AIConsultant
-
-        kb_i = HybridKnowledgeBase()
-        ai_i = AIConsultant()
+        from bot_state import BotStateStore
+        kb_i = get_kb()
+        ai_i = get_ai()
+        # Состояние диалогов — в SQLite, общее для всех воркеров (bot_state.py)
+        state = _bot_state = BotStateStore()
         WAITING_DATE = 1
+        END = None
 
         async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             stats = kb_i.get_db_stats()
@@ -128,7 +176,8 @@ def _build_telegram_app():
                 "С именем: `15 06 1990 Мария Иванова`",
                 parse_mode="Markdown"
             )
-            return WAITING_DATE
+            await state.set_state(update.effective_chat.id, update.effective_user.id,
+                                  "calc", WAITING_DATE)
 
         async def calc_process(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parts = update.message.text.strip().split(None, 3)
@@ -169,9 +218,23 @@ def _build_telegram_app():
                             lines.append(f"🔑 {', '.join(m['keywords'])}")
                         lines.append("")
                 await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
+                # Числа последнего расчёта — контекст для /ask
+                profile = {key: {"value": data[key]["value"]} for key, _ in sections
+                           if (data.get(key) or {}).get("value")}
+                user_data = await state.get_user_data(update.effective_user.id)
+                await state.set_user_data(update.effective_user.id,
+                                          {**user_data, "profile": profile})
             except Exception as e:
                 await update.message.reply_text(f"❌ Ошибка: {e}")
-            return ConversationHandler.END
+            return END
+
+        async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            """Текст вне команд — шаг диалога, если он начат (в любом процессе)"""
+            chat_id, user_id = update.effective_chat.id, update.effective_user.id
+            if await state.get_state(chat_id, user_id, "calc") != WAITING_DATE:
+                return
+            if await calc_process(update, context) == END:
+                await state.end(chat_id, user_id, "calc")
 
         async def search(update: Update, context: ContextTypes.DEFAULT_TYPE):
             query = " ".join(context.args)
@@ -186,23 +249,50 @@ def _build_telegram_app():
             for r in results:
                 lines.append(f"📄 *{r.get('title', 'Без названия')}*")
                 if r.get("snippet"):
-                    lines.append(f"_{r['snippet']}_")
+                    # Фрагмент OCR-текста может содержать символы разметки
+                    lines.append("_" + r["snippet"].translate(str.maketrans("", "", "_*`[")) + "_")
                 lines.append("")
             await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
+        async def edit(msg, text: str, markdown: bool = False):
+            try:
+                await msg.edit_text(text, parse_mode="Markdown" if markdown else None)
+            except BadRequest as e:
+                # Незакрытая разметка в ответе LLM — показываем как есть
+                if markdown and "not modified" not in str(e):
+                    await msg.edit_text(text)
+
         async def ask_ai(update: Update, context: ContextTypes.DEFAULT_TYPE):
             question = " ".join(context.args)
             if not question:
                 await update.message.reply_text("Использование: /ask <вопрос>")
                 return
-            await update.message.reply_text("🤔 Думаю...")
-            result = ai_i.ask(question)
-            answer   = result.get("answer", "Не удалось получить ответ")
-            provider = result.get("provider", "")
-            text = f"💬 {answer[:3500]}"
-            if provider:
+            # Ответ дописывается в сообщение-заглушку по мере генерации
+            msg = await update.message.reply_text("🤔 Думаю...")
+            text, shown, last, provider = "💬 ", "", 0.0, ""
+            profile = (await state.get_user_data(update.effective_user.id)).get("profile")
+            async for chunk in ai_i.ask_stream(question, user_data=profile):
+                if chunk.get("done"):
+                    provider = chunk.get("provider") or ""
+                    continue
+                text += chunk["delta"]
+                # Длинный ответ — закрываем сообщение и продолжаем в следующем
+                while len(text) > TG_MESSAGE_LIMIT:
+                    cut = text.rfind("\n", 0, TG_MESSAGE_LIMIT)
+                    cut = cut if cut > 0 else TG_MESSAGE_LIMIT
+                    await edit(msg, text[:cut])
+                    text = text[cut:].lstrip("\n")
+                    msg = await update.message.reply_text("…")
+                    shown = ""
+                now = time.monotonic()
+                if text != shown and now - last >= TG_EDIT_INTERVAL:
+                    await edit(msg, text + " ▌")
+                    shown, last = text, now
+            if text == "💬 ":
+                text += "Не удалось получить ответ"
+            if provider and len(text) < TG_MESSAGE_LIMIT - 60:
                 text += f"\n\n_Источник: {provider}_"
-            await update.message.reply_text(text, parse_mode="Markdown")
+            await edit(msg, text, markdown=True)
 
         async def practices_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pp = kb_i.get_all_practices()
@@ -216,19 +306,20 @@ def _build_telegram_app():
             await update.message.reply_text("\n".join(lines), parse_mode="Markdown")
 
         async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            chat_id, user_id = update.effective_chat.id, update.effective_user.id
+            if await state.get_state(chat_id, user_id, "calc") is None:
+                return
+            await state.end(chat_id, user_id, "calc")
             await update.message.reply_text("Отменено.")
-            return ConversationHandler.END
 
         # .updater(None) — отключаем Updater, он нужен только для polling.
         # При webhook-режиме Updater не используется и вызывает ошибки совместимости.
         tg = Application.builder().token(TELEGRAM_TOKEN).updater(None).build()
         tg.add_handler(CommandHandler("start", start))
         tg.add_handler(CommandHandler("help",  help_cmd))
-        tg.add_handler(ConversationHandler(
-            entry_points=[CommandHandler("calc", calc_start)],
-            states={WAITING_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, calc_process)]},
-            fallbacks=[CommandHandler("cancel", cancel)],
-        ))
+        tg.add_handler(CommandHandler("calc",   calc_start))
+        tg.add_handler(CommandHandler("cancel", cancel))
+        tg.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
         tg.add_handler(CommandHandler("search",    search))
         tg.add_handler(CommandHandler("ask",       ask_ai))
         tg.add_handler(CommandHandler("practices", practices_cmd))
@@ -245,48 +336,270 @@ def _build_telegram_app():
 
 @app.on_event("startup")
 async def startup():
-    global _tg_app
+    global _tg_app, _tg_updates, _writer, _data_watch
+    if DB_PATH.exists():
+        # До открытия пула чтения: переводит базу в WAL и ставит триггеры FTS
+        from kb_writer import KnowledgeWriter
+        _writer = KnowledgeWriter(DB_PATH)
+        await _writer.start()
+    kb = get_kb()
+    if DATA_WATCH_INTERVAL > 0:
+        _data_watch = asyncio.create_task(get_registry().watch(DATA_WATCH_INTERVAL))
+    log.info(f"📚 База знаний загружена (пул БД: {kb.pool.size if kb.pool else 0}, "
+             f"таблица дат: {'да' if kb.date_table is not None else 'нет'})")
     _tg_app = _build_telegram_app()
     if _tg_app and WEBHOOK_URL:
         await _tg_app.initialize()
         await _tg_app.start()
+        await _bot_state.start()
+        # Несколько воркеров — повтор webhook может прийти в соседний процесс
+        _tg_updates = UpdateQueue(_process_update,
+                                  shared=_bot_state if _worker_slot is not None else None)
+        await _tg_updates.start()
         full = f"{WEBHOOK_URL}{WEBHOOK_PATH}"
-        await _tg_app.bot.set_webhook(full)
-        log.info(f"🤖 Webhook установлен: {full}")
+        if _worker_slot in (None, 0):       # при нескольких воркерах — один раз
+            await _tg_app.bot.set_webhook(full)
+            log.info(f"🤖 Webhook установлен: {full}")
     elif _tg_app:
         log.warning("⚠️  WEBHOOK_URL не задан — добавьте в Render → Environment: WEBHOOK_URL=https://ВАШ-СЕРВИС.onrender.com")
 
 @app.on_event("shutdown")
 async def shutdown():
+    global _kb, _ai, _tg_updates, _bot_state, _writer, _data_watch
+    if _data_watch is not None:
+        _data_watch.cancel()
+        _data_watch = None
+    # Сначала дообработать очередь бота — пока открыты состояние диалогов и писатель базы
+    if _tg_updates is not None:
+        await _tg_updates.stop()
+        _tg_updates = None
+    if _bot_state is not None:
+        await _bot_state.stop()
+        _bot_state = None
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
     if _tg_app:
         await _tg_app.stop()
         await _tg_app.shutdown()
+    if _ai is not None:
+        await _ai.aclose()
+        _ai = None
+    if _kb is not None:
+        _kb.close()
+        _kb = None
 
 @app.post(WEBHOOK_PATH)
 async def telegram_webhook(request: Request):
-    if not _tg_app:
+    if not _tg_app or _tg_updates is None:
         return JSONResponse({"ok": False, "error": "bot not initialized"}, status_code=503)
     try:
-        from telegram import Update
-        update = Update.de_json(await request.json(), _tg_app.bot)
-        await _tg_app.process_update(update)
-        return JSONResponse({"ok": True})
+        data = await request.json()
     except Exception as e:
-        log.exception("Ошибка webhook")
-        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    # Обработка — в фоне (tg_queue): Telegram получает ответ сразу
+    status = await _tg_updates.submit(data)
+    if status == REJECTED:
+        return JSONResponse({"ok": False, "error": "queue full"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    return JSONResponse({"ok": True, "status": status})
+
+async def _process_update(data: dict):
+    from telegram import Update
+    await _tg_app.process_update(Update.de_json(data, _tg_app.bot))
 
 
+# ── HTTP-кэш и сжатие ─────────────────────────────────────────────
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+STATIC_CACHE_CONTROL = f"public, max-age={int(os.getenv('STATIC_MAX_AGE', '86400'))}"
+_RANGE_CHARS = re.compile(r"^\s*chars\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+def _accepted_encoding(request: Request) -> Optional[str]:
+    """br (если установлен brotli) или gzip — по Accept-Encoding клиента"""
+    accepted = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    for enc in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return None
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match совпадает с ETag (с любым суффиксом сжатия)"""
+    header = request.headers.get("if-none-match", "")
+    if header.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        if tag == base or tag in (f"{base}-gzip", f"{base}-br"):
+            return True
+    return False
+
+class PreparedBody:
+    """Тело ответа, закодированное и сжатое заранее (gzip, br), с сильным ETag"""
+    __slots__ = ("body", "etag", "encoded")
+
+    def __init__(self, payload):
+        self.body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.etag = '"%s"' % hashlib.sha256(self.body).hexdigest()[:32]
+        self.encoded = {}
+        if len(self.body) >= COMPRESS_MIN_SIZE:
+            self.encoded["gzip"] = gzip.compress(self.body, compresslevel=9)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(self.body, quality=11)
+
+def cached_response(request: Request, body: bytes, etag: str,
+                    media_type: str = "application/json",
+                    cache_control: str = "no-cache", status_code: int = 200,
+                    headers: Optional[dict] = None,
+                    encoded: Optional[dict] = None) -> Response:
+    """Ответ с сильным ETag: 304 на If-None-Match, иначе тело, сжатое br/gzip
+    (готовые варианты — из encoded, иначе сжимается сейчас).
+    У сжатого тела свой ETag (суффикс -br/-gzip), Vary: Accept-Encoding."""
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding", **(headers or {})}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+    enc = _accepted_encoding(request) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoded is not None:
+        enc = enc if enc in encoded else None
+        body = encoded[enc] if enc else body
+    elif enc == "br":
+        body = brotli.compress(body, quality=5)
+    elif enc == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    if enc:
+        headers["Content-Encoding"] = enc
+        etag = f'"{etag.strip(chr(34))}-{enc}"'
+    headers["ETag"] = etag
+    return Response(body, status_code=status_code, media_type=media_type, headers=headers)
+
+def static_response(request: Request, prepared: Optional[PreparedBody], missing: str) -> Response:
+    if prepared is None:
+        raise HTTPException(404, missing)
+    return cached_response(request, prepared.body, prepared.etag,
+                           cache_control=STATIC_CACHE_CONTROL, encoded=prepared.encoded)
+
 # ── Хелперы ───────────────────────────────────────────────────────
+class SnapshotBodies:
+    """Готовые тела справочных ответов по текущему снимку data_registry.
+    Собираются при первом запросе и заново — после перезагрузки данных."""
+
+    def __init__(self):
+        self._bodies = {}   # ключ → (версия снимка, PreparedBody | None)
+
+    def body(self, key, build) -> Optional[PreparedBody]:
+        """Готовое тело ответа build(снимок); None — build вернул None"""
+        snap = get_registry().current
+        hit = self._bodies.get(key)
+        if hit is None or hit[0] != snap.version:
+            payload = build(snap)
+            hit = (snap.version, PreparedBody(payload) if payload is not None else None)
+            self._bodies[key] = hit
+        return hit[1]
+
+    def drop(self, key):
+        """Собрать тело заново при следующем запросе"""
+        self._bodies.pop(key, None)
+
+    def file(self, name: str, key: str = "", build=lambda data: data) -> Optional[PreparedBody]:
+        """Тело build(данные data/<name>); None — нет файла или build вернул None"""
+        def from_file(snap):
+            data = snap.file(name)
+            return build(data) if data is not None else None
+        return self.body((name, key), from_file)
+
+_bodies = SnapshotBodies()
+
 def load_json(name):
-    p = DATA_DIR / name
-    if not p.exists():
-        return None
-    return json.loads(p.read_text(encoding="utf-8"))
+    """Данные data/<name> из текущего снимка реестра (общий объект — не изменять)"""
+    return get_registry().current.file(name)
+
+_kb = None
+_kb_lock = threading.Lock()
 
 def get_kb():
-    sys.path.insert(0, str(BASE_DIR))
-    from knowledge_base import HybridKnowledgeBase
-    return HybridKnowledgeBase()
+    """Общий на процесс HybridKnowledgeBase (создаётся один раз при старте)"""
+    global _kb
+    if _kb is None:
+        with _kb_lock:
+            if _kb is None:
+                sys.path.insert(0, str(BASE_DIR))
+                from knowledge_base import HybridKnowledgeBase
+                table = None
+                if DATE_TABLE:
+                    from date_table import DateTable
+                    table = DateTable.open(DATE_TABLE_PATH)
+                vectors = None
+                if VECTOR_SEARCH:
+                    from vectors import VectorIndex
+                    vectors = VectorIndex.open(DB_PATH, VECTOR_INDEX_PATH)
+                _kb = HybridKnowledgeBase(pool_size=DB_POOL_SIZE, date_table=table,
+                                          vectors=vectors)
+    return _kb
+
+_ai = None
+
+def get_ai():
+    """Общий на процесс AIConsultant (использует пул БД базы знаний)"""
+    global _ai
+    if _ai is None:
+        kb = get_kb()
+        with _kb_lock:
+            if _ai is None:
+                from ai_consultant import AI_MAX_CONCURRENCY, AIConsultant
+                from ai_scheduler import AIScheduler
+                # Воркеры serve.py делят один ключ API: каждому — 1/N лимитов провайдеров
+                n = serve.WEB_WORKERS if _worker_slot is not None else 1
+                _ai = AIConsultant(pool=kb.pool, vectors=kb.vectors,
+                                   scheduler=AIScheduler.from_env(share=n),
+                                   max_concurrency=max(1, AI_MAX_CONCURRENCY // n))
+    return _ai
+
+def preload():
+    """Загрузить в мастере до fork воркеров (serve.py): справочные данные,
+    таблицы, готовые тела справочных ответов — воркеры делят их copy-on-write"""
+    global _kb
+    if DB_PATH.exists():
+        import sqlite3
+        from kb_writer import prepare_database
+        conn = sqlite3.connect(str(DB_PATH))
+        prepare_database(conn)      # миграция — один раз, а не в каждом воркере
+        conn.close()
+    get_registry().reload(force=False)
+    if _kb is not None:
+        # Повторно (SIGHUP): векторы и таблица дат могли быть пересобраны — открыть заново
+        _kb.close()
+        _kb = None
+        _bodies.drop("dictionary")
+    kb = get_kb()
+    for name, key in (("formulas.json", "formulas"), ("practices.json", "practices")):
+        _bodies.file(name, build=_listing(key))
+    _bodies.file("number_meanings.json")
+    _bodies.body("dictionary", lambda snap: kb.get_dictionary())
+    # Соединения SQLite не переносятся через fork: воркер откроет свои
+    if kb.pool:
+        kb.pool.close()
+
+def after_fork(slot: int):
+    """В воркере сразу после fork"""
+    global _worker_slot
+    _worker_slot = slot
+    if _kb is not None and _kb.pool is not None:
+        _kb.pool.reopen()
 
 # ── API endpoints (все те же, что были в оригинале) ───────────────
 
@@ -297,6 +610,16 @@ def health():
         "version": "3.0.0",
         "telegram_bot": _tg_app is not None,
         "webhook_set": bool(WEBHOOK_URL and TELEGRAM_TOKEN),
+        "telegram_queue": _tg_updates.stats() if _tg_updates is not None else None,
+        "bot_state": _bot_state.stats() if _bot_state is not None else None,
+        # При WEB_WORKERS > 1 у каждого воркера свой писатель базы (запись
+        # сериализует SQLite) и своя доля лимитов AI (ai-status → limits_share)
+        "worker": {"slot": _worker_slot, "pid": os.getpid(),
+                   "workers": serve.WEB_WORKERS if _worker_slot is not None else 1,
+                   "memory_mb": serve.memory(os.getpid())},
+        "workers": serve.status() if _worker_slot is not None else None,
+        "writer": _writer.stats() if _writer is not None else None,
+        "data": get_registry().stats(),
     }
 
 @app.get("/api/stats", tags=["system"])
@@ -310,108 +633,266 @@ def stats_ep():
 def calculate(
     day: int = Query(..., ge=1, le=31), month: int = Query(..., ge=1, le=12),
     year: int = Query(..., ge=1900, le=2100), name: Optional[str] = Query(None),
+    compact: bool = Query(False, description="meaning_id/formula_id вместо текстов (см. /api/dictionary)"),
 ):
     try:
-        return get_kb().calculate_all(day, month, year, name)
+        result = get_kb().calculate_all(day, month, year, name)
+        if compact:
+            from knowledge_base import compact_result
+            return compact_result(result)
+        return result
     except Exception as e:
         raise HTTPException(500, str(e))
 
 class BulkItem(BaseModel):
     day: int; month: int; year: int; name: Optional[str] = None
 
+class BulkColumns(BaseModel):
+    day: List[int]; month: List[int]; year: List[int]
+    name: Optional[List[Optional[str]]] = None
+
 class BulkRequest(BaseModel):
-    clients: List[BulkItem]
+    clients: List[BulkItem] = []
+    columns: Optional[BulkColumns] = None
 
 @app.post("/api/bulk-calculate", tags=["calculator"])
-def bulk_calculate(req: BulkRequest):
-    if len(req.clients) > 50:
-        raise HTTPException(400, "Максимум 50 клиентов")
-    kb = get_kb()
-    results = []
-    for i, c in enumerate(req.clients):
-        try:
-            r = kb.calculate_all(c.day, c.month, c.year, c.name)
-            results.append({"index": i, "name": c.name, "success": True, **r})
-        except Exception as e:
-            results.append({"index": i, "name": c.name, "success": False, "error": str(e)})
+def bulk_calculate(req: BulkRequest, compact: bool = Query(False)):
+    from bulk_engine import BulkCalculator
+    if req.columns is not None:
+        c = req.columns
+        days, months, years, names = c.day, c.month, c.year, c.name
+        if not (len(days) == len(months) == len(years)) or (names is not None and len(names) != len(days)):
+            raise HTTPException(400, "Столбцы day/month/year/name должны быть одной длины")
+    else:
+        days   = [c.day for c in req.clients]
+        months = [c.month for c in req.clients]
+        years  = [c.year for c in req.clients]
+        names  = [c.name for c in req.clients]
+    if len(days) > BULK_MAX_CLIENTS:
+        raise HTTPException(400, f"Максимум {BULK_MAX_CLIENTS} клиентов")
+    results = BulkCalculator(get_kb()).calculate_rows(days, months, years, names,
+                                                      compact=compact)
     return {"results": results, "total": len(results)}
 
+@app.post("/api/bulk-calculate/stream", tags=["calculator"])
+async def bulk_calculate_stream(request: Request,
+                                format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                                compact: bool = Query(False)):
+    """Потоковый расчёт: тело — JSONL или CSV (Content-Type: text/csv),
+    ответ — по строке на клиента, отдаётся по мере расчёта пачками"""
+    from bulk_engine import BulkCalculator, ClientReader, csv_header, format_row
+    ctype = request.headers.get("content-type", "")
+    reader = ClientReader("csv" if "csv" in ctype else "jsonl")
+    calc = BulkCalculator(get_kb())
+
+    def render(records, start):
+        return "".join(format_row(r, format, compact) for r in calc.iter_records(records, start))
+
+    async def body():
+        if format == "csv":
+            yield csv_header()
+        buf, records, index = b"", [], 0
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                rec = reader.feed(line.decode("utf-8", errors="replace"))
+                if rec is not None:
+                    records.append(rec)
+            if len(records) >= BULK_STREAM_CHUNK:
+                yield await run_in_threadpool(render, records, index)
+                index += len(records)
+                records = []
+        rec = reader.feed(buf.decode("utf-8", errors="replace"))
+        if rec is not None:
+            records.append(rec)
+        if records:
+            yield await run_in_threadpool(render, records, index)
+
+    media = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    return DuplexStreamingResponse(body(), media_type=media)
+
 @app.get("/api/search", tags=["knowledge"])
 def search_ep(q: str = Query(..., min_length=2), limit: int = Query(10, ge=1, le=50),
-              category: Optional[str] = Query(None)):
+              category: Optional[str] = Query(None),
+              fuzzy: Optional[bool] = Query(None, description="нечёткий поиск: по умолчанию — если точный пуст"),
+              hybrid: Optional[bool] = Query(None, description="bm25 + векторы (RRF): по умолчанию — если индекс векторов загружен")):
     try:
-        results = get_kb().search_documents(q, limit=limit, category=category)
-        return {"query": q, "results": results, "total": len(results)}
+        kb = get_kb()
+        results = kb.search_documents(q, limit=limit, category=category, fuzzy=fuzzy,
+                                      hybrid=hybrid)
+        return {"query": q, "category": category, "results": results, "total": len(results),
+                "fuzzy": any(r.get("fuzzy") for r in results),
+                "hybrid": kb.vectors is not None and hybrid is not False,
+                "facets": kb.category_counts(q)}
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.get("/api/categories", tags=["knowledge"])
+def categories_ep(q: Optional[str] = Query(None, min_length=2)):
+    """Категории с числом документов (для запроса q — среди найденных)"""
+    counts = get_kb().category_counts(q)
+    return {"categories": list(counts), "counts": counts}
+
 @app.get("/api/document/{doc_id}", tags=["knowledge"])
-def get_document(doc_id: int):
+@app.get("/api/documents/{doc_id}", include_in_schema=False)
+def get_document(doc_id: int, request: Request,
+                 offset: int = Query(0, ge=0, description="с какого символа"),
+                 limit: Optional[int] = Query(None, ge=1, description="сколько символов"),
+                 passage: Optional[int] = Query(None, ge=0, description="номер фрагмента (индекс passages)"),
+                 passages: int = Query(1, ge=1, le=50, description="сколько фрагментов")):
+    """Текст документа целиком или частью: ?offset=&limit= (символы),
+    ?passage=&passages= (фрагменты) или заголовок Range: chars=0-9999.
+    Сильный ETag по хешу текста и диапазону, 304, сжатие br/gzip."""
+    status, extra = 200, {}
+    m = _RANGE_CHARS.match(request.headers.get("range", ""))
+    if m and passage is None and (m.group(1) or m.group(2)):
+        first, last = m.group(1), m.group(2)
+        if first:
+            offset = int(first)
+            limit = int(last) - offset + 1 if last else None
+        else:
+            offset, limit = -int(last), None   # последние N символов
+        if limit is not None and limit < 1:
+            raise HTTPException(416, "Неверный диапазон")
+        status = 206
     try:
-        content = get_kb().get_document_content(doc_id)
-        if content is None:
-            raise HTTPException(404, "Документ не найден")
-        return {"id": doc_id, "content": content}
-    except HTTPException:
-        raise
+        doc = get_kb().get_document_range(doc_id, offset, limit, passage, passages)
+    except ValueError as e:
+        raise HTTPException(416, str(e))
     except Exception as e:
         raise HTTPException(500, str(e))
+    if doc is None:
+        raise HTTPException(404, "Документ не найден")
+    if status == 206:
+        if doc["offset"] >= doc["total_length"] > 0:
+            raise HTTPException(416, "Диапазон за концом документа",
+                                headers={"Content-Range": f"chars */{doc['total_length']}"})
+        extra["Content-Range"] = f"chars {doc['offset']}-{max(doc['offset'], doc['end'] - 1)}/{doc['total_length']}"
+    etag = f'"{doc.pop("content_hash")[:20]}.{doc["offset"]}-{doc["end"]}"'
+    body = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+    return cached_response(request, body, etag, status_code=status, headers=extra)
+
+@app.get("/api/dictionary", tags=["knowledge"])
+def get_dictionary(request: Request):
+    return static_response(request, _bodies.body("dictionary", lambda snap: get_kb().get_dictionary()),
+                           "Справочник недоступен")
+
+def _listing(key: str):
+    return lambda data: {key: data, "total": len(data) if isinstance(data, list) else 0}
 
 @app.get("/api/formulas", tags=["knowledge"])
-def get_formulas():
-    data = load_json("formulas.json")
-    if data is None:
-        raise HTTPException(404, "formulas.json не найден")
-    return {"formulas": data, "total": len(data) if isinstance(data, list) else 0}
+def get_formulas(request: Request):
+    return static_response(request, _bodies.file("formulas.json", build=_listing("formulas")),
+                           "formulas.json не найден")
+
+@app.get("/api/formulas/{formula_id}/calculate", tags=["calculator"])
+def calculate_formula(formula_id: str, request: Request):
+    """Любая формула с formula_code; входы — query-параметры по полю inputs"""
+    from formula_engine import FormulaError
+    f = get_kb().formula_engine.get(formula_id)
+    if f is None:
+        raise HTTPException(404, f"Формула {formula_id} не найдена или не вычисляется")
+    try:
+        return {"id": formula_id, "inputs": dict(request.query_params),
+                "value": f(**request.query_params)}
+    except FormulaError as e:
+        raise HTTPException(400, str(e))
+
+class FormulaBatchRequest(BaseModel):
+    columns: dict
+
+@app.post("/api/formulas/{formula_id}/batch", tags=["calculator"])
+def calculate_formula_batch(formula_id: str, req: FormulaBatchRequest):
+    from formula_engine import FormulaError
+    f = get_kb().formula_engine.get(formula_id)
+    if f is None:
+        raise HTTPException(404, f"Формула {formula_id} не найдена или не вычисляется")
+    n = max((len(v) for v in req.columns.values() if isinstance(v, list)), default=0)
+    if n > BULK_MAX_CLIENTS:
+        raise HTTPException(400, f"Максимум {BULK_MAX_CLIENTS} строк")
+    try:
+        values = f.batch(**req.columns)
+    except FormulaError as e:
+        raise HTTPException(400, str(e))
+    results = [{"index": i, "success": False, "error": str(v)} if isinstance(v, FormulaError)
+               else {"index": i, "success": True, "value": v} for i, v in enumerate(values)]
+    return {"id": formula_id, "results": results, "total": len(results)}
 
 @app.get("/api/number-meanings", tags=["knowledge"])
-def get_number_meanings():
-    data = load_json("number_meanings.json")
-    if data is None:
-        raise HTTPException(404, "number_meanings.json не найден")
-    return data
+def get_number_meanings(request: Request):
+    return static_response(request, _bodies.file("number_meanings.json"),
+                           "number_meanings.json не найден")
 
 @app.get("/api/number-meanings/{number}", tags=["knowledge"])
-def get_number_meaning(number: int):
+def get_number_meaning(number: int, request: Request):
     data = load_json("number_meanings.json")
     if data is None or not isinstance(data, dict):
         raise HTTPException(404, "Файл не найден")
-    m = data.get(str(number))
-    if m is None:
+    # В кэш — только числа из файла: иначе любой /api/number-meanings/{n} добавлял бы запись
+    if str(number) not in data:
         raise HTTPException(404, f"Число {number} не найдено")
-    return m
+    return static_response(
+        request,
+        _bodies.file("number_meanings.json", str(number), lambda d: d.get(str(number))),
+        f"Число {number} не найдено")
 
 @app.get("/api/practices", tags=["knowledge"])
-def get_practices():
-    data = load_json("practices.json")
-    if data is None:
-        raise HTTPException(404, "practices.json не найден")
-    return {"practices": data, "total": len(data) if isinstance(data, list) else 0}
+def get_practices(request: Request):
+    return static_response(request, _bodies.file("practices.json", build=_listing("practices")),
+                           "practices.json не найден")
+
+def _sse(data: dict, event: str = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
 class AskRequest(BaseModel):
     question: str
     user_data: Optional[dict] = None
+    priority: str = "interactive"   # "batch" — в очередь за интерактивными
 
 @app.post("/api/ask", tags=["ai"])
-def ask_ai_ep(req: AskRequest):
+async def ask_ai_ep(req: AskRequest):
     if not req.question.strip():
         raise HTTPException(400, "Вопрос не может быть пустым")
     try:
-        from ai_consultant import AIConsultant
-        return AIConsultant().ask(req.question, user_data=req.user_data)
+        ai = await run_in_threadpool(get_ai)
+        return await ai.ask_async(req.question, user_data=req.user_data,
+                                  priority=req.priority)
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.post("/api/ask/stream", tags=["ai"])
+async def ask_ai_stream_ep(req: AskRequest):
+    """Тот же ответ, что /api/ask, но потоком Server-Sent Events:
+    data: {"delta": "..."} по мере генерации, в конце event: done"""
+    if not req.question.strip():
+        raise HTTPException(400, "Вопрос не может быть пустым")
+    ai = await run_in_threadpool(get_ai)
+
+    async def events():
+        try:
+            async for chunk in ai.ask_stream(req.question, user_data=req.user_data,
+                                             priority=req.priority):
+                yield _sse(chunk, "done" if chunk.get("done") else None)
+        except Exception as e:
+            yield _sse({"done": True, "status": "error", "error": str(e)}, "done")
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/api/ai-status", tags=["ai"])
 def ai_status():
-    from ai_consultant import get_ai_provider
-    pname, _ = get_ai_provider()
+    ai = get_ai()
+    pname = ai.active_provider()
     return {
         "provider": pname,
         "status": {"gemini":"✅ Google Gemini Flash","groq":"✅ Groq Llama 3.1",
                    "local":"⚠️ Локальный режим"}.get(pname, "unknown"),
         "gemini_key_set": bool(os.getenv("GEMINI_API_KEY")),
         "groq_key_set":   bool(os.getenv("GROQ_API_KEY")),
+        "cache": ai.cache.stats() if ai.cache else None,
+        "scheduler": ai.scheduler.stats(),
     }
 
 @app.get("/api/export", tags=["calculator"])
@@ -444,25 +925,67 @@ class KBAddRequest(BaseModel):
     category: Optional[str] = "general"
     tags: Optional[List[str]] = []
 
-@app.post("/api/knowledge/add", tags=["knowledge"])
-def add_knowledge(req: KBAddRequest):
-    import sqlite3 as sq
-    if not DB_PATH.exists():
+class KBBulkAddRequest(BaseModel):
+    documents: List[KBAddRequest]
+
+def _kb_doc(req: KBAddRequest) -> dict:
+    return {"title": req.title, "content": req.content,
+            "category": req.category, "tags": req.tags}
+
+def _require_writer():
+    if _writer is None:
         raise HTTPException(503, "База данных недоступна")
+    return _writer
+
+@app.post("/api/knowledge/add", tags=["knowledge"])
+async def add_knowledge(req: KBAddRequest):
+    writer = _require_writer()
     try:
-        conn = sq.connect(str(DB_PATH))
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO documents (filename,title,content,doc_type,categories,content_length) VALUES (?,?,?,?,?,?)",
-            (f"manual_{req.title[:30].replace(' ','_')}.txt", req.title, req.content,
-             req.category, json.dumps(req.tags, ensure_ascii=False), len(req.content))
-        )
-        doc_id = cur.lastrowid
-        conn.commit(); conn.close()
-        return {"status": "ok", "doc_id": doc_id, "title": req.title}
+        ids = await writer.add([_kb_doc(req)])
+        return {"status": "ok", "doc_id": ids[0], "title": req.title}
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.post("/api/knowledge/bulk-add", tags=["knowledge"])
+async def bulk_add_knowledge(req: KBBulkAddRequest):
+    """Добавить много документов: одна-две транзакции вместо запроса на каждый"""
+    writer = _require_writer()
+    if not req.documents:
+        raise HTTPException(400, "Нет документов")
+    if len(req.documents) > KB_BULK_MAX:
+        raise HTTPException(400, f"Максимум {KB_BULK_MAX} документов")
+    try:
+        ids = await writer.add([_kb_doc(d) for d in req.documents])
+        return {"status": "ok", "added": len(ids), "doc_ids": ids}
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+# ── Администрирование ─────────────────────────────────────────────
+def _require_admin(request: Request):
+    """Authorization: Bearer <ADMIN_TOKEN>; без ADMIN_TOKEN эндпоинты выключены"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "ADMIN_TOKEN не задан")
+    token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(401, "Неверный токен")
+
+@app.post("/api/admin/reload", tags=["system"])
+def reload_data(request: Request):
+    """Перечитать formulas.json, number_meanings.json, practices.json … и подменить
+    справочные данные; запросы, которые уже выполняются, дорабатывают со старыми.
+    При WEB_WORKERS > 1 данные перечитывает этот воркер (заодно проверка файлов),
+    остальные получают их через SIGHUP мастеру — плавный перезапуск по одному"""
+    _require_admin(request)
+    registry = get_registry()
+    try:
+        registry.reload()
+    except Exception as e:
+        raise HTTPException(422, f"Данные не перезагружены: {e}")
+    restarting = _worker_slot is not None
+    if restarting:
+        os.kill(os.getppid(), signal.SIGHUP)
+    return {"status": "ok", "workers_restarting": restarting, **registry.stats()}
+
 # ── Статика ───────────────────────────────────────────────────────
 if APP_DIR.exists():
     app.mount("/", StaticFiles(directory=str(APP_DIR), html=True), name="app")
@@ -476,7 +999,10 @@ if __name__ == "__main__":
     log.info(f"🚀 http://localhost:{PORT}")
     log.info(f"📚 http://localhost:{PORT}/docs")
     log.info("💡 Для бота на Render задайте WEBHOOK_URL=https://ВАШ-СЕРВИС.onrender.com")
-    import threading, time
+    if serve.WEB_WORKERS > 1 and hasattr(os, "fork"):
+        # Продакшен: данные загружаются один раз, воркеры — fork мастера
+        serve.run(app, HOST, PORT, serve.WEB_WORKERS, preload=preload, after_fork=after_fork)
+        sys.exit(0)
     def _open():
         time.sleep(1.5); webbrowser.open(f"http://localhost:{PORT}")
     threading.Thread(target=_open, daemon=True).start()
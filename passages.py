@@ -0,0 +1,220 @@
+"""
+ИНДЕКС ФРАГМЕНТОВ — поиск для RAG по кусочкам документов, а не целиком
+
+Документы режутся на пересекающиеся фрагменты (~PASSAGE_CHARS символов,
+перекрытие PASSAGE_OVERLAP) по границам абзацев и предложений. У каждого
+фрагмента — ссылка на документ и смещения start/end в его тексте, отдельная
+FTS5-таблица passages_fts. Индекс строится при сборке базы
+(processor/build_db_from_ocr.py) или отдельно для готовой базы:
+
+  python passages.py [путь к knowledge_base.db]
+
+select_passages() отбирает лучшие фрагменты в пределах бюджета токенов,
+склеивая пересекающиеся фрагменты одного документа без повторов.
+"""
+
+import os
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from text_search import FTS_PREFIX, match_query
+
+DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+
+PASSAGE_CHARS   = int(os.getenv("PASSAGE_CHARS", "1200"))
+PASSAGE_OVERLAP = int(os.getenv("PASSAGE_OVERLAP", "200"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "3000"))
+CHARS_PER_TOKEN = 4
+
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS passages (
+        id      INTEGER PRIMARY KEY,
+        doc_id  INTEGER NOT NULL,
+        seq     INTEGER NOT NULL,
+        start   INTEGER NOT NULL,
+        end     INTEGER NOT NULL,
+        content TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS passages_doc ON passages(doc_id, seq);
+    CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+        content,
+        content='passages',
+        content_rowid='id',
+        tokenize='unicode61',
+        prefix='{FTS_PREFIX}'
+    );
+    CREATE TRIGGER IF NOT EXISTS passages_fts_ai AFTER INSERT ON passages BEGIN
+        INSERT INTO passages_fts(rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS passages_fts_ad AFTER DELETE ON passages BEGIN
+        INSERT INTO passages_fts(passages_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END;
+"""
+
+_BREAKS = ("\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ")
+
+
+# ── Нарезка ──────────────────────────────────────────────────────
+def _cut(text: str, lo: int, hi: int) -> int:
+    """Лучшая граница в text[lo:hi]: абзац > строка > предложение > слово"""
+    for sep in _BREAKS:
+        pos = text.rfind(sep, lo, hi)
+        if pos != -1:
+            return pos + len(sep)
+    return hi
+
+
+def _resume(text: str, lo: int, hi: int) -> int:
+    """Начало следующего фрагмента: первая граница в text[lo:hi]"""
+    for sep in _BREAKS:
+        pos = text.find(sep, lo, hi)
+        if pos != -1:
+            return pos + len(sep)
+    return lo
+
+
+def split_passages(text: str, size: int = PASSAGE_CHARS,
+                   overlap: int = PASSAGE_OVERLAP) -> List[Tuple[int, int]]:
+    """Смещения (start, end) фрагментов; соседние пересекаются на ~overlap"""
+    n = len(text)
+    spans = []
+    start = 0
+    while start < n:
+        end = n if n - start <= size else _cut(text, start + size // 2, start + size)
+        spans.append((start, end))
+        if end >= n:
+            break
+        # Следующий фрагмент начинается с границы внутри перекрытия
+        nxt = _resume(text, max(start + 1, end - overlap), end)
+        start = nxt if start < nxt < end else end
+    return spans
+
+
+def build_passages(conn: sqlite3.Connection, doc_ids: Optional[Iterable[int]] = None,
+                   size: int = PASSAGE_CHARS, overlap: int = PASSAGE_OVERLAP) -> int:
+    """(Пере)собрать фрагменты документов (всех или doc_ids); вернуть их число.
+
+    passages_fts обновляют триггеры, поэтому для doc_ids меняются только
+    строки этих документов (удалённых из documents — просто убираются),
+    а транзакцию завершает вызывающий. Полная сборка делает commit."""
+    if doc_ids is not None and has_index(conn):
+        ids = list(doc_ids)
+        marks = ",".join("?" * len(ids))
+        conn.execute(f"DELETE FROM passages WHERE doc_id IN ({marks})", ids)
+        rows = conn.execute(f"SELECT id, content FROM documents WHERE id IN ({marks})",
+                            ids).fetchall()
+        full = False
+    else:
+        conn.executescript("DROP TABLE IF EXISTS passages_fts; DROP TABLE IF EXISTS passages;"
+                           + SCHEMA)
+        rows = conn.execute("SELECT id, content FROM documents").fetchall()
+        full = True
+    batch = []
+    for doc_id, content in rows:
+        content = content or ""
+        for seq, (s, e) in enumerate(split_passages(content, size, overlap)):
+            batch.append((doc_id, seq, s, e, content[s:e]))
+    conn.executemany("INSERT INTO passages (doc_id, seq, start, end, content) "
+                     "VALUES (?, ?, ?, ?, ?)", batch)
+    if full:
+        conn.commit()
+    return len(batch)
+
+
+# ── Поиск ────────────────────────────────────────────────────────
+def has_index(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='passages_fts'").fetchone() is not None
+
+
+def search_passages(conn: sqlite3.Connection, query: str, limit: int = 40,
+                    match: Optional[str] = None) -> List[Dict]:
+    """Фрагменты по релевантности (bm25), с названием документа;
+    match — готовый запрос FTS5 вместо query (например, нечёткий)"""
+    match = match or match_query(query, mode="any")
+    if not match:
+        return []
+    rows = conn.execute("""
+        SELECT p.id, p.doc_id, p.start, p.end, p.content, d.title
+        FROM passages_fts f
+        JOIN passages p ON p.id = f.rowid
+        JOIN documents d ON d.id = p.doc_id
+        WHERE passages_fts MATCH ? ORDER BY rank LIMIT ?
+    """, (match, limit)).fetchall()
+    return [{"id": r[0], "doc_id": r[1], "start": r[2], "end": r[3],
+             "content": r[4], "title": r[5]} for r in rows]
+
+
+def get_passages(conn: sqlite3.Connection, ids: List[int]) -> List[Dict]:
+    """Фрагменты по id (в том же порядке), в формате search_passages"""
+    if not ids:
+        return []
+    rows = conn.execute(f"""
+        SELECT p.id, p.doc_id, p.start, p.end, p.content, d.title
+        FROM passages p JOIN documents d ON d.id = p.doc_id
+        WHERE p.id IN ({",".join("?" * len(ids))})
+    """, list(ids)).fetchall()
+    found = {r[0]: {"id": r[0], "doc_id": r[1], "start": r[2], "end": r[3],
+                    "content": r[4], "title": r[5]} for r in rows}
+    return [found[i] for i in ids if i in found]
+
+
+def select_passages(passages: List[Dict], budget_tokens: int = RAG_CONTEXT_TOKENS) -> List[Dict]:
+    """Лучшие фрагменты в пределах бюджета, сгруппированные по документам.
+
+    Пересекающиеся и соседние фрагменты одного документа склеиваются в один
+    отрывок; в бюджет идут только новые символы. Документы — в порядке
+    лучшего фрагмента, отрывки внутри документа — в порядке текста."""
+    budget = budget_tokens * CHARS_PER_TOKEN
+    spans: Dict[int, List[Dict]] = {}
+    titles, order = {}, []
+    used = 0
+    for p in passages:
+        doc_spans = spans.setdefault(p["doc_id"], [])
+        covered = sum(max(0, min(p["end"], s["end"]) - max(p["start"], s["start"]))
+                      for s in doc_spans)
+        new = (p["end"] - p["start"]) - covered
+        if new <= 0:
+            continue
+        if used + new > budget:
+            if used:
+                continue
+            # Даже первый фрагмент не влезает — берём его начало
+            p = {**p, "end": p["start"] + budget, "content": p["content"][:budget]}
+            new = budget
+        if p["doc_id"] not in titles:
+            titles[p["doc_id"]] = p["title"]
+            order.append(p["doc_id"])
+        doc_spans.append({"start": p["start"], "end": p["end"], "content": p["content"]})
+        used += new
+
+    out = []
+    for doc_id in order:
+        merged: List[Dict] = []
+        for s in sorted(spans[doc_id], key=lambda s: s["start"]):
+            last = merged[-1] if merged else None
+            if last and s["start"] <= last["end"]:
+                if s["end"] > last["end"]:
+                    last["content"] += s["content"][last["end"] - s["start"]:]
+                    last["end"] = s["end"]
+            else:
+                merged.append(dict(s))
+        out.append({"doc_id": doc_id, "title": titles[doc_id],
+                    "excerpts": [m["content"] for m in merged]})
+    return out
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not path.exists():
+        print(f"❌ База не найдена: {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(str(path))
+    n = build_passages(conn)
+    docs = conn.execute("SELECT COUNT(DISTINCT doc_id) FROM passages").fetchone()[0]
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ Индекс фрагментов: {n} фрагментов из {docs} документов ({path})")
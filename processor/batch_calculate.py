@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Пакетный расчёт calculate_all для больших файлов клиентов (офлайн, без HTTP).
+
+Использование:
+    python processor/batch_calculate.py clients.csv results.jsonl
+    python processor/batch_calculate.py clients.jsonl results.csv --workers 8 --resume
+
+Вход: CSV (заголовок day,month,year[,name] или столбцы в этом порядке) или JSONL.
+Выход: JSONL (полный результат calculate_all) или CSV (значения показателей) —
+формат определяется по расширению или флагами --input-format / --output-format.
+
+Файл делится на пачки, пачки считаются в ProcessPoolExecutor на всех ядрах
+и пишутся строго в порядке входа. С --resume уже записанные строки
+пропускаются, и расчёт продолжается с места остановки.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from bulk_engine import BulkCalculator, ClientReader, csv_header, format_row
+
+_calc = None
+
+
+def _init_worker(date_table_path: str = None):
+    global _calc
+    from knowledge_base import HybridKnowledgeBase
+    table = None
+    if date_table_path:
+        from date_table import DateTable
+        table = DateTable.load(date_table_path)
+    _calc = BulkCalculator(HybridKnowledgeBase(pool_size=1, date_table=table))
+
+
+def _process_chunk(records, start: int, fmt: str, current_year: int,
+                   compact: bool = False) -> str:
+    return "".join(format_row(r, fmt, compact)
+                   for r in _calc.iter_records(records, start, current_year))
+
+
+def detect_format(path: Path, override: str = None) -> str:
+    if override:
+        return override
+    return "csv" if path.suffix.lower() == ".csv" else "jsonl"
+
+
+def count_done(out_path: Path, fmt: str) -> int:
+    """Сколько строк результата уже записано; обрезает недописанную строку"""
+    if not out_path.exists() or out_path.stat().st_size == 0:
+        return 0
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+        lines = data[:end].count(b"\n")
+    return max(0, lines - 1) if fmt == "csv" else lines
+
+
+def iter_records(in_path: Path, fmt: str):
+    reader = ClientReader(fmt)
+    with open(in_path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for line in f:
+            rec = reader.feed(line)
+            if rec is not None:
+                yield rec
+
+
+def iter_chunks(records, size: int, skip: int):
+    records = islice(records, skip, None)
+    start = skip
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def run(in_path: Path, out_path: Path, in_fmt: str, out_fmt: str, workers: int,
+        chunk_size: int, resume: bool, current_year: int = None, date_table: Path = None,
+        compact: bool = False):
+    skip = count_done(out_path, out_fmt) if resume else 0
+    current_year = current_year or date.today().year
+    if skip:
+        print(f"↻ Продолжаем: уже записано {skip} строк")
+    wire_fmt = "csv" if out_fmt == "csv" else "ndjson"
+
+    print(f"Вход:  {in_path} ({in_fmt})")
+    print(f"Выход: {out_path} ({out_fmt})")
+    print(f"Процессов: {workers}, пачка: {chunk_size}")
+    if date_table:
+        from date_table import DateTable
+        if DateTable.open(date_table) is None:
+            date_table = None
+        else:
+            print(f"Таблица дат: {date_table}")
+    print()
+
+    done = 0
+    t0 = time.perf_counter()
+    with open(out_path, "a" if skip else "w", encoding="utf-8", newline="") as out, \
+         ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(str(date_table) if date_table else None,)) as pool:
+        if not skip and out_fmt == "csv":
+            out.write(csv_header())
+        pending = []
+        chunks = iter_chunks(iter_records(in_path, in_fmt), chunk_size, skip)
+        for start, chunk in chunks:
+            pending.append((len(chunk), pool.submit(_process_chunk, chunk, start,
+                                                    wire_fmt, current_year, compact)))
+            # Держим в работе не больше 2 пачек на процесс
+            while len(pending) >= workers * 2:
+                done += _flush(out, pending.pop(0))
+                _progress(skip + done, done, t0)
+        while pending:
+            done += _flush(out, pending.pop(0))
+            _progress(skip + done, done, t0)
+
+    elapsed = time.perf_counter() - t0
+    rate = done / elapsed if elapsed else 0.0
+    print()
+    print(f"✅ Обработано: {done} строк за {elapsed:.1f} с ({rate:,.0f} строк/с)")
+    if skip:
+        print(f"   Всего в файле: {skip + done}")
+
+
+def _flush(out, item) -> int:
+    n, future = item
+    out.write(future.result())
+    out.flush()
+    return n
+
+
+def _progress(total: int, done: int, t0: float):
+    elapsed = time.perf_counter() - t0
+    rate = done / elapsed if elapsed else 0.0
+    print(f"\r  … {total} строк ({rate:,.0f} строк/с)", end="", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Пакетный расчёт нумерологии по файлу клиентов")
+    ap.add_argument("input", type=Path, help="CSV или JSONL с клиентами")
+    ap.add_argument("output", type=Path, help="CSV или JSONL для результатов")
+    ap.add_argument("--input-format", choices=["csv", "jsonl"])
+    ap.add_argument("--output-format", choices=["csv", "jsonl"])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=5000, help="строк в пачке")
+    ap.add_argument("--resume", action="store_true", help="продолжить недописанный файл")
+    ap.add_argument("--year", type=int, default=None, help="год для личного года (по умолчанию текущий)")
+    ap.add_argument("--date-table", type=Path, default=None,
+                    help="файл таблицы дат (.npy); собирается, если его нет")
+    ap.add_argument("--compact", action="store_true",
+                    help="JSONL: meaning_id/formula_id вместо текстов")
+    args = ap.parse_args(argv)
+
+    if not args.input.exists():
+        print(f"❌ Файл не найден: {args.input}")
+        sys.exit(1)
+    run(args.input, args.output,
+        detect_format(args.input, args.input_format),
+        detect_format(args.output, args.output_format),
+        max(1, args.workers), max(1, args.chunk), args.resume, args.year, args.date_table,
+        args.compact)
+
+
+if __name__ == "__main__":
+    main()
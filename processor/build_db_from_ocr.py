@@ -4,19 +4,67 @@
 
 Использование:
     python processor/build_db_from_ocr.py [путь к папке ocr_results]
+    python processor/build_db_from_ocr.py ocr_results --full --workers 8
 
 По умолчанию ищет папку ../ocr_results/ рядом со скриптом.
+
+Если база уже есть, загрузка инкрементальная: файлы читаются и чистятся
+параллельно (ProcessPoolExecutor), по хешу текста (content_hash) отбираются
+только новые и изменённые, и они пишутся одной транзакцией через executemany —
+в documents_fts и passages_fts меняются только их строки. Поиск по базе всё
+это время работает. --prune удаляет документы, файлов которых больше нет;
+--full пересобирает базу с нуля.
 """
 
-import sqlite3, json, re, sys
+import argparse, os, sqlite3, json, re, sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional
 
 BASE_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+from fuzzy import build_fuzzy_index
+from kb_writer import content_hash, prepare_database
+from passages import build_passages
+from text_search import documents_fts_schema
+from vectors import VectorIndex, np
+
 DATA_DIR = BASE_DIR / "data"
 DB_PATH  = DATA_DIR / "knowledge_base.db"
 
-OCR_DIR  = Path(sys.argv[1]) if len(sys.argv) > 1 else BASE_DIR.parent / "ocr_results"
+OCR_DIR  = BASE_DIR.parent / "ocr_results"
+
+SCHEMA = """
+    DROP TABLE IF EXISTS terms_trgm;
+    DROP TABLE IF EXISTS terms;
+    DROP TABLE IF EXISTS passages_fts;
+    DROP TABLE IF EXISTS passages;
+    DROP TABLE IF EXISTS documents_fts;
+    DROP TABLE IF EXISTS category_index;
+    DROP TABLE IF EXISTS documents;
+
+    CREATE TABLE documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        title TEXT NOT NULL,
+        doc_type TEXT DEFAULT 'txt',
+        categories TEXT DEFAULT '[]',
+        content TEXT NOT NULL,
+        content_length INTEGER DEFAULT 0,
+        extraction_method TEXT DEFAULT 'ocr_txt',
+        extracted_at TEXT,
+        content_hash TEXT
+    );
+
+    CREATE TABLE category_index (
+        category TEXT NOT NULL,
+        doc_id INTEGER NOT NULL
+    );
+    CREATE INDEX category_index_cat ON category_index(category, doc_id);
+    CREATE INDEX category_index_doc ON category_index(doc_id, category);
+"""
 
 TITLE_OVERRIDES = {
     'да нет':       'Алгоритм подбора схемы проработки',
@@ -61,7 +109,56 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\n{4,}', '\n\n\n', text)
     return '\n'.join(l.rstrip() for l in text.split('\n')).strip()
 
-def build_db(ocr_dir: Path, db_path: Path):
+def load_file(path: str) -> Dict:
+    """Прочитать и разобрать один файл (выполняется в процессе-воркере)"""
+    fpath = Path(path)
+    try:
+        text = clean_text(fpath.read_bytes().decode('utf-8', errors='replace'))
+        title = extract_title(text)
+        return {"filename": fpath.name, "title": title,
+                "category": detect_category(title, text),
+                "content": text, "hash": content_hash(text)}
+    except Exception as e:
+        return {"filename": fpath.name, "error": str(e)}
+
+def read_files(txt_files: List[Path], workers: int) -> List[Dict]:
+    """Все файлы, прочитанные параллельно; ошибки печатаются и пропускаются"""
+    paths = [str(p) for p in txt_files]
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            docs = list(pool.map(load_file, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        docs = [load_file(p) for p in paths]
+    for d in docs:
+        if "error" in d:
+            print(f"  ❌ {d['filename']}: {d['error']}")
+    return [d for d in docs if "error" not in d]
+
+def _doc_row(d: Dict, now: str) -> tuple:
+    return (d["title"], json.dumps([d["category"]]), d["content"], len(d["content"]),
+            d["hash"], now)
+
+def _finish(conn: sqlite3.Connection, db_path: Path) -> str:
+    """Производные индексы по всей базе: словарь нечёткого поиска и векторы.
+    Вызывается, только если документы изменились (update_db выходит раньше)"""
+    n_terms = build_fuzzy_index(conn)
+    # Векторы фрагментов для гибридного поиска — рядом с базой (нужен NumPy)
+    if np is None:
+        return f"{n_terms} слов в нечётком индексе, векторов нет (NumPy не установлен)"
+    path = db_path.parent / "vectors_v1"
+    if VectorIndex.up_to_date(conn, path):
+        return f"{n_terms} слов в нечётком индексе, векторы не изменились"
+    return f"{n_terms} слов в нечётком индексе, {len(VectorIndex.build(conn, path))} векторов"
+
+def _print_categories(docs: List[Dict]):
+    from collections import Counter
+    cats = Counter(d["category"] for d in docs)
+    print(f"   Категории:")
+    for cat, cnt in sorted(cats.items(), key=lambda x: -x[1]):
+        print(f"     {cat}: {cnt}")
+
+def build_db(ocr_dir: Path, db_path: Path, workers: int = 1):
+    """Пересобрать базу с нуля"""
     txt_files = sorted(ocr_dir.glob("*.txt"))
     if not txt_files:
         print(f"❌ TXT файлы не найдены в {ocr_dir}")
@@ -71,77 +168,132 @@ def build_db(ocr_dir: Path, db_path: Path):
     print(f"База данных: {db_path}")
     print()
 
+    docs = read_files(txt_files, workers)
+    now = datetime.now().isoformat()
+
     conn = sqlite3.connect(str(db_path))
-    cur = conn.cursor()
-
-    cur.executescript("""
-        DROP TABLE IF EXISTS documents_fts;
-        DROP TABLE IF EXISTS category_index;
-        DROP TABLE IF EXISTS documents;
-
-        CREATE TABLE documents (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            title TEXT NOT NULL,
-            doc_type TEXT DEFAULT 'txt',
-            categories TEXT DEFAULT '[]',
-            content TEXT NOT NULL,
-            content_length INTEGER DEFAULT 0,
-            extraction_method TEXT DEFAULT 'ocr_txt',
-            extracted_at TEXT
-        );
-
-        CREATE TABLE category_index (
-            category TEXT NOT NULL,
-            doc_id INTEGER NOT NULL
-        );
-
-        CREATE VIRTUAL TABLE documents_fts USING fts5(
-            filename, title, content,
-            content='documents',
-            content_rowid='id',
-            tokenize='unicode61'
-        );
-    """)
-    conn.commit()
+    conn.executescript(SCHEMA + documents_fts_schema())
+    prepare_database(conn)
+    with conn:
+        conn.executemany("""
+            INSERT INTO documents (filename, title, doc_type, categories, content, content_length, content_hash, extraction_method, extracted_at)
+            VALUES (?, ?, 'txt', ?, ?, ?, ?, 'ocr_txt', ?)
+        """, [(d["filename"], *_doc_row(d, now)) for d in docs])
+        # documents_fts заполняют триггеры (text_search.DOCUMENTS_FTS_TRIGGERS)
+        conn.execute("INSERT INTO category_index SELECT json_extract(categories, '$[0]'), id FROM documents")
+    n_passages = build_passages(conn)
+    derived = _finish(conn, db_path)
+    conn.close()
+
+    print(f"✅ Загружено: {len(docs)} документов ({n_passages} фрагментов для AI, {derived})")
+    _print_categories(docs)
+
+def update_db(ocr_dir: Path, db_path: Path, workers: int = 1, prune: bool = False):
+    """Загрузить только новые и изменённые файлы (по хешу текста)"""
+    txt_files = sorted(ocr_dir.glob("*.txt"))
+    if not txt_files:
+        print(f"❌ TXT файлы не найдены в {ocr_dir}")
+        return
+
+    print(f"Найдено txt файлов: {len(txt_files)}")
+    print(f"База данных: {db_path} (инкрементально)")
+    print()
+
+    docs = read_files(txt_files, workers)
+    conn = sqlite3.connect(str(db_path))
+    # База, собранная раньше: WAL, content_hash, триггеры FTS
+    prepare_database(conn)
+
+    existing: Dict[str, list] = {}
+    for doc_id, fname, h in conn.execute(
+            "SELECT id, filename, content_hash FROM documents "
+            "WHERE extraction_method = 'ocr_txt' ORDER BY id"):
+        existing.setdefault(fname, []).append((doc_id, h))
+
+    new, changed, unchanged = [], [], 0
+    for d in docs:
+        rows = existing.get(d["filename"], [])
+        if any(h == d["hash"] for _, h in rows):
+            unchanged += 1
+        elif rows:
+            changed.append((rows[0][0], d))
+        else:
+            new.append(d)
+    seen = {d["filename"] for d in docs}
+    removed = [doc_id for fname, rows in existing.items() if fname not in seen
+               for doc_id, _ in rows] if prune else []
+
+    print(f"   новых: {len(new)}, изменённых: {len(changed)}, "
+          f"без изменений: {unchanged}, удаляется: {len(removed)}")
+    if not (new or changed or removed):
+        conn.close()
+        print("✅ База актуальна")
+        return
 
     now = datetime.now().isoformat()
-    loaded = 0
-    from collections import Counter
-    cats = Counter()
-
-    for fpath in txt_files:
-        try:
-            raw = fpath.read_bytes()
-            text = raw.decode('utf-8', errors='replace')
-            text = clean_text(text)
-            title = extract_title(text)
-            cat = detect_category(title, text)
-            cats[cat] += 1
-
-            cur.execute("""
-                INSERT INTO documents (filename, title, doc_type, categories, content, content_length, extraction_method, extracted_at)
-                VALUES (?, ?, 'txt', ?, ?, ?, 'ocr_txt', ?)
-            """, (fpath.name, title, json.dumps([cat]), text, len(text), now))
-            
-            cur.execute("INSERT INTO category_index VALUES (?, ?)", (cat, cur.lastrowid))
-            loaded += 1
-        except Exception as e:
-            print(f"  ❌ {fpath.name}: {e}")
-
-    conn.commit()
-    cur.execute("INSERT INTO documents_fts(documents_fts) VALUES('rebuild')")
-    conn.commit()
+    old_ids = [doc_id for doc_id, _ in changed] + removed
+    with conn:
+        # Сервер может писать в базу одновременно: блокировка записи до MAX(id),
+        # чтобы id новых строк шли подряд после max_id
+        conn.execute("BEGIN IMMEDIATE")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM documents").fetchone()[0]
+        # documents_fts и passages_fts обновляют триггеры — только затронутые строки
+        if old_ids:
+            marks = ",".join("?" * len(old_ids))
+            conn.execute(f"DELETE FROM category_index WHERE doc_id IN ({marks})", old_ids)
+        if removed:
+            conn.execute(f"DELETE FROM documents WHERE id IN ({','.join('?' * len(removed))})",
+                         removed)
+        conn.executemany("""
+            UPDATE documents SET title = ?, categories = ?, content = ?, content_length = ?,
+                                 content_hash = ?, extracted_at = ?
+            WHERE id = ?
+        """, [(*_doc_row(d, now), doc_id) for doc_id, d in changed])
+        conn.executemany("""
+            INSERT INTO documents (filename, title, doc_type, categories, content, content_length, content_hash, extraction_method, extracted_at)
+            VALUES (?, ?, 'txt', ?, ?, ?, ?, 'ocr_txt', ?)
+        """, [(d["filename"], *_doc_row(d, now)) for d in new])
+        new_ids = [r[0] for r in conn.execute("SELECT id FROM documents WHERE id > ?", (max_id,))]
+
+        affected = [doc_id for doc_id, _ in changed] + new_ids
+        if affected:
+            marks = ",".join("?" * len(affected))
+            conn.execute(f"INSERT INTO category_index SELECT json_extract(categories, '$[0]'), id "
+                         f"FROM documents WHERE id IN ({marks})", affected)
+        n_passages = build_passages(conn, affected + removed)
+    derived = _finish(conn, db_path)
     conn.close()
 
-    print(f"✅ Загружено: {loaded} документов")
-    print(f"   Категории:")
-    for cat, cnt in sorted(cats.items(), key=lambda x: -x[1]):
-        print(f"     {cat}: {cnt}")
+    print(f"✅ Обновлено: {len(new) + len(changed)} документов, удалено: {len(removed)} "
+          f"({n_passages} фрагментов для AI, {derived})")
+    _print_categories(new + [d for _, d in changed])
 
-if __name__ == "__main__":
-    if not OCR_DIR.exists():
-        print(f"❌ Папка ocr_results не найдена: {OCR_DIR}")
+def _has_documents(db_path: Path) -> bool:
+    if not db_path.exists():
+        return False
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name='documents_fts'").fetchone() is not None
+    finally:
+        conn.close()
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Загрузка OCR txt файлов в базу знаний")
+    ap.add_argument("ocr_dir", type=Path, nargs="?", default=OCR_DIR, help="папка с txt файлами")
+    ap.add_argument("--db", type=Path, default=DB_PATH, help="путь к knowledge_base.db")
+    ap.add_argument("--full", action="store_true", help="пересобрать базу с нуля")
+    ap.add_argument("--prune", action="store_true", help="удалить документы без файлов")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args(argv)
+
+    if not args.ocr_dir.exists():
+        print(f"❌ Папка ocr_results не найдена: {args.ocr_dir}")
         print(f"   Использование: python {__file__} /путь/к/ocr_results")
         sys.exit(1)
-    build_db(OCR_DIR, DB_PATH)
+    if args.full or not _has_documents(args.db):
+        build_db(args.ocr_dir, args.db, args.workers)
+    else:
+        update_db(args.ocr_dir, args.db, args.workers, prune=args.prune)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+НЕСКОЛЬКО ВОРКЕРОВ — предзагрузка в мастере и fork (copy-on-write)
+
+uvicorn.run(workers=N) запускает воркеры заново (spawn): каждый сам читает
+JSON, компилирует формулы, открывает таблицу дат и векторы. Здесь иначе:
+  - мастер открывает сокет и выполняет preload() — справочные данные,
+    таблицы, готовые ответы загружаются один раз;
+  - N воркеров создаются через os.fork() и делят эти страницы памяти с
+    мастером (copy-on-write); after_fork(slot) в воркере открывает свои
+    соединения SQLite (соединения нельзя переносить через fork);
+  - каждый воркер — uvicorn.Server на общем сокете;
+  - упавший воркер перезапускается; SIGHUP — плавный перезапуск по одному
+    (новый воркер, затем SIGTERM старому — он дорабатывает запросы);
+    SIGTERM/SIGINT — остановка с ожиданием GRACEFUL_TIMEOUT;
+  - память воркеров (RSS, PSS, общая и собственная) раз в
+    WORKER_CHECK_INTERVAL секунд пишется в файл состояния; воркер, чья
+    собственная память больше WORKER_MAX_MEMORY_MB, плавно перезапускается.
+
+Только там, где есть os.fork (Linux, macOS); иначе — один процесс.
+
+Пример:
+  serve.run(app, "0.0.0.0", 8000, workers=4, preload=preload, after_fork=after_fork)
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+WEB_WORKERS           = int(os.getenv("WEB_WORKERS", "1"))
+GRACEFUL_TIMEOUT      = float(os.getenv("GRACEFUL_TIMEOUT", "30"))     # сек на дообработку
+WORKER_MAX_MEMORY_MB  = float(os.getenv("WORKER_MAX_MEMORY_MB", "0"))  # 0 — без ограничения
+WORKER_CHECK_INTERVAL = float(os.getenv("WORKER_CHECK_INTERVAL", "10"))
+SERVE_STATUS_PATH     = Path(os.getenv("SERVE_STATUS_PATH",
+                                       str(Path(__file__).parent / "data" / "serve_status.json")))
+RESPAWN_DELAY = 1.0     # сек: воркер, упавший сразу после старта, — не чаще
+REPLACE_DELAY = 1.0     # сек между заменами при плавном перезапуске
+
+
+def memory(pid: int) -> Dict[str, float]:
+    """Память процесса, МБ: rss, pss (с долей общих страниц), shared, private.
+    Пусто, если /proc недоступен."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return {"rss": round(int(line.split()[1]) / 1024, 1)}
+        except OSError:
+            pass
+        return {}
+    mb = lambda *keys: round(sum(fields.get(k, 0) for k in keys) / 1024, 1)
+    return {"rss": mb("Rss"), "pss": mb("Pss"),
+            "shared": mb("Shared_Clean", "Shared_Dirty"),
+            "private": mb("Private_Clean", "Private_Dirty")}
+
+
+def status() -> Optional[Dict]:
+    """Состояние мастера и воркеров из файла состояния (None — один процесс)"""
+    try:
+        return json.loads(SERVE_STATUS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+class Master:
+    """Мастер-процесс: fork воркеров, перезапуски, контроль памяти"""
+
+    def __init__(self, app, sock: socket.socket, workers: int,
+                 preload: Optional[Callable[[], None]] = None,
+                 after_fork: Optional[Callable[[int], None]] = None,
+                 graceful_timeout: float = GRACEFUL_TIMEOUT,
+                 max_memory_mb: float = WORKER_MAX_MEMORY_MB,
+                 check_interval: float = WORKER_CHECK_INTERVAL, log_level: str = "info"):
+        self.app = app
+        self.sock = sock
+        self.size = max(1, workers)
+        self.preload = preload
+        self.after_fork = after_fork
+        self.graceful_timeout = graceful_timeout
+        self.max_memory_mb = max_memory_mb
+        self.check_interval = check_interval
+        self.log_level = log_level
+        self.workers: Dict[int, Dict] = {}      # pid → {slot, started, retiring}
+        self.restarts = 0
+        self._stopping = False
+        self._reload = False
+        self._to_replace: List[int] = []    # плавный перезапуск: ещё не заменённые
+        self._next_replace = 0.0
+
+    # ── Воркеры ──────────────────────────────────────────────────
+    def spawn(self, slot: int) -> int:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._worker(slot)          # не возвращается
+        self.workers[pid] = {"slot": slot, "started": time.time(), "retiring": False}
+        return pid
+
+    def _worker(self, slot: int):
+        import uvicorn
+        code = 0
+        try:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            if self.after_fork:
+                self.after_fork(slot)
+            config = uvicorn.Config(self.app, log_level=self.log_level,
+                                    timeout_graceful_shutdown=self.graceful_timeout)
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"⚠ Воркер {slot} остановлен с ошибкой: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _retire(self, pid: int):
+        """Плавно остановить воркера: SIGTERM, он дорабатывает текущие запросы"""
+        info = self.workers.get(pid)
+        if info and not info["retiring"]:
+            info["retiring"] = True
+            info["retire_at"] = time.time()
+            self._kill(pid, signal.SIGTERM)
+
+    def _replace(self, pid: int):
+        """Запустить замену и остановить старого (сокет общий — простоя нет)"""
+        self.spawn(self.workers[pid]["slot"])
+        self.restarts += 1
+        self._retire(pid)
+
+    @staticmethod
+    def _kill(pid: int, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            info = self.workers.pop(pid, None)
+            if info is None or info["retiring"] or self._stopping:
+                continue
+            # Воркер упал — новый на его место
+            print(f"⚠ Воркер {info['slot']} (pid {pid}) завершился — перезапуск")
+            if time.time() - info["started"] < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            self.spawn(info["slot"])
+            self.restarts += 1
+
+    # ── Контроль ─────────────────────────────────────────────────
+    def _check(self):
+        report = []
+        for pid, info in list(self.workers.items()):
+            mem = memory(pid)
+            report.append({"slot": info["slot"], "pid": pid, "started": round(info["started"]),
+                           "retiring": info["retiring"], "memory_mb": mem})
+            if (self.max_memory_mb and not info["retiring"]
+                    and mem.get("private", mem.get("rss", 0)) > self.max_memory_mb):
+                print(f"♻ Воркер {info['slot']} занял {mem} МБ — плавный перезапуск")
+                self._replace(pid)
+            # Не успел доработать за graceful_timeout — останавливаем
+            if info["retiring"] and time.time() - info["retire_at"] > self.graceful_timeout + 5:
+                self._kill(pid, signal.SIGKILL)
+        state = {"master": os.getpid(), "workers_configured": self.size,
+                 "master_memory_mb": memory(os.getpid()), "restarts": self.restarts,
+                 "graceful_timeout": self.graceful_timeout,
+                 "max_memory_mb": self.max_memory_mb or None,
+                 "updated": round(time.time()),
+                 "workers": sorted(report, key=lambda w: (w["slot"], w["retiring"]))}
+        try:
+            tmp = SERVE_STATUS_PATH.with_suffix(".tmp")
+            tmp.write_text(json.dumps(state), encoding="utf-8")
+            tmp.replace(SERVE_STATUS_PATH)
+        except OSError:
+            pass
+
+    def _rolling_restart(self):
+        """SIGHUP: обновить данные мастера и заменить воркеров по одному"""
+        if self.preload:
+            try:
+                self.preload()  # новые воркеры получат обновлённые данные
+            except Exception as e:
+                print(f"⚠ Перезагрузка отменена, воркеры работают со старыми данными: {e}")
+                return
+        self._to_replace = [p for p, info in self.workers.items() if not info["retiring"]]
+        self._next_replace = 0.0
+
+    def _replace_next(self):
+        """Следующая замена из плавного перезапуска — не чаще REPLACE_DELAY,
+        чтобы замена успела подняться (главный цикл при этом не ждёт)"""
+        while self._to_replace and time.monotonic() >= self._next_replace:
+            pid = self._to_replace.pop(0)
+            info = self.workers.get(pid)
+            if info is None or info["retiring"]:
+                continue        # уже завершился — _reap запустил нового
+            self._replace(pid)
+            self._next_replace = time.monotonic() + REPLACE_DELAY
+
+    def run(self):
+        if self.preload:
+            self.preload()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        for slot in range(self.size):
+            self.spawn(slot)
+        print(f"🚀 Мастер {os.getpid()}: воркеров {self.size}")
+        next_check = 0.0
+        while not self._stopping:
+            self._reap()
+            if self._reload:
+                self._reload = False
+                self._rolling_restart()
+            self._replace_next()
+            if time.monotonic() >= next_check:
+                self._check()
+                next_check = time.monotonic() + self.check_interval
+            time.sleep(0.2)
+        self._shutdown()
+
+    def _on_stop(self, sig, frame):
+        self._stopping = True
+
+    def _on_reload(self, sig, frame):
+        self._reload = True
+
+    def _shutdown(self):
+        for pid in list(self.workers):
+            self._kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in self.workers:
+            self._kill(pid, signal.SIGKILL)
+        try:
+            SERVE_STATUS_PATH.unlink()
+        except OSError:
+            pass
+
+
+def run(app, host: str, port: int, workers: int = WEB_WORKERS,
+        preload: Optional[Callable[[], None]] = None,
+        after_fork: Optional[Callable[[int], None]] = None, **kwargs):
+    """Запустить мастер с workers воркерами на host:port"""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    Master(app, sock, workers, preload=preload, after_fork=after_fork, **kwargs).run()
@@ -0,0 +1,274 @@
+"""
+ПОИСК ПО-РУССКИ — стемминг и перевод запросов в синтаксис FTS5
+
+FTS5 в SQLite не знает русской морфологии, а свой токенайзер из Python
+не подключить. Поэтому:
+  - таблицы FTS строятся с префиксным индексом (prefix=FTS_PREFIX);
+  - запрос пользователя разбирается здесь: слова приводятся к основе
+    облегчённым стеммером Портера (Snowball) для русского, стоп-слова
+    отбрасываются, и каждое слово становится префиксным запросом:
+    «кармы» → "карм"*, «кармический» → ("кармическ"* OR "карм"*).
+
+Результат match_query() — всегда корректный запрос FTS5, поэтому
+запасной поиск через LIKE по всему тексту больше не нужен.
+
+Перестроить FTS-таблицы готовой базы с префиксным индексом:
+  python text_search.py [путь к knowledge_base.db]
+"""
+
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List
+
+DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+
+# Длины префиксов, для которых FTS5 держит отдельный индекс
+FTS_PREFIX = "2 3 4 5"
+
+# Основа короче — ищем слово целиком; корень короче — не добавляем
+STEM_MIN = 3
+ROOT_MIN = 3
+
+STOP_WORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всего всех вы
+где да даже для до его ее её если есть еще ещё же за здесь и из или им их к как
+какая какие каким какой ко когда кто ли либо мне может мы на над надо наш не
+него нее неё нет ни них но ну о об однако он она они оно от очень по под при
+про с со так также такой там те тем то того тоже той только том ты у уже хотя
+чего чей чем что чтобы чье чья эта эти это этого этой этом я
+означает значит значение такое
+""".split())
+
+_VOWELS = "аеиоуыэюя"
+_TOKEN = re.compile(r'"([^"]*)"|(?:(?<!\S)(-))?(\w+)', re.UNICODE)
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# ── Стеммер (Snowball, русский) ──────────────────────────────────
+_PERFECTIVE_GERUND = (("в", "вши", "вшись"),
+                      ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"))
+_ADJECTIVE = ((), ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем",
+                   "им", "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю",
+                   "ая", "яя", "ою", "ею"))
+_PARTICIPLE = (("ем", "нн", "вш", "ющ", "щ"), ("ивш", "ывш", "ующ"))
+_REFLEXIVE = ((), ("ся", "сь"))
+_VERB = (("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют",
+          "ны", "ть", "ешь", "нно"),
+         ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+          "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+          "ены", "ить", "ыть", "ишь", "ую", "ю"))
+_NOUN = ((), ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и",
+              "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о",
+              "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я"))
+_SUPERLATIVE = ((), ("ейше", "ейш"))
+_DERIVATIONAL = ("ость", "ост")
+
+# Словообразовательные суффиксы основы: «кармическ» → «карм»
+_ROOT_SUFFIXES = ("ическ", "ичн", "еск", "ск", "ость", "ост", "ств", "тель",
+                  "ник", "изм", "ист", "ени", "ани", "ов", "ев")
+
+
+def _remove(rv: str, endings) -> str:
+    """Снять самое длинное окончание; группа 1 — только после «а»/«я»"""
+    after_a, plain = endings
+    best = ""
+    for e in plain:
+        if len(e) > len(best) and rv.endswith(e):
+            best = e
+    for e in after_a:
+        if (len(e) > len(best) and rv.endswith(e) and len(rv) > len(e)
+                and rv[-len(e) - 1] in "ая"):
+            best = e
+    return rv[:-len(best)] if best else None
+
+
+def _region(word: str, start: int = 0) -> int:
+    """Начало R1 (или R2 от start): после первой согласной, идущей за гласной"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+
+def stem(word: str) -> str:
+    word = word.lower().replace("ё", "е")
+    m = re.search(f"[{_VOWELS}]", word)
+    if not m:
+        return word
+    pre, rv = word[:m.end()], word[m.end():]
+
+    r = _remove(rv, _PERFECTIVE_GERUND)
+    if r is not None:
+        rv = r
+    else:
+        r = _remove(rv, _REFLEXIVE)
+        if r is not None:
+            rv = r
+        r = _remove(rv, _ADJECTIVE)
+        if r is not None:
+            rv = r
+            r = _remove(rv, _PARTICIPLE)
+            if r is not None:
+                rv = r
+        else:
+            r = _remove(rv, _VERB)
+            if r is None:
+                r = _remove(rv, _NOUN)
+            if r is not None:
+                rv = r
+
+    if rv.endswith("и"):
+        rv = rv[:-1]
+
+    full = pre + rv
+    r2 = _region(full, _region(full))
+    for e in _DERIVATIONAL:
+        if full.endswith(e) and len(full) - len(e) >= r2:
+            rv = rv[:-len(e)]
+            break
+
+    if rv.endswith("нн"):
+        rv = rv[:-1]
+    else:
+        r = _remove(rv, _SUPERLATIVE)
+        if r is not None:
+            rv = r[:-1] if r.endswith("нн") else r
+        elif rv.endswith("ь"):
+            rv = rv[:-1]
+    return pre + rv
+
+
+def root(stem_: str) -> str:
+    """Корень для расширения запроса (или сама основа)"""
+    for suffix in _ROOT_SUFFIXES:
+        if stem_.endswith(suffix) and len(stem_) - len(suffix) >= ROOT_MIN:
+            return stem_[:-len(suffix)]
+    return stem_
+
+
+# ── Запросы FTS5 ─────────────────────────────────────────────────
+def quote(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def term_query(word: str) -> str:
+    """Одно слово → выражение FTS5 с основой, корнем и вариантом без «ё»"""
+    word = word.lower()
+    if word.isdigit() or len(word) <= STEM_MIN:
+        forms = [quote(word)]
+    else:
+        s = stem(word)
+        if len(s) < STEM_MIN:
+            forms = [quote(word)]
+        else:
+            forms = [quote(s) + "*"]
+            r = root(s)
+            if r != s:
+                forms.append(quote(r) + "*")
+    if "ё" in word:
+        # unicode61 не сводит «ё» к «е» — ищем оба написания
+        forms.append(quote(word))
+    forms = list(dict.fromkeys(forms))
+    return forms[0] if len(forms) == 1 else "(" + " OR ".join(forms) + ")"
+
+
+def excluded(text: str) -> List[str]:
+    """Слова, исключённые из запроса (-слово)"""
+    return [word.lower() for _, minus, word in _TOKEN.findall(text) if minus]
+
+
+def keywords(text: str) -> List[str]:
+    """Значимые слова запроса, кроме -слов (без стоп-слов; если остались только они — все)"""
+    skip = set(excluded(text))
+    words = [w for w in _WORD.findall(text.lower())
+             if (len(w) > 1 or w.isdigit()) and w not in skip]
+    significant = [w for w in words if w not in STOP_WORDS]
+    return list(dict.fromkeys(significant or words))
+
+
+def match_query(text: str, mode: str = "all") -> str:
+    """Пользовательский ввод → корректный запрос FTS5 ("" — искать нечего).
+
+    Слова — через AND (mode="all") или OR (mode="any"); "фраза в кавычках"
+    ищется как фраза; -слово исключает документы со словом."""
+    include = []
+    for phrase, minus, word in _TOKEN.findall(text):
+        if phrase:
+            words = _WORD.findall(phrase.lower())
+            if words:
+                include.append(quote(" ".join(words)))
+        elif not minus and word.lower() not in STOP_WORDS and (len(word) > 1 or word.isdigit()):
+            include.append(term_query(word))
+    if not include:
+        # Запрос из одних стоп-слов — ищем их как есть
+        include = [term_query(w) for w in keywords(text)]
+    if not include:
+        return ""
+    return exclude((" AND " if mode == "all" else " OR ").join(include), text)
+
+
+def exclude(query: str, text: str) -> str:
+    """Дописать к выражению FTS5 исключения -слово из пользовательского ввода"""
+    words = excluded(text)
+    if not query or not words:
+        return query
+    return f"({query}) NOT " + " NOT ".join(term_query(w) for w in words)
+
+
+# ── Перестройка индексов ─────────────────────────────────────────
+# documents_fts — внешний контент: триггеры держат индекс в синхроне с documents
+DOCUMENTS_FTS_TRIGGERS = """
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts(rowid, filename, title, content)
+        VALUES (new.id, new.filename, new.title, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, title, content)
+        VALUES ('delete', old.id, old.filename, old.title, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE OF filename, title, content
+    ON documents BEGIN
+        INSERT INTO documents_fts(documents_fts, rowid, filename, title, content)
+        VALUES ('delete', old.id, old.filename, old.title, old.content);
+        INSERT INTO documents_fts(rowid, filename, title, content)
+        VALUES (new.id, new.filename, new.title, new.content);
+    END;
+"""
+
+
+def documents_fts_schema() -> str:
+    return f"""
+        CREATE VIRTUAL TABLE documents_fts USING fts5(
+            filename, title, content,
+            content='documents',
+            content_rowid='id',
+            tokenize='unicode61',
+            prefix='{FTS_PREFIX}'
+        );
+    """ + DOCUMENTS_FTS_TRIGGERS
+
+
+def reindex(conn: sqlite3.Connection):
+    """Пересоздать documents_fts (и passages_fts) с префиксным индексом,
+    а также словарь нечёткого поиска"""
+    from fuzzy import build_fuzzy_index
+    from passages import build_passages
+    conn.executescript("DROP TABLE IF EXISTS documents_fts;" + documents_fts_schema())
+    conn.execute("INSERT INTO documents_fts(documents_fts) VALUES('rebuild')")
+    conn.commit()
+    build_passages(conn)
+    build_fuzzy_index(conn)
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not path.exists():
+        print(f"❌ База не найдена: {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(str(path))
+    reindex(conn)
+    conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ FTS-индексы перестроены (prefix='{FTS_PREFIX}'): {path}")
@@ -0,0 +1,205 @@
+"""
+ОЧЕРЕДЬ ОБНОВЛЕНИЙ TELEGRAM — webhook отвечает сразу, обработка в фоне
+
+Telegram держит HTTP-запрос webhook открытым, пока обработчик не ответит,
+и повторяет его при таймауте — медленный поиск или AI приводили к
+повторной обработке. Теперь:
+  - webhook кладёт обновление в ограниченную очередь и сразу отвечает 200;
+  - N асинхронных обработчиков разбирают очередь; обновления одного чата
+    всегда попадают к одному обработчику — порядок сообщений в диалоге
+    (например, /calc → дата) сохраняется;
+  - повтор того же update_id (ретрай Telegram) отбрасывается; с shared
+    (например, BotStateStore.claim_update) — и тот, что пришёл в другой
+    процесс (WEB_WORKERS > 1);
+  - если очередь полна дольше TG_QUEUE_WAIT секунд, webhook отвечает 503 —
+    Telegram повторит доставку позже (backpressure);
+  - глубина очереди, задержка и отказы видны в stats().
+
+Очередь — своя в каждом процессе: порядок обновлений одного чата
+сохраняется внутри процесса, но при WEB_WORKERS > 1 два сообщения чата,
+принятые разными воркерами, обрабатываются независимо. Состояние диалога
+общее (bot_state), поэтому шаги /calc, разнесённые во времени, не теряются.
+
+Пример:
+  updates = UpdateQueue(handle)          # handle(data: dict) — корутина
+  await updates.start()
+  status = await updates.submit(await request.json())
+"""
+
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+TG_WORKERS    = int(os.getenv("TG_WORKERS", "4"))
+TG_QUEUE_SIZE = int(os.getenv("TG_QUEUE_SIZE", "1000"))     # обновлений на все обработчики
+TG_QUEUE_WAIT = float(os.getenv("TG_QUEUE_WAIT", "1.0"))    # сек ждать места до 503
+TG_DEDUP_SIZE = int(os.getenv("TG_DEDUP_SIZE", "10000"))    # помнить последних update_id
+TG_DRAIN_TIMEOUT = 10.0                                     # сек дообработки при остановке
+
+QUEUED, DUPLICATE, REJECTED = "queued", "duplicate", "rejected"
+
+
+def chat_key(data: Dict) -> int:
+    """Чат (или пользователь) обновления — для выбора обработчика"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        if "id" in (value.get("from") or {}):
+            return value["from"]["id"]
+    return data.get("update_id", 0)
+
+
+class UpdateQueue:
+    """Ограниченная очередь обновлений и пул обработчиков"""
+
+    def __init__(self, handle: Callable[[Dict], Awaitable[None]],
+                 workers: int = TG_WORKERS, max_queue: int = TG_QUEUE_SIZE,
+                 wait: float = TG_QUEUE_WAIT, dedup: int = TG_DEDUP_SIZE,
+                 shared=None):
+        self.handle = handle
+        # Общие для процессов отметки update_id: claim_update()/release_update()
+        self.shared = shared
+        self.workers = max(1, workers)
+        self.max_queue = max(self.workers, max_queue)
+        self.wait = wait
+        self.dedup = dedup
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self._seen: "OrderedDict[int, None]" = OrderedDict()
+        self._lags = deque(maxlen=200)      # последние задержки в очереди, сек
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    # ── Жизненный цикл ───────────────────────────────────────────
+    async def start(self):
+        if self._tasks:
+            return
+        size = self.max_queue // self.workers
+        self._queues = [asyncio.Queue(size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._run(q)) for q in self._queues]
+
+    async def stop(self, timeout: float = TG_DRAIN_TIMEOUT):
+        """Дообработать очередь (не дольше timeout) и остановить обработчики"""
+        if not self._tasks:
+            return
+
+        async def drain():
+            for q in self._queues:
+                await q.put(None)
+            await asyncio.gather(*self._tasks)
+
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            for task in self._tasks:
+                task.cancel()
+        self._tasks = []
+
+    # ── Приём ────────────────────────────────────────────────────
+    def _is_duplicate(self, update_id) -> bool:
+        if update_id is None:
+            return False
+        if update_id in self._seen:
+            self._seen.move_to_end(update_id)
+            return True
+        return False
+
+    def _remember(self, update_id):
+        if update_id is None:
+            return
+        self._seen[update_id] = None
+        if len(self._seen) > self.dedup:
+            self._seen.popitem(last=False)
+
+    async def _claim(self, update_id) -> bool:
+        if self.shared is None or update_id is None:
+            return True
+        try:
+            return await self.shared.claim_update(update_id)
+        except Exception as e:
+            # Лучше обработать повтор, чем потерять обновление
+            print(f"⚠ Отметка update {update_id} не записана: {e}")
+            return True
+
+    async def _release(self, update_id):
+        if self.shared is None or update_id is None:
+            return
+        try:
+            await self.shared.release_update(update_id)
+        except Exception as e:
+            print(f"⚠ Отметка update {update_id} не снята: {e}")
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def submit(self, data: Dict) -> str:
+        """Поставить обновление в очередь: QUEUED, DUPLICATE или REJECTED
+        (очередь полна — пусть Telegram повторит)"""
+        if not self._tasks:
+            raise RuntimeError("очередь обновлений не запущена")
+        self.received += 1
+        update_id = data.get("update_id")
+        if self._is_duplicate(update_id):
+            self.duplicates += 1
+            return DUPLICATE
+        # Запоминаем до ожидания места — повтор, пришедший за это время, тоже дубль
+        self._remember(update_id)
+        if not await self._claim(update_id):
+            self.duplicates += 1
+            return DUPLICATE
+        queue = self._queues[hash(chat_key(data)) % self.workers]
+        item = (time.monotonic(), data)
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(queue.put(item), self.wait)
+            except asyncio.TimeoutError:
+                # Отклонённое Telegram пришлёт снова — его нужно будет принять
+                self._seen.pop(update_id, None)
+                await self._release(update_id)
+                self.rejected += 1
+                return REJECTED
+        self.max_depth = max(self.max_depth, self.depth())
+        return QUEUED
+
+    # ── Обработка ────────────────────────────────────────────────
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            queued_at, data = item
+            self._lags.append(time.monotonic() - queued_at)
+            try:
+                await self.handle(data)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠ Ошибка обработки update {data.get('update_id')}: {e}")
+
+    def stats(self) -> Dict:
+        lags = list(self._lags)
+        return {
+            "running": bool(self._tasks),
+            "workers": self.workers,
+            "queue": self.depth(),
+            "max_queue": self.max_queue,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "lag_avg": round(sum(lags) / len(lags), 3) if lags else 0.0,
+            "lag_max": round(max(lags), 3) if lags else 0.0,
+        }
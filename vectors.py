@@ -0,0 +1,287 @@
+"""
+ВЕКТОРНЫЙ ПОИСК — локальные векторы фрагментов для гибридного поиска
+
+Без внешних сервисов и GPU: каждый фрагмент (таблица passages) — вектор
+LSA поверх TF-IDF основ слов (text_search.stem). Словарь — основы,
+встречающиеся хотя бы в VOCAB_MIN_DF фрагментах; по выборке фрагментов
+считается SVD (через матрицу Грама), и все фрагменты проецируются в
+VECTOR_DIM измерений. LSA ловит слова, которые встречаются вместе, —
+то, чего нет в bm25: документ находится и без точного совпадения слов.
+Незнакомые слова запроса (опечатки, чужие термины) просто не учитываются.
+
+Матрица векторов хранится в .npy и открывается через np.load(mmap_mode="r"),
+поиск — произведение матриц по блокам строк. Результаты сливаются с FTS5
+через reciprocal rank fusion (rrf()).
+
+Требует NumPy; без него поиск остаётся чисто полнотекстовым.
+Строится при сборке базы, при старте — если фрагменты изменились. Вручную:
+  python vectors.py [путь к knowledge_base.db]
+"""
+
+import json
+import os
+import re
+import sqlite3
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from text_search import STOP_WORDS, stem
+
+DATA_DIR = Path(__file__).parent / "data"
+DB_PATH  = DATA_DIR / "knowledge_base.db"
+DEFAULT_PATH = DATA_DIR / "vectors_v1"
+
+VERSION = 1
+VOCAB_MIN_DF = 2                                        # реже — слово не в словаре
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "128"))        # измерений LSA
+LSA_SAMPLE = int(os.getenv("LSA_SAMPLE", "2000"))       # фрагментов для SVD
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.2"))   # косинус ниже — шум
+SEARCH_BLOCK = 8192                                     # строк матрицы за одно умножение
+RRF_K = 60
+
+_WORD_MIN = 3
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# ── Признаки ─────────────────────────────────────────────────────
+def features(text: str) -> Counter:
+    """Основы значимых слов текста с частотами"""
+    return Counter(stem(w) for w in _WORD.findall(text.lower())
+                   if len(w) >= _WORD_MIN and not w.isdigit() and w not in STOP_WORDS)
+
+
+def _weights(bag: Counter, vocab: Dict[str, int], idf) -> Tuple["np.ndarray", "np.ndarray"]:
+    """(столбцы словаря, веса TF-IDF): сублинейная частота × idf"""
+    known = [(vocab[t], n) for t, n in bag.items() if t in vocab]
+    idx = np.array([c for c, _ in known], dtype=np.int64)
+    tf = np.array([n for _, n in known], dtype=np.float32)
+    return idx, (1.0 + np.log(tf)) * idf[idx]
+
+
+def _normalize(m):
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms > 0, norms, 1.0)
+
+
+def _signature(conn: sqlite3.Connection) -> List[int]:
+    """Отпечаток таблицы passages: векторы устарели, если он изменился"""
+    return list(conn.execute(
+        "SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(end - start), 0) FROM passages"
+    ).fetchone())
+
+
+def rrf(*rankings: Sequence[Hashable], k: int = RRF_K) -> Dict[Hashable, float]:
+    """Reciprocal rank fusion: {ключ: Σ 1/(k + место)} по нескольким ранжированиям"""
+    fused: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+class VectorIndex:
+    """Векторы фрагментов (только чтение)"""
+
+    def __init__(self, matrix, projection, idf, ids, vocab: List[str], signature: List[int]):
+        if (matrix.shape[0] != ids.shape[0] or len(idf) != len(vocab)
+                or projection.shape != (len(vocab), matrix.shape[1])):
+            raise ValueError(f"Неверная форма векторного индекса: {matrix.shape}")
+        self.matrix = matrix            # (фрагменты × VECTOR_DIM), строки нормированы
+        self.projection = projection    # (словарь × VECTOR_DIM)
+        self.idf = idf                  # (словарь,)
+        self.vocab = {t: i for i, t in enumerate(vocab)}
+        self.ids = ids                  # (фрагменты × 2): passage_id, doc_id
+        self.signature = signature
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    # ── Сборка / загрузка ────────────────────────────────────────
+    @classmethod
+    def compute(cls, conn: sqlite3.Connection, dim: int = VECTOR_DIM) -> "VectorIndex":
+        """Посчитать векторы всех фрагментов базы"""
+        rows = conn.execute("SELECT id, doc_id, content FROM passages ORDER BY id").fetchall()
+        if not rows:
+            raise ValueError("в базе нет фрагментов (passages.py)")
+        bags = [features(r[2]) for r in rows]
+        n = len(bags)
+
+        df = Counter(t for bag in bags for t in bag)
+        terms = sorted(t for t, d in df.items() if d >= VOCAB_MIN_DF)
+        vocab = {t: i for i, t in enumerate(terms)}
+        idf = np.array([np.log((1 + n) / (1 + df[t])) + 1.0 for t in terms], dtype=np.float32)
+
+        # SVD по выборке: X·Xᵀ = U·S²·Uᵀ, проекция Vᵀ = S⁻¹·Uᵀ·X
+        sample = np.unique(np.linspace(0, n - 1, min(n, LSA_SAMPLE)).astype(np.int64))
+        x = np.zeros((len(sample), len(terms)), dtype=np.float32)
+        for row, i in enumerate(sample):
+            idx, w = _weights(bags[i], vocab, idf)
+            x[row, idx] = w
+        x = _normalize(x)
+        vals, vecs = np.linalg.eigh((x @ x.T).astype(np.float64))
+        keep = np.argsort(vals)[::-1][:dim]
+        keep = keep[vals[keep] > 1e-6]
+        s = np.sqrt(vals[keep])
+        projection = np.ascontiguousarray(((vecs[:, keep].T @ x) / s[:, None]).T,
+                                          dtype=np.float32)
+
+        index = cls(np.zeros((n, len(keep)), dtype=np.float32), projection, idf,
+                    np.array([(r[0], r[1]) for r in rows], dtype=np.int64),
+                    terms, _signature(conn))
+        index.matrix = index._embed(bags)
+        return index
+
+    def save(self, path: Path = DEFAULT_PATH):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        # Свой временный файл у каждого процесса: воркеры могут собирать индекс одновременно
+        suffix = f".{os.getpid()}.tmp"
+        for name in ("matrix", "projection", "idf", "ids"):
+            tmp = path / f"{name}.npy{suffix}"
+            with open(tmp, "wb") as f:
+                np.save(f, getattr(self, name))
+            tmp.replace(path / f"{name}.npy")
+        # meta.json пишется последним: по нему load() узнаёт готовый индекс
+        tmp = path / f"meta.json{suffix}"
+        tmp.write_text(json.dumps({
+            "version": VERSION, "dim": self.matrix.shape[1], "passages": len(self),
+            "signature": self.signature, "vocab": sorted(self.vocab, key=self.vocab.get),
+        }, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path / "meta.json")
+
+    @classmethod
+    def build(cls, conn: sqlite3.Connection, path: Path = DEFAULT_PATH) -> "VectorIndex":
+        index = cls.compute(conn)
+        index.save(path)
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path: Path = DEFAULT_PATH) -> "VectorIndex":
+        path = Path(path)
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("version") != VERSION:
+            raise ValueError("другая версия формата")
+        return cls(np.load(str(path / "matrix.npy"), mmap_mode="r"),
+                   np.load(str(path / "projection.npy"), mmap_mode="r"),
+                   np.load(str(path / "idf.npy")),
+                   np.load(str(path / "ids.npy")),
+                   meta["vocab"], meta["signature"])
+
+    @staticmethod
+    def up_to_date(conn: sqlite3.Connection, path: Path = DEFAULT_PATH) -> bool:
+        """Собран ли индекс в path по нынешним фрагментам базы (читает только meta.json)"""
+        try:
+            meta = json.loads((Path(path) / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        return meta.get("version") == VERSION and meta.get("signature") == _signature(conn)
+
+    @classmethod
+    def open(cls, db_path: Path = DB_PATH, path: Path = DEFAULT_PATH) -> Optional["VectorIndex"]:
+        """Открыть индекс; если его нет или фрагменты базы изменились — собрать"""
+        if np is None:
+            print("⚠ NumPy не установлен — векторный поиск отключён")
+            return None
+        if not Path(db_path).exists():
+            return None
+        try:
+            conn = sqlite3.connect(Path(db_path).resolve().as_uri() + "?mode=ro", uri=True)
+        except sqlite3.Error:
+            return None
+        try:
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='passages'").fetchone():
+                print("⚠ В базе нет индекса фрагментов — векторный поиск отключён")
+                return None
+            current = _signature(conn)
+            path = Path(path)
+            if (path / "meta.json").exists():
+                try:
+                    index = cls.load(path)
+                    if index.signature == current:
+                        return index
+                    print("⚠ Векторный индекс устарел, пересобираю")
+                except Exception as e:
+                    print(f"⚠ Векторный индекс повреждён ({e}), пересобираю")
+            try:
+                return cls.build(conn, path)
+            except OSError:
+                # Нет прав на запись — держим индекс в памяти
+                return cls.compute(conn)
+        except Exception as e:
+            print(f"⚠ Векторный поиск отключён: {e}")
+            return None
+        finally:
+            conn.close()
+
+    # ── Поиск ────────────────────────────────────────────────────
+    def _embed(self, bags: Sequence[Counter]):
+        """Векторы текстов: сумма строк проекции по словам с весами TF-IDF"""
+        out = np.zeros((len(bags), self.projection.shape[1]), dtype=np.float32)
+        for i, bag in enumerate(bags):
+            idx, w = _weights(bag, self.vocab, self.idf)
+            if len(idx):
+                out[i] = w @ self.projection[idx]
+        return _normalize(out)
+
+    def embed(self, texts: Sequence[str]):
+        return self._embed([features(t) for t in texts])
+
+    def search_many(self, queries: Sequence[str], k: int = 40,
+                    min_score: float = VECTOR_MIN_SCORE) -> List[List[Tuple[int, int, float]]]:
+        """Лучшие фрагменты для каждого запроса: [[(passage_id, doc_id, косинус)]].
+
+        Все запросы умножаются на матрицу сразу, блоками по SEARCH_BLOCK строк:
+        в памяти — только блок и текущие k лучших на запрос."""
+        q = self.embed(queries)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for lo in range(0, len(self), SEARCH_BLOCK):
+            block = np.asarray(self.matrix[lo:lo + SEARCH_BLOCK]) @ q.T     # (блок × запросы)
+            scores = np.concatenate([best_scores, block.T], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(lo, lo + block.shape[0]), (len(queries), block.shape[0]))], axis=1)
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        out = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            out.append([(int(self.ids[r, 0]), int(self.ids[r, 1]), round(float(s), 6))
+                        for s, r in zip(scores[order], rows[order]) if s >= min_score])
+        return out
+
+    def search(self, query: str, k: int = 40) -> List[Tuple[int, int, float]]:
+        """Лучшие фрагменты: [(passage_id, doc_id, косинус)] по убыванию"""
+        return self.search_many([query], k)[0]
+
+    def search_docs(self, query: str, k: int = 20) -> List[Tuple[int, int, float]]:
+        """Лучшие документы по лучшему фрагменту: [(doc_id, passage_id, косинус)]"""
+        best: Dict[int, Tuple[int, int, float]] = {}
+        for pid, doc_id, score in self.search(query, k * 4):
+            best.setdefault(doc_id, (doc_id, pid, score))
+        return list(best.values())[:k]
+
+
+if __name__ == "__main__":
+    if np is None:
+        print("❌ Нужен NumPy: pip install numpy")
+        sys.exit(1)
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else DB_PATH
+    if not path.exists():
+        print(f"❌ База не найдена: {path}")
+        sys.exit(1)
+    conn = sqlite3.connect(str(path))
+    index = VectorIndex.build(conn, DEFAULT_PATH)
+    conn.close()
+    print(f"✅ Векторный индекс: {len(index)} фрагментов × {index.matrix.shape[1]} "
+          f"({DEFAULT_PATH})")